@@ -1,7 +1,5 @@
-import matplotlib.pyplot as plt
-import wavio
-
 from core.wave import SweepWave
+from core.wavfile import write_wav
 
 
 if __name__ == "__main__":
@@ -18,4 +16,4 @@ if __name__ == "__main__":
         sample_rate,
         dbfs
     )
-    wavio.write("sine_sweep.wav", w.audio, sample_rate, sampwidth=3)
+    write_wav("sine_sweep.wav", w.audio, sample_rate, sampwidth=3)
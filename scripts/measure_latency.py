@@ -1,13 +1,14 @@
 import matplotlib.pyplot as plt
 import numpy as np
-import wavio
 
+from core.wavfile import read_wav
 
-input_wav = wavio.read("inputs/v3_0_0_trimmed.wav")
-input_data = input_wav.data[:, 0] / np.max(np.abs(input_wav.data))
 
-output_wav = wavio.read("captures/2025-02-26-18-15-44/recording-instrument.wav")
-output_data = -1 * output_wav.data[:, 0] / np.max(np.abs(output_wav.data))
+input_wav, _ = read_wav("inputs/v3_0_0_trimmed.wav")
+input_data = input_wav[:, 0] / np.max(np.abs(input_wav))
+
+output_wav, _ = read_wav("captures/2025-02-26-18-15-44/recording-instrument.wav")
+output_data = -1 * output_wav[:, 0] / np.max(np.abs(output_wav))
 
 cross_corr = np.correlate(input_data, output_data, mode="full")
 delay = len(output_data) - np.argmax(cross_corr) - 1
@@ -1,4 +1,4 @@
-import wavio
+from core.wavfile import WavReader, write_wav
 
-reamp = wavio.read("inputs/v3_0_0.wav")
-wavio.write("v3_0_0_trim.wav", reamp.data[: reamp.rate * 10], reamp.rate, sampwidth=3)
+reamp = WavReader("inputs/v3_0_0.wav")
+write_wav("v3_0_0_trim.wav", reamp[: reamp.samplerate * 10], reamp.samplerate, sampwidth=3)
@@ -0,0 +1,4 @@
+if __name__ == "__main__":
+    from benchmarks.cli import main
+
+    main()
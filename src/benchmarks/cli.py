@@ -0,0 +1,125 @@
+from argparse import ArgumentParser
+import itertools
+import json
+import platform
+import sys
+
+import numpy as np
+
+from benchmarks.suite import BENCHMARKS
+
+
+DEFAULT_SAMPLERATES = [44100, 48000, 96000]  # Hz
+DEFAULT_BLOCKSIZES = [128, 512, 2048]  # frames
+DEFAULT_CHANNELS = [1, 2, 8]
+
+
+def _setup_parser() -> ArgumentParser:
+    parser = ArgumentParser(description="Forge benchmark suite")
+    parser.add_argument(
+        "--only",
+        type=str,
+        nargs="+",
+        choices=list(BENCHMARKS.keys()),
+        default=list(BENCHMARKS.keys()),
+        help="benchmarks to run",
+    )
+    parser.add_argument(
+        "--samplerates",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SAMPLERATES,
+        help="samplerates in Hz",
+    )
+    parser.add_argument(
+        "--blocksizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_BLOCKSIZES,
+        help="block sizes in frames",
+    )
+    parser.add_argument(
+        "--channels",
+        type=int,
+        nargs="+",
+        default=DEFAULT_CHANNELS,
+        help="return channel counts",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=50,
+        help="timed calls per configuration",
+    )
+    parser.add_argument(
+        "--heavy-repeat",
+        type=int,
+        default=5,
+        help="timed calls per configuration for whole file benchmarks",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=1.0,
+        help="fraction of the block duration the p99 callback time must fit in",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="path to write json results to",
+    )
+    return parser
+
+
+def _configurations(params: list[str], args) -> list[dict]:
+    values = {
+        "samplerate": args.samplerates if "samplerate" in params else args.samplerates[:1],
+        "blocksize": args.blocksizes if "blocksize" in params else args.blocksizes[:1],
+        "channels": args.channels if "channels" in params else args.channels[:1],
+    }
+    return [dict(zip(values.keys(), combination)) for combination in itertools.product(*values.values())]
+
+
+def main():
+    parser = _setup_parser()
+    args = parser.parse_args()
+
+    results = []
+    failures = 0
+    for name in args.only:
+        fn, params, heavy = BENCHMARKS[name]
+        repeat = args.heavy_repeat if heavy else args.repeat
+        for config in _configurations(params, args):
+            result = {"benchmark": name} | config | fn(config["samplerate"], config["blocksize"], config["channels"], repeat)
+
+            # the callback has to finish well inside the block it is producing to keep up in real time
+            msg = ""
+            if "budget_ms" in result:
+                result["passed"] = result["p99_ms"] <= result["budget_ms"] * args.budget
+                msg = f" budget {result['budget_ms']:8.3f} ms"
+            if "passed" in result:
+                msg += " ok" if result["passed"] else " FAIL"
+                if not result["passed"]:
+                    failures += 1
+
+            print(
+                f"{name:20s} sr={config['samplerate']:6d} bs={config['blocksize']:5d} ch={config['channels']:2d} "
+                f"median {result['median_ms']:9.3f} ms p99 {result['p99_ms']:9.3f} ms{msg}"
+            )
+            results.append(result)
+
+    if args.output is not None:
+        report = {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "budget": args.budget,
+            "results": results,
+        }
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=4)
+
+    if failures > 0:
+        print(f"{failures} benchmarks failed")
+        sys.exit(1)
@@ -0,0 +1,45 @@
+import json
+import subprocess
+import sys
+from time import perf_counter
+
+
+# modules that are slow to import and must only load in the subcommands that use them
+HEAVY_MODULES = ["sounddevice", "soundfile", "hid", "matplotlib", "requests", "wavio"]
+
+ENTRY_POINTS = [
+    "forge_cli.cli",
+    "capture.cli",
+    "interface.cli",
+    "calibration.cli",
+]
+
+_SCRIPT = """
+import json, sys
+from time import perf_counter
+start = perf_counter()
+import {module}
+print(json.dumps({{"seconds": perf_counter() - start, "modules": sorted(sys.modules)}}))
+"""
+
+
+# import each entry point in a fresh interpreter and report its import time and any heavy modules it pulled in
+def check_imports(modules: list[str] = ENTRY_POINTS) -> dict:
+    results = {}
+    for module in modules:
+        start = perf_counter()
+        process = subprocess.run(
+            [sys.executable, "-c", _SCRIPT.format(module=module)],
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode != 0:
+            results[module] = {"error": process.stderr.strip().splitlines()[-1]}
+            continue
+        output = json.loads(process.stdout.strip().splitlines()[-1])
+        results[module] = {
+            "import_ms": output["seconds"] * 1000,
+            "interpreter_ms": (perf_counter() - start) * 1000,
+            "heavy_modules": [name for name in HEAVY_MODULES if name in output["modules"]],
+        }
+    return results
@@ -0,0 +1,282 @@
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import tempfile
+import threading
+
+import numpy as np
+
+from benchmarks.imports import check_imports
+from benchmarks.timer import measure
+
+
+def _random_audio(frames: int, channels: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(-(2**22), 2**22, (frames, channels)).astype(np.int32)
+
+
+def _virtual_interface(blocksize: int, num_sends: int, num_returns: int, dtype: str = "int24"):
+    from core.interface import AudioInterface
+
+    return AudioInterface(
+        {
+            "backend": "virtual",
+            "virtual": {"speed": 0},
+            "device": None,
+            "blocksize": blocksize,
+            "dtype": dtype,
+            "send_channel": num_sends,
+            "return_channels": num_returns,
+            "send_level_dbu": None,
+            "return_levels_dbu": None,
+        }
+    )
+
+
+def bench_pack(samplerate: int, blocksize: int, channels: int, repeat: int) -> dict:
+    from core.stream import Stream
+
+    block = _random_audio(blocksize, channels)
+    return measure(lambda: Stream.pack(block), repeat)
+
+
+def bench_unpack(samplerate: int, blocksize: int, channels: int, repeat: int) -> dict:
+    from core.stream import Stream
+
+    data = Stream.pack(_random_audio(blocksize, channels))
+    return measure(lambda: Stream.unpack(data, channels), repeat)
+
+
+def bench_wave_next(samplerate: int, blocksize: int, channels: int, repeat: int) -> dict:
+    from core.wave import AudioWave
+
+    wave = AudioWave(_random_audio(samplerate * 10, 1)[:, 0], samplerate, -12.0)
+
+    def next_block():
+        if wave.frame + blocksize > len(wave):
+            wave.reset()
+        wave.next(blocksize)
+
+    return measure(next_block, repeat)
+
+
+# The body of the SendReturnStream callback, called directly without starting the stream
+# dtype selects the stream mode, packed int24 bytes or int32/float32 numpy buffers
+def bench_callback(
+    samplerate: int,
+    blocksize: int,
+    channels: int,
+    repeat: int,
+    dtype: str = "int24",
+    packed: bool = False,
+) -> dict:
+    from core.audio import NATIVE_DTYPES, int24_to_native
+    from core.stream import CaptureStream
+    from core.wave import PackedWave
+    from core.wavfile import encode_pcm
+
+    interface = _virtual_interface(blocksize, 1, channels, dtype)
+    send_audio = _random_audio(samplerate * 10, 1)
+    if packed:
+        # a send cache buffer, already scaled to the send level
+        send_audio = PackedWave(
+            np.frombuffer(encode_pcm(send_audio, 3), dtype=np.uint8).reshape((-1, 3)), samplerate, -12.0
+        )
+    stream = CaptureStream(interface, send_audio, samplerate, -12.0)
+    callback = stream.stream.callback
+
+    if dtype == "int24":
+        indata = stream.pack(_random_audio(blocksize, channels))
+        outdata = bytearray(blocksize * interface.num_sends * 3)
+    else:
+        indata = int24_to_native(_random_audio(blocksize, channels), dtype)
+        outdata = np.zeros((blocksize, interface.num_sends), dtype=NATIVE_DTYPES[dtype])
+
+    def run_callback():
+        if stream.frame + blocksize >= stream.length:
+            stream.frame = 0
+            stream.send_audio.reset()
+        callback(indata, outdata, blocksize, None, None)
+
+    result = measure(run_callback, repeat)
+    result["budget_ms"] = blocksize / samplerate * 1000
+    return result
+
+
+# A short take from entering the stream until it's done, each take opening its own stream or swapped into
+# a running engine. The virtual backend only shows the python side, portaudio adds its device setup on top
+def bench_take(samplerate: int, blocksize: int, channels: int, repeat: int, engine: bool = False) -> dict:
+    from core.stream import CaptureStream, DuplexEngine
+
+    interface = _virtual_interface(blocksize, 1, channels)
+    send_audio = _random_audio(blocksize * 4, 1)
+    duplex = DuplexEngine(interface, samplerate).__enter__() if engine else None
+
+    def take():
+        stream = CaptureStream(interface, send_audio, samplerate, -12.0, engine=duplex)
+        with stream:
+            stream.done.wait()
+
+    try:
+        return measure(take, repeat)
+    finally:
+        if duplex is not None:
+            duplex.__exit__(None, None, None)
+
+
+def bench_calculate_latency(samplerate: int, blocksize: int, channels: int, repeat: int) -> dict:
+    from core.audio import calculate_latency
+
+    send_audio = _random_audio(samplerate * 5, 1)
+    return_audio = np.zeros((len(send_audio) + 1000, channels), dtype=np.int32)
+    return_audio[300 : 300 + len(send_audio)] = send_audio
+
+    return measure(lambda: calculate_latency(send_audio, return_audio, samplerate), repeat)
+
+
+def bench_process_recordings(samplerate: int, blocksize: int, channels: int, repeat: int) -> dict:
+    from core.audio import process_recordings
+
+    send_audio = _random_audio(samplerate * 10, 1)
+    return_audio = _random_audio(len(send_audio) + 1000, channels)
+    channel_delays = [300 + i for i in range(channels)]
+    channel_inversions = [False for _ in range(channels)]
+
+    return measure(lambda: process_recordings(send_audio, return_audio, channel_delays, channel_inversions), repeat)
+
+
+def bench_plot_envelope(samplerate: int, blocksize: int, channels: int, repeat: int) -> dict:
+    from core.plot import envelope
+
+    return_audio = _random_audio(samplerate * 60, channels)
+    return measure(lambda: envelope(return_audio), repeat)
+
+
+def bench_wavio_write(samplerate: int, blocksize: int, channels: int, repeat: int) -> dict:
+    import wavio
+
+    audio = _random_audio(samplerate * 10, channels)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = str(Path(tmp_dir, "bench.wav"))
+        return measure(lambda: wavio.write(path, audio, samplerate, sampwidth=3), repeat)
+
+
+def bench_wavio_read(samplerate: int, blocksize: int, channels: int, repeat: int) -> dict:
+    import wavio
+
+    audio = _random_audio(samplerate * 10, channels)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = str(Path(tmp_dir, "bench.wav"))
+        wavio.write(path, audio, samplerate, sampwidth=3)
+        return measure(lambda: wavio.read(path), repeat)
+
+
+def bench_wavfile_write(samplerate: int, blocksize: int, channels: int, repeat: int) -> dict:
+    from core.wavfile import write_wav
+
+    audio = _random_audio(samplerate * 10, channels)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir, "bench.wav")
+        return measure(lambda: write_wav(path, audio, samplerate, sampwidth=3), repeat)
+
+
+def bench_wavfile_read(samplerate: int, blocksize: int, channels: int, repeat: int, mmap: bool = False) -> dict:
+    from core.wavfile import read_wav, write_wav
+
+    audio = _random_audio(samplerate * 10, channels)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir, "bench.wav")
+        write_wav(path, audio, samplerate, sampwidth=3)
+        return measure(lambda: read_wav(path, mmap=mmap), repeat)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def _respond(self, status: int, body) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        if length > 0:
+            self.rfile.read(length)
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._respond(200, {"id": 1, "path": self.path})
+
+    def do_POST(self):
+        self._respond(201, {"id": 1, "path": self.path})
+
+    def do_PATCH(self):
+        self._respond(200, {"id": 1, "path": self.path})
+
+    def log_message(self, *args):
+        pass
+
+
+# ForgeApi round trips against a local stub server, measures client and http overhead only
+def bench_api(samplerate: int, blocksize: int, channels: int, repeat: int) -> dict:
+    from forge_cli.api import ForgeApi
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        api = ForgeApi(f"http://127.0.0.1:{server.server_address[1]}")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = str(Path(tmp_dir, "upload.wav"))
+            Path(path).write_bytes(b"\x00" * samplerate * channels * 3)
+
+            def round_trips():
+                api.get("capture", "1")
+                api.create("capture", {"level_dbu": 0.0})
+                api.update("capture", "1", {"level_dbu": 0.0})
+                api.upload("file", "1", path)
+
+            return measure(round_trips, repeat)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+# Entry point import time, fails if any entry point loads a heavy module at import
+def bench_imports(samplerate: int, blocksize: int, channels: int, repeat: int) -> dict:
+    modules = check_imports()
+    import_ms = [result.get("import_ms", 0.0) for result in modules.values()]
+    return {
+        "repeat": 1,
+        "mean_ms": sum(import_ms) / len(import_ms),
+        "median_ms": sorted(import_ms)[len(import_ms) // 2],
+        "p99_ms": max(import_ms),
+        "min_ms": min(import_ms),
+        "max_ms": max(import_ms),
+        "modules": modules,
+        "passed": all("error" not in result and len(result["heavy_modules"]) == 0 for result in modules.values()),
+    }
+
+
+# each benchmark lists the parameters it varies, the rest are fixed at their first value
+# heavy benchmarks work on whole files and run fewer repeats
+BENCHMARKS = {
+    "pack": (bench_pack, ["blocksize", "channels"], False),
+    "unpack": (bench_unpack, ["blocksize", "channels"], False),
+    "wave_next": (bench_wave_next, ["blocksize"], False),
+    "callback": (bench_callback, ["samplerate", "blocksize", "channels"], False),
+    "callback_int32": (partial(bench_callback, dtype="int32"), ["blocksize", "channels"], False),
+    "callback_float32": (partial(bench_callback, dtype="float32"), ["blocksize", "channels"], False),
+    "callback_packed": (partial(bench_callback, packed=True), ["blocksize", "channels"], False),
+    "take": (bench_take, ["blocksize", "channels"], False),
+    "take_engine": (partial(bench_take, engine=True), ["blocksize", "channels"], False),
+    "calculate_latency": (bench_calculate_latency, ["samplerate", "channels"], True),
+    "process_recordings": (bench_process_recordings, ["samplerate", "channels"], True),
+    "plot_envelope": (bench_plot_envelope, ["samplerate", "channels"], True),
+    "wavio_write": (bench_wavio_write, ["samplerate", "channels"], True),
+    "wavio_read": (bench_wavio_read, ["samplerate", "channels"], True),
+    "wavfile_write": (bench_wavfile_write, ["samplerate", "channels"], True),
+    "wavfile_read": (bench_wavfile_read, ["samplerate", "channels"], True),
+    "wavfile_read_mmap": (partial(bench_wavfile_read, mmap=True), ["samplerate", "channels"], True),
+    "api": (bench_api, [], False),
+    "imports": (bench_imports, [], False),
+}
@@ -0,0 +1,23 @@
+from time import perf_counter
+
+import numpy as np
+
+
+def measure(fn, repeat: int = 50, warmup: int = 3) -> dict:
+    for _ in range(warmup):
+        fn()
+
+    durations = np.zeros(repeat)
+    for i in range(repeat):
+        start = perf_counter()
+        fn()
+        durations[i] = perf_counter() - start
+
+    return {
+        "repeat": repeat,
+        "mean_ms": float(np.mean(durations) * 1000),
+        "median_ms": float(np.median(durations) * 1000),
+        "p99_ms": float(np.percentile(durations, 99) * 1000),
+        "min_ms": float(np.min(durations) * 1000),
+        "max_ms": float(np.max(durations) * 1000),
+    }
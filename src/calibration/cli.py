@@ -3,7 +3,8 @@ from argparse import ArgumentParser
 from core.db import ForgeDB
 from core.audio import vrms_to_dbu
 from core.interface import AudioInterface
-from core.stream import SineWaveStream, SineSweepStream
+from core.probe import validate_interface
+from core.stream import DuplexEngine, SineWaveStream, SineSweepStream
 from calibration.ad2 import measure_acrms
 
 
@@ -37,6 +38,12 @@ def _setup_parser() -> ArgumentParser:
         default=DEFAULT_SAMPLERATE,
         help="samplerate in Hz",
     )
+    send_parser.add_argument(
+        "--channel",
+        type=int,
+        default=None,
+        help="output channel to calibrate, defaults to the interface send channel",
+    )
 
     return_parser = subparsers.add_parser("return", help="calibrate return level")
     return_parser.add_argument(
@@ -86,14 +93,16 @@ def main():
 
     if calibration_type == "send":
         freq: int = args.freq
+        channel: int | None = args.channel
 
-        print("connect interface send to the voltmeter.")
+        validate_interface(db, interface, samplerate, num_returns=0)
+        print(f"connect interface send {channel if channel is not None else interface.num_sends} to the voltmeter.")
         input("press enter to start send level calibration...")
         print("starting send level calibration...")
-        stream = SineWaveStream(interface, freq, samplerate, level_dbfs)
+        stream = SineWaveStream(interface, freq, samplerate, level_dbfs, sends=[channel] if channel is not None else None)
         with stream:
             send_level_dbu = vrms_to_dbu(measure_acrms())
-        interface.set_send_level_dbu(send_level_dbu, level_dbfs)
+        interface.set_send_level_dbu(send_level_dbu, level_dbfs, channel)
         interface.set_send_calibrated()
         print("send level calibration complete")
         print("recalibrate following any settings (gain) or hardware changes")
@@ -104,15 +113,20 @@ def main():
         freq_end: int = args.freq_end
         sweep_duration: float = args.sweep_duration
 
+        validate_interface(db, interface, samplerate)
         print("connect interface send to each return channel one at a time.")
-        for i in range(interface.num_returns):
-            input(f"press enter to start return level calibration for channel {i+1}...")
-            print("starting return levels calibration...")
-            stream = SineSweepStream(interface, freq_start, freq_end, sweep_duration, samplerate, level_dbfs)
-            with stream:
-                while not stream.done.wait(timeout=1.0):
-                    pass
-            interface.set_return_level_dbu(level_dbfs, stream.get_return_levels()[i], i)
+        # every channel's sweep runs on the same stream, so they all see the same latency
+        with DuplexEngine(interface, samplerate) as engine:
+            for i in range(interface.num_returns):
+                input(f"press enter to start return level calibration for channel {i+1}...")
+                print("starting return levels calibration...")
+                stream = SineSweepStream(
+                    interface, freq_start, freq_end, sweep_duration, samplerate, level_dbfs, engine=engine
+                )
+                with stream:
+                    while not stream.done.wait(timeout=1.0):
+                        pass
+                interface.set_return_level_dbu(level_dbfs, stream.get_return_levels()[i], i)
         interface.set_return_calibrated()
         print("return level calibration complete")
         print("recalibrate following any settings (gain) or hardware changes")
@@ -0,0 +1,100 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from core.audio import LatencyAdjustment, calculate_latency, write_processed_capture, write_processed_recordings
+from core.storage import find_audio, open_reader, remove_other_formats
+from capture.capturefile import CAPTURE_NAME, CaptureFile
+from capture.manifest import CaptureManifest
+
+
+RECORDING_FILE = "recording.wav"
+RECORDING_NAME = "recording"
+
+
+# the raw take is written as wav and may be re-encoded to the manifest format once it's processed
+def find_recording(manifest: CaptureManifest) -> Path:
+    recording_path = find_audio(manifest.output_dir, RECORDING_NAME)
+    if recording_path is None:
+        raise FileNotFoundError(f"{manifest.output_dir} has no recording")
+    return recording_path
+
+
+def align_capture(
+    manifest_path: Path,
+    latency_adjustment: LatencyAdjustment = LatencyAdjustment.BASE,
+    inversion_adjustment: bool = True,
+    export_channels: bool | None = None,
+) -> dict:
+    manifest = CaptureManifest(manifest_path)
+    if export_channels is None:
+        export_channels = manifest.export_channels
+
+    # both files are memmapped so workers share the page cache instead of each holding a copy
+    recording = open_reader(find_recording(manifest))
+    channel_delays, channel_inversions = calculate_latency(manifest.input, recording, manifest.samplerate)
+
+    # every channel goes into one interleaved file in a single pass, per channel files are an optional export
+    capture_path = manifest.output_path(CAPTURE_NAME)
+    channel_checksums = write_processed_capture(
+        len(manifest.input),
+        recording,
+        channel_delays,
+        channel_inversions,
+        capture_path,
+        manifest.samplerate,
+        latency_adjustment=latency_adjustment,
+        inversion_adjustment=inversion_adjustment,
+    )
+    remove_other_formats(capture_path)
+
+    if export_channels:
+        output_paths = [manifest.output_path(channel) for channel in manifest.channels]
+        write_processed_recordings(
+            len(manifest.input),
+            recording,
+            channel_delays,
+            channel_inversions,
+            output_paths,
+            manifest.samplerate,
+            latency_adjustment=latency_adjustment,
+            inversion_adjustment=inversion_adjustment,
+        )
+        for output_path in output_paths:
+            remove_other_formats(output_path)
+
+    alignment = {
+        "channel_delays": channel_delays,
+        "channel_inversions": channel_inversions,
+        "latency_adjustment": latency_adjustment.name,
+        "inversion_adjustment": inversion_adjustment,
+    }
+    channels = [
+        manifest.channels[i] if i < len(manifest.channels) else str(i + 1) for i in range(recording.shape[1])
+    ]
+    CaptureFile.write_sidecar(manifest.output_dir, capture_path, channels, channel_checksums, alignment)
+    manifest.update({"alignment": alignment})
+    return alignment
+
+
+def align_captures(
+    manifest_paths: list[Path],
+    max_workers: int | None = None,
+    latency_adjustment: LatencyAdjustment = LatencyAdjustment.BASE,
+    inversion_adjustment: bool = True,
+    export_channels: bool | None = None,
+) -> dict[Path, dict]:
+    results = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(align_capture, path, latency_adjustment, inversion_adjustment, export_channels): path
+            for path in manifest_paths
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                print(f"{path}: alignment failed - {e}")
+            else:
+                print(f"{path}: delays={results[path]['channel_delays']} inversions={results[path]['channel_inversions']}")
+    return results
@@ -0,0 +1,102 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from core.analysis import analyze, silent_head
+from core.plot import save_alignment_plot, save_level_plot, save_spectrum_plot
+from core.storage import encode_file, open_reader
+from capture.align import RECORDING_NAME, align_capture, find_recording
+from capture.capturefile import CaptureFile
+from capture.manifest import CaptureManifest
+from capture.session import CaptureState, set_state
+
+
+MAX_DRIFT_PPM = 1.0
+PLOTS_DIR = "plots"
+
+
+def analyze_capture(manifest_path: Path) -> dict:
+    manifest = CaptureManifest(manifest_path)
+    if manifest.alignment is None:
+        raise RuntimeError(f"{manifest.output_dir} has not been aligned")
+
+    recording = open_reader(find_recording(manifest))
+    metrics = analyze(
+        manifest.input,
+        recording,
+        manifest.samplerate,
+        manifest.alignment["channel_delays"],
+        manifest.alignment["channel_inversions"],
+    )
+    manifest.update({"metrics": metrics})
+    return metrics
+
+
+# alignment, level and spectrum diagnostics saved as pngs, no display is needed
+def plot_capture(manifest_path: Path) -> list[Path]:
+    manifest = CaptureManifest(manifest_path)
+    if manifest.alignment is None:
+        raise RuntimeError(f"{manifest.output_dir} has not been aligned")
+
+    capture = CaptureFile(manifest.output_dir)
+    recording = open_reader(find_recording(manifest))
+    plots_dir = Path(manifest.output_dir, PLOTS_DIR)
+    return [
+        save_alignment_plot(
+            Path(plots_dir, "alignment.png"),
+            manifest.samplerate,
+            manifest.input,
+            recording,
+            capture.reader,
+            capture.channels,
+            manifest.alignment,
+            onset=silent_head(manifest.input),
+        ),
+        save_level_plot(
+            Path(plots_dir, "levels.png"), manifest.samplerate, manifest.input, capture.reader, capture.channels
+        ),
+        save_spectrum_plot(
+            Path(plots_dir, "spectrum.png"), manifest.samplerate, manifest.input, capture.reader, capture.channels
+        ),
+    ]
+
+
+def plot_captures(manifest_paths: list[Path], max_workers: int | None = None) -> dict[Path, list[Path]]:
+    results = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(plot_capture, path): path for path in manifest_paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                print(f"{path}: plotting failed - {e}")
+    return results
+
+
+def process_capture(manifest_path: Path, plot: bool = False) -> dict:
+    align_capture(manifest_path)
+    metrics = analyze_capture(manifest_path)
+    if plot:
+        # a failed plot shouldn't lose the processed capture
+        try:
+            plot_capture(manifest_path)
+        except Exception as e:
+            print(f"{manifest_path}: plotting failed - {e}")
+
+    # compress the raw take last, alignment and analysis read the wav directly
+    manifest = CaptureManifest(manifest_path)
+    recording_path = find_recording(manifest)
+    if recording_path != manifest.output_path(RECORDING_NAME):
+        encode_file(recording_path, manifest.format, remove_source=True)
+    set_state(manifest.output_dir, CaptureState.PROCESSED)
+    return metrics
+
+
+def check_metrics(metrics: dict, channels: list[str]) -> list[str]:
+    warnings = []
+    for i, channel in enumerate(channels):
+        if metrics["clipped_samples"][i] > 0:
+            warnings.append(f"{channel}: {metrics['clipped_samples'][i]} clipped samples")
+        if abs(metrics["drift_ppm"][i]) > MAX_DRIFT_PPM:
+            warnings.append(f"{channel}: delay drifted {metrics['drift_samples'][i]} samples over the capture")
+    return warnings
@@ -0,0 +1,127 @@
+import hashlib
+from pathlib import Path
+
+import numpy as np
+from numpy import typing as npt
+
+from core.storage import open_reader
+from core.util import hash, read_config, write_config
+from core.wavfile import WavReader
+
+
+CAPTURE_NAME = "capture"
+SIDECAR_NAME = "capture"
+
+
+# one channel of an interleaved capture file, indexed like a 1D array
+class ChannelReader:
+    name: str
+    index: int
+
+    def __init__(self, reader, name: str, index: int):
+        self.reader = reader
+        self.name = name
+        self.index = index
+
+    def __len__(self) -> int:
+        return len(self.reader)
+
+    @property
+    def raw(self) -> npt.NDArray[np.uint8]:
+        # a strided memmap over just this channel's bytes, only available for wav files
+        if not isinstance(self.reader, WavReader):
+            raise TypeError(f"{self.reader.path} can't be memmapped")
+        return self.reader.raw[:, self.index]
+
+    def __getitem__(self, key) -> npt.NDArray[np.int32]:
+        return self.reader[key, self.index]
+
+    def read(self, start: int = 0, stop: int | None = None) -> npt.NDArray[np.int32]:
+        return self[start:stop]
+
+
+class CaptureFile:
+    path: Path
+    sidecar_path: Path
+    sidecar: dict
+    channels: list[str]
+
+    @staticmethod
+    def write_sidecar(
+        output_dir: Path,
+        capture_path: Path,
+        channels: list[str],
+        channel_checksums: list[str],
+        alignment: dict,
+    ) -> dict:
+        reader = open_reader(capture_path)
+        # byte offsets let other tools read a channel straight from the file, compressed formats have none
+        data_offset = reader.data_offset if isinstance(reader, WavReader) else None
+        frame_size = reader.channels * reader.sampwidth
+        sidecar = {
+            "file": capture_path.name,
+            "samplerate": reader.samplerate,
+            "frames": len(reader),
+            "sampwidth": reader.sampwidth,
+            "data_offset": data_offset,
+            "frame_size": frame_size if data_offset is not None else None,
+            "channels": [
+                {
+                    "name": name,
+                    "index": i,
+                    "offset": data_offset + i * reader.sampwidth if data_offset is not None else None,
+                    "sha256": channel_checksums[i],
+                }
+                for i, name in enumerate(channels)
+            ],
+            "alignment": alignment,
+            "sha256": hash(capture_path),
+        }
+        write_config(output_dir, sidecar, SIDECAR_NAME)
+        return sidecar
+
+    # point the sidecar at a re-encoded capture file, channel checksums are over samples so they carry over
+    @staticmethod
+    def rewrite_sidecar(output_dir: Path, capture_path: Path) -> dict:
+        sidecar = read_config(Path(output_dir, SIDECAR_NAME + ".json"))
+        return CaptureFile.write_sidecar(
+            output_dir,
+            capture_path,
+            [channel["name"] for channel in sidecar["channels"]],
+            [channel["sha256"] for channel in sidecar["channels"]],
+            sidecar["alignment"],
+        )
+
+    def __init__(self, output_dir: Path):
+        self.sidecar_path = Path(output_dir, SIDECAR_NAME + ".json")
+        if not self.sidecar_path.exists():
+            raise FileNotFoundError(f"{self.sidecar_path} does not exist")
+        self.sidecar = read_config(self.sidecar_path)
+        self.path = Path(output_dir, self.sidecar["file"])
+        self.channels = [channel["name"] for channel in self.sidecar["channels"]]
+        self.reader = open_reader(self.path)
+
+    def __len__(self) -> int:
+        return len(self.reader)
+
+    def channel(self, channel: str | int) -> ChannelReader:
+        if isinstance(channel, str):
+            if channel not in self.channels:
+                raise KeyError(f"{self.path} has no channel {channel}, channels are {self.channels}")
+            channel = self.channels.index(channel)
+        return ChannelReader(self.reader, self.channels[channel], channel)
+
+    # compare the file and channel checksums against the sidecar, returns the mismatches
+    def verify(self) -> list[str]:
+        errors = []
+        # the file is read again, a cached digest wouldn't catch corruption on disk
+        if hash(self.path, use_cache=False) != self.sidecar["sha256"]:
+            errors.append(f"{self.path.name}: checksum mismatch")
+        for i, channel in enumerate(self.sidecar["channels"]):
+            digest = hashlib.sha256()
+            reader = self.channel(i)
+            for start in range(0, len(reader), 2**16):
+                digest.update(np.ascontiguousarray(reader.read(start, start + 2**16), dtype="<i4"))
+            if digest.hexdigest() != channel["sha256"]:
+                errors.append(f"{channel['name']}: checksum mismatch")
+        return errors
@@ -1,17 +1,101 @@
-from argparse import ArgumentParser
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, nullcontext
+import os
 from pathlib import Path
+from time import monotonic
 
-import wavio
-
+from core.audio import LatencyAdjustment
 from core.db import ForgeDB
 from core.interface import AudioInterface
-from core.stream import SineWaveStream, CaptureStream
+from core.meter import MeterDisplay
+from core.probe import validate_interface
+from core.sendcache import SendCache, send_cache_dir
+from core.storage import STORAGES, encode_files, find_audio, get_storage
+from core.stream import DuplexEngine, SineWaveStream, CaptureStream
+from core.wavfile import WavWriter
+from capture.align import RECORDING_FILE, RECORDING_NAME, align_captures
+from capture.capturefile import CAPTURE_NAME, CaptureFile
+from capture.analysis import check_metrics, plot_captures, process_capture
 from capture.manifest import CaptureManifest
+from capture.upload import MAX_UPLOADS, UPLOAD_RATE, UploadWorker, run_uploads
+from capture.session import (
+    PARTIAL_RECORDING_FILE,
+    CaptureSession,
+    CaptureState,
+    get_state,
+    read_state,
+    recover_partial,
+    set_state,
+)
 
 
 DEFAULT_FREQ = 1000  # Hz
 DEFAULT_SAMPLERATE = 48000  # Hz
 DEFAULT_LEVEL_DBFS = -12.0  # dBFS
+CHECKPOINT_SECONDS = 1.0
+# the returns are buffered for this long between checkpoints, so a slow disk doesn't drop frames
+RETURN_BUFFER_SECONDS = 30
+
+
+# the input level for each send, outputs with their own calibration get their own gain
+def _send_levels_dbfs(interface: AudioInterface, level_dbu: float, sends: list[int]) -> list[float]:
+    if not interface.send_calibrated:
+        return [level_dbu for _ in sends]
+    return [interface.send_dbu_to_dbfs(level_dbu, send) for send in sends]
+
+
+# one engine runs for the whole batch, it's only reopened when a capture changes the samplerate
+# the stack only holds the current engine, so it's closed on any exit from the batch
+def _open_engine(
+    engines: ExitStack, engine: DuplexEngine | None, interface: AudioInterface, samplerate: int
+) -> DuplexEngine:
+    if engine is not None and engine.samplerate == samplerate:
+        return engine
+    engines.close()
+    return engines.enter_context(DuplexEngine(interface, samplerate))
+
+
+# play and record one take, returns False if it was stopped from the deck
+# the take is streamed to a partial recording with regular checkpoints, so an interrupted run keeps
+# what was recorded
+def _record_take(stream: CaptureStream, manifest: CaptureManifest, deck, executor: ProcessPoolExecutor) -> bool:
+    set_state(manifest.output_dir, CaptureState.RECORDING)
+    partial_path = Path(manifest.output_dir, PARTIAL_RECORDING_FILE)
+    with WavWriter(partial_path, manifest.samplerate, stream.interface.num_returns) as writer:
+        last_checkpoint = monotonic()
+
+        # the take is recorded into a ring buffer, each checkpoint moves what's new to disk
+        def checkpoint() -> None:
+            nonlocal last_checkpoint
+            writer.write(stream.drain())
+            writer.flush(sync=True)
+            last_checkpoint = monotonic()
+
+        try:
+            display = MeterDisplay(
+                stream.meter,
+                manifest.channels,
+                status=lambda: f"{stream.send_audio.get_time()} / {stream.send_audio.get_duration()}",
+            )
+            with stream, display:
+                # the deck is checked often so the stop key responds quickly
+                while not stream.done.wait(timeout=1.0 if deck is None else 0.1):
+                    stream.poll()
+                    if monotonic() - last_checkpoint >= CHECKPOINT_SECONDS:
+                        checkpoint()
+                    if deck is not None and not deck.update(manifest.capture_id, stream, manifest.channels):
+                        return False
+        except KeyboardInterrupt:
+            checkpoint()
+            writer.close()
+            print(f"capture manually stopped at {stream.send_audio.get_time()} / {stream.send_audio.get_duration()}")
+            state = recover_partial(manifest.output_dir, len(stream.send_audio), manifest.samplerate)
+            print(f"capture {manifest.capture_id}: {state.value}, run forge-capture resume to continue")
+            executor.shutdown(wait=True)
+            raise KeyboardInterrupt
+        checkpoint()
+    return True
 
 
 def _setup_parser() -> ArgumentParser:
@@ -53,18 +137,378 @@ def _setup_parser() -> ArgumentParser:
     capture_parser.add_argument(
         "--no-show",
         action="store_true",
-        help="Skip plotting latency info",
+        help="Skip writing the alignment, level and spectrum plots",
+    )
+    capture_parser.add_argument(
+        "--allow-xruns",
+        action="store_true",
+        help="Keep takes that had buffer underflows or overflows",
+    )
+    capture_parser.add_argument(
+        "--format",
+        type=str,
+        choices=list(STORAGES.keys()),
+        default=None,
+        help="storage format for the recording and channel files (defaults to the manifest format)",
+    )
+    capture_parser.add_argument(
+        "--no-send-cache",
+        action="store_true",
+        help="Scale the input for every capture instead of reusing cached send buffers",
+    )
+    capture_parser.add_argument(
+        "--upload",
+        action="store_true",
+        help="Upload processed captures to the forge api in the background while the run continues",
+    )
+    capture_parser.add_argument(
+        "--upload-rate",
+        type=float,
+        default=UPLOAD_RATE / 2**20,
+        help="upload bandwidth limit in MB/s, 0 for no limit",
+    )
+    capture_parser.add_argument(
+        "--deck",
+        action="store_true",
+        help="Control the captures from a Stream Deck instead of the keyboard",
+    )
+    capture_parser.add_argument(
+        "--export-channels",
+        action="store_true",
+        help="Also write a file per channel next to the interleaved capture file",
+    )
+
+    resume_parser = subparsers.add_parser("resume", help="Continue an interrupted capture run")
+    resume_parser.add_argument(
+        "captures",
+        type=str,
+        nargs="?",
+        default=str(Path(ForgeDB.FORGE_DIR, "captures")),
+        help="path the run was started on",
+    )
+    resume_parser.add_argument(
+        "--deck",
+        action="store_true",
+        help="Control the captures from a Stream Deck instead of the keyboard",
+    )
+
+    status_parser = subparsers.add_parser("status", help="Show the state of each capture in a run")
+    status_parser.add_argument(
+        "captures",
+        type=str,
+        nargs="?",
+        default=str(Path(ForgeDB.FORGE_DIR, "captures")),
+        help="path to a capture or parent dir of captures",
+    )
+
+    upload_parser = subparsers.add_parser("upload", help="Upload processed captures to the forge api")
+    upload_parser.add_argument(
+        "captures",
+        type=str,
+        nargs="?",
+        default=str(Path(ForgeDB.FORGE_DIR, "captures")),
+        help="path to a capture or parent dir of captures",
+    )
+    upload_parser.add_argument(
+        "--workers",
+        type=int,
+        default=MAX_UPLOADS,
+        help="number of concurrent uploads",
+    )
+    upload_parser.add_argument(
+        "--rate",
+        type=float,
+        default=0,
+        help="upload bandwidth limit in MB/s, 0 for no limit",
+    )
+
+    align_parser = subparsers.add_parser("align", help="Re-run latency detection and processing on recorded captures")
+    align_parser.add_argument(
+        "captures",
+        type=str,
+        nargs="?",
+        default=str(Path(ForgeDB.FORGE_DIR, "captures")),
+        help="path to a capture or parent dir of captures",
+    )
+    align_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of worker processes (defaults to the number of cpus)",
+    )
+    align_parser.add_argument(
+        "--latency_adjustment",
+        type=str,
+        choices=[adjustment.name.lower() for adjustment in LatencyAdjustment],
+        default=LatencyAdjustment.BASE.name.lower(),
+        help="how channel delays are applied",
+    )
+    align_parser.add_argument(
+        "--no-invert",
+        action="store_true",
+        help="Skip correcting inverted channels",
+    )
+    align_parser.add_argument(
+        "--export-channels",
+        action="store_true",
+        help="Also write a file per channel next to the interleaved capture file",
+    )
+
+    plot_parser = subparsers.add_parser("plot", help="Write the diagnostic plots of processed captures")
+    plot_parser.add_argument(
+        "captures",
+        type=str,
+        nargs="?",
+        default=str(Path(ForgeDB.FORGE_DIR, "captures")),
+        help="path to a capture or parent dir of captures",
+    )
+    plot_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of worker processes (defaults to the number of cpus)",
+    )
+
+    compress_parser = subparsers.add_parser("compress", help="Re-encode recorded captures in another storage format")
+    compress_parser.add_argument(
+        "captures",
+        type=str,
+        nargs="?",
+        default=str(Path(ForgeDB.FORGE_DIR, "captures")),
+        help="path to a capture or parent dir of captures",
+    )
+    compress_parser.add_argument(
+        "--format",
+        type=str,
+        choices=list(STORAGES.keys()),
+        default="flac",
+        help="storage format",
+    )
+    compress_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of worker processes (defaults to the number of cpus)",
     )
 
     return parser
 
 
+# the run options a session stores so resume continues with the same settings
+SESSION_OPTIONS = ["format", "export_channels", "allow_xruns", "no_show", "no_send_cache", "upload", "upload_rate"]
+
+
+# records every capture that isn't done yet, recorded takes are submitted to the executor for processing
+def _record_captures(
+    args,
+    db: ForgeDB,
+    interface: AudioInterface,
+    manifest_paths: list[Path],
+    deck,
+    executor: ProcessPoolExecutor,
+    futures: dict,
+    send_cache: SendCache | None,
+) -> None:
+    with ExitStack() as engines:
+        engine = None
+        print("verify interface send and returns are connected to the device to be modeled")
+        for manifest_path in manifest_paths:
+            manifest = CaptureManifest(manifest_path)
+            state = get_state(manifest.output_dir)
+            if state == CaptureState.RECORDING:
+                # the run stopped mid take, keep it if enough was written
+                state = recover_partial(manifest.output_dir, len(manifest.input), manifest.samplerate)
+            if state in (CaptureState.PROCESSED, CaptureState.UPLOADED):
+                continue
+            if state == CaptureState.RECORDED:
+                print(f"capture {manifest.capture_id}: recorded, processing")
+                futures[executor.submit(process_capture, manifest.path, not args.no_show)] = manifest
+                continue
+
+            if args.format is not None:
+                get_storage(args.format)
+                manifest.update({"format": args.format})
+            if args.export_channels:
+                manifest.update({"export_channels": True})
+            validate_interface(db, interface, manifest.samplerate)
+            sends = manifest.sends if manifest.sends is not None else [interface.num_sends]
+            levels_dbfs = _send_levels_dbfs(interface, manifest.level_dbu, sends)
+            engine = _open_engine(engines, engine, interface, manifest.samplerate)
+
+            # with a deck a stopped take can be retaken or the capture skipped
+            stream = None
+            while stream is None:
+                take = CaptureStream(
+                    interface,
+                    (
+                        send_cache.wave(manifest.input_path, levels_dbfs[0], manifest.samplerate)
+                        if send_cache is not None
+                        else manifest.input_data
+                    ),
+                    manifest.samplerate,
+                    levels_dbfs[0],
+                    sends=sends,
+                    send_gains_db=[level_dbfs - levels_dbfs[0] for level_dbfs in levels_dbfs],
+                    engine=engine,
+                    ring_frames=RETURN_BUFFER_SECONDS * manifest.samplerate,
+                )
+                if deck is None:
+                    input(f"press enter to start capture {manifest.capture_id}...")
+                elif not deck.wait_for_start(manifest.capture_id, take, sends):
+                    break
+                if _record_take(take, manifest, deck, executor):
+                    stream = take
+                else:
+                    print(f"capture {manifest.capture_id}: take stopped at {take.send_audio.get_time()}")
+                    Path(manifest.output_dir, PARTIAL_RECORDING_FILE).unlink(missing_ok=True)
+                    set_state(manifest.output_dir, CaptureState.PENDING)
+            if stream is None:
+                print(f"capture {manifest.capture_id}: skipped")
+                continue
+            if deck is not None and deck.level_offset_db != 0:
+                manifest.update({"send_level_offset_db": deck.level_offset_db})
+
+            telemetry = stream.get_telemetry()
+            manifest.update({"stream": telemetry})
+            if telemetry["input_xruns"] + telemetry["output_xruns"] > 0:
+                print(
+                    f"capture {manifest.capture_id}: {telemetry['input_xruns']} input and "
+                    f"{telemetry['output_xruns']} output xruns at frames {telemetry['xrun_frames']}"
+                )
+                if not args.allow_xruns:
+                    print(f"capture {manifest.capture_id}: rejecting take, rerun the capture")
+                    Path(manifest.output_dir, PARTIAL_RECORDING_FILE).unlink(missing_ok=True)
+                    set_state(manifest.output_dir, CaptureState.PENDING, rejected="xruns")
+                    continue
+
+            # the take is already on disk, keep it as the raw recording so the capture can be re-aligned later
+            os.replace(Path(manifest.output_dir, PARTIAL_RECORDING_FILE), Path(manifest.output_dir, RECORDING_FILE))
+            set_state(manifest.output_dir, CaptureState.RECORDED)
+            del stream
+
+            # plots render headless in the worker, so they don't hold up the next take
+            futures[executor.submit(process_capture, manifest.path, not args.no_show)] = manifest
+
+
+def _run_captures(args, db: ForgeDB, interface: AudioInterface, deck=None, resume: bool = False) -> None:
+    # captures are aligned and analyzed in a worker while the next one records
+    executor = ProcessPoolExecutor(max_workers=1)
+    futures = {}
+    # captures mostly reuse a few input and level pairs, their scaled and packed sends are cached
+    send_cache = None if args.no_send_cache else SendCache(send_cache_dir(Path(args.manifest)))
+
+    manifest_paths = CaptureManifest.find(Path(args.manifest))
+    session = CaptureSession(Path(args.manifest))
+    if not resume:
+        session.start(
+            {option: getattr(args, option) for option in SESSION_OPTIONS},
+            [CaptureManifest(path).output_dir for path in manifest_paths],
+        )
+
+    # processed captures upload while the rest record, from a niced and throttled process
+    uploader = None
+    if args.upload:
+        if db.get_api() is None:
+            raise ValueError("no forge api set, set it with forge-remote --api to upload")
+        rate = args.upload_rate * 2**20 or None
+        uploader = UploadWorker(session.path.parent, db.get_api(), manifest_paths, rate=rate)
+        uploader.start()
+
+    try:
+        _record_captures(args, db, interface, manifest_paths, deck, executor, futures, send_cache)
+        # a failed capture stays recorded, resume processes it again
+        for future, manifest in futures.items():
+            try:
+                metrics = future.result()
+            except Exception as e:
+                print(f"capture {manifest.capture_id}: processing failed - {e}")
+                continue
+            for warning in check_metrics(metrics, manifest.channels):
+                print(f"capture {manifest.capture_id}: {warning}")
+    finally:
+        executor.shutdown()
+        if uploader is not None:
+            print("waiting for uploads to finish, they continue with forge-capture upload if stopped")
+            uploader.stop()
+
+
+def _print_status(manifest_paths: list[Path]) -> None:
+    counts = {state: 0 for state in CaptureState}
+    for manifest_path in manifest_paths:
+        manifest = CaptureManifest(manifest_path)
+        info = read_state(manifest.output_dir)
+        state = CaptureState(info["state"])
+        counts[state] += 1
+        detail = ""
+        if "partial_frames" in info and info["partial_frames"] < info.get("send_frames", 0):
+            detail = f" (partial take, {info['partial_frames']} of {info['send_frames']} frames)"
+        if "upload_error" in info:
+            detail += f" (upload failed: {info['upload_error']})"
+        print(f"capture {manifest.capture_id}: {state.value}{detail}")
+    print(", ".join(f"{count} {state.value}" for state, count in counts.items()))
+
+
 def main():
     parser = _setup_parser()
     args = parser.parse_args()
     command: str = args.command
 
     db = ForgeDB()
+
+    if command == "align":
+        manifest_paths = CaptureManifest.find(Path(args.captures))
+        results = align_captures(
+            manifest_paths,
+            max_workers=args.workers,
+            latency_adjustment=LatencyAdjustment[args.latency_adjustment.upper()],
+            inversion_adjustment=not args.no_invert,
+            export_channels=True if args.export_channels else None,
+        )
+        print(f"aligned {len(results)} / {len(manifest_paths)} captures")
+        return
+
+    if command == "status":
+        _print_status(CaptureManifest.find(Path(args.captures)))
+        return
+
+    if command == "upload":
+        if db.get_api() is None:
+            raise ValueError("no forge api set, set it with forge-remote --api")
+        manifest_paths = CaptureManifest.find(Path(args.captures))
+        root = CaptureSession(Path(args.captures)).path.parent
+        run_uploads(root, db.get_api(), manifest_paths, max_uploads=args.workers, rate=args.rate * 2**20 or None)
+        _print_status(manifest_paths)
+        return
+
+    if command == "plot":
+        manifest_paths = CaptureManifest.find(Path(args.captures))
+        results = plot_captures(manifest_paths, max_workers=args.workers)
+        print(f"plotted {len(results)} / {len(manifest_paths)} captures")
+        return
+
+    if command == "compress":
+        manifests = [CaptureManifest(path) for path in CaptureManifest.find(Path(args.captures))]
+        extension = get_storage(args.format).EXTENSION
+        paths = [
+            path
+            for manifest in manifests
+            for name in [RECORDING_NAME, CAPTURE_NAME, *manifest.channels]
+            if (path := find_audio(manifest.output_dir, name)) is not None and path.suffix != extension
+        ]
+        results, failures = encode_files(paths, args.format, max_workers=args.workers, remove_source=True)
+        for path, error in failures.items():
+            print(f"{path}: encoding failed - {error}")
+        # captures with a failed file keep their format so the remaining originals are still found
+        failed = {path.parent for path in failures}
+        for manifest in manifests:
+            if manifest.output_dir not in failed:
+                manifest.update({"format": args.format})
+                capture_path = find_audio(manifest.output_dir, CAPTURE_NAME)
+                if capture_path is not None:
+                    CaptureFile.rewrite_sidecar(manifest.output_dir, capture_path)
+        print(f"encoded {len(results)} / {len(paths)} files")
+        return
+
     interface_config = db.get_interface()
 
     interface = AudioInterface(interface_config)
@@ -76,6 +520,7 @@ def main():
         if args.level_dbu is not None:
             level_dbfs = interface.send_dbu_to_dbfs(args.level_dbu)
 
+        validate_interface(db, interface, samplerate, num_returns=0)
         stream = SineWaveStream(interface, freq, samplerate, level_dbfs)
         with stream:
             print("enter 1 to increase output level, 2 to decrease output level, q to quit")
@@ -94,27 +539,19 @@ def main():
                         print("invalid input")
                 control = input("> ")
 
-    elif command == "run":
-        manifest_path = Path(args.manifest)
-        manifest = CaptureManifest(manifest_path)
-        stream = CaptureStream(interface, manifest.input_data, manifest.samplerate, manifest.level_dbu)
+    elif command in ("run", "resume"):
+        resume = command == "resume"
+        if resume:
+            session = CaptureSession(Path(args.captures))
+            if not session.exists:
+                raise FileNotFoundError(f"no capture run to resume in {args.captures}, start one with forge-capture run")
+            args = Namespace(manifest=args.captures, deck=args.deck, **session.options)
 
-        print("verify interface send and returns are connected to the device to be modeled")
-        input("press enter to start capture...")
-        try:
-            with stream:
-                output_str = " | ".join(f"{dbu:3.2f}" for dbu in stream.get_return_levels())
-                print(f"{stream.send_audio.get_time()} / {stream.send_audio.get_duration()} - {output_str}          ")
-        except KeyboardInterrupt:
-            print(f"capture manually stopped at {stream.send_audio.get_time()} / {stream.send_audio.get_time()}")
-            raise KeyboardInterrupt
+        deck = None
+        if args.deck:
+            # the deck needs hidapi, so it's only loaded when asked for
+            from capture.deck import CaptureDeck
 
-        for i in range(len(manifest.channels)):
-            channel = manifest.channels[i]
-            path = Path(manifest.output_dir, f"{channel}.wav")
-            wavio.write(
-                str(path),
-                stream.return_audio[:, i],
-                manifest.samplerate,
-                sampwidth=3,
-            )
+            deck = CaptureDeck(interface)
+        with deck if deck is not None else nullcontext():
+            _run_captures(args, db, interface, deck, resume=resume)
@@ -0,0 +1,144 @@
+from functools import partial
+
+import numpy as np
+
+from core.audio import int24_to_dbfs
+from core.interface import AudioInterface
+from core.stream import CaptureStream, SineWaveStream
+from streamdeck_ui.images import GREEN, RED, render_meter, render_text
+from streamdeck_ui.streamdeck import StreamDeck
+from streamdeck_ui.surface import ControlSurface
+
+
+# key layout for a 3x5 deck, the bottom row shows one meter per return channel
+START_KEY = 0
+NEXT_KEY = 1
+TONE_KEY = 2
+LEVEL_UP_KEY = 3
+LEVEL_DOWN_KEY = 4
+PROGRESS_KEY = 5
+CAPTURE_KEY = 6
+LEVEL_KEY = 7
+METER_KEYS = [10, 11, 12, 13, 14]
+
+KEYMAP = {
+    START_KEY: "start",
+    NEXT_KEY: "next",
+    TONE_KEY: "tone",
+    LEVEL_UP_KEY: "level_up",
+    LEVEL_DOWN_KEY: "level_down",
+}
+
+LEVEL_STEP_DB = 1.0
+TONE_FREQ = 1000  # Hz
+
+
+class CaptureDeck:
+    # replaces the input() prompts of forge-capture run with Stream Deck keys
+    surface: ControlSurface
+    level_offset_db: float
+
+    def __init__(self, interface: AudioInterface, fps: float = 10.0):
+        self.interface = interface
+        self.deck = StreamDeck()
+        self.surface = ControlSurface(self.deck, KEYMAP, fps)
+        # send level nudges carry over to the following captures
+        self.level_offset_db = 0.0
+
+    def __enter__(self) -> "CaptureDeck":
+        self.deck.__enter__()
+        self.surface.__enter__()
+        self.surface.show(NEXT_KEY, partial(render_text, "NEXT"))
+        self.surface.show(LEVEL_UP_KEY, partial(render_text, "LVL\n+"))
+        self.surface.show(LEVEL_DOWN_KEY, partial(render_text, "LVL\n-"))
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.surface.__exit__(*args)
+        self.deck.__exit__(*args)
+
+    def _show_level(self, level_dbfs: float) -> None:
+        self.surface.show(LEVEL_KEY, partial(render_text, f"{level_dbfs:.1f}\nDBFS"))
+
+    def _show_state(self, capture_id: int, position: str, recording: bool, tone: bool = False) -> None:
+        self.surface.show(
+            START_KEY, partial(render_text, "STOP" if recording else "START", background=RED if recording else GREEN)
+        )
+        self.surface.show(TONE_KEY, partial(render_text, "TONE", background=GREEN if tone else (0, 0, 0)))
+        self.surface.show(CAPTURE_KEY, partial(render_text, f"CAP\n{capture_id}"))
+        self.surface.show(PROGRESS_KEY, partial(render_text, position))
+
+    # wait for the start or next key, the test tone and level keys work while waiting
+    # returns True to record the take and False to skip the capture
+    def wait_for_start(
+        self,
+        capture_id: int,
+        stream: CaptureStream,
+        sends: list[int],
+    ) -> bool:
+        stream.adjust_send_level(self.level_offset_db)
+        self.surface.clear_commands()
+        tone = None
+        try:
+            while True:
+                self._show_state(capture_id, stream.send_audio.get_duration(), recording=False, tone=tone is not None)
+                self._show_level(stream.get_send_level())
+                command = self.surface.next_command()
+                if command == "start":
+                    return True
+                elif command == "next":
+                    return False
+                elif command == "tone":
+                    if tone is None:
+                        tone = SineWaveStream(
+                            self.interface,
+                            TONE_FREQ,
+                            stream.send_audio.samplerate,
+                            stream.get_send_level(),
+                            sends=sends,
+                            # the tone plays through the take's engine while it waits for the start key
+                            engine=stream.engine,
+                        )
+                        tone.__enter__()
+                    else:
+                        tone.__exit__(None, None, None)
+                        tone = None
+                elif command in ("level_up", "level_down"):
+                    self._nudge(stream, command)
+                    if tone is not None:
+                        tone.set_send_level(stream.get_send_level())
+        finally:
+            if tone is not None:
+                tone.__exit__(None, None, None)
+
+    def _nudge(self, stream: CaptureStream, command: str) -> None:
+        adjustment_db = LEVEL_STEP_DB if command == "level_up" else -LEVEL_STEP_DB
+        stream.adjust_send_level(adjustment_db)
+        self.level_offset_db += adjustment_db
+
+    # called from the capture loop, returns False once the stop key is pressed
+    def update(self, capture_id: int, stream: CaptureStream, labels: list[str]) -> bool:
+        self._show_state(
+            capture_id, f"{stream.send_audio.get_time()}\n{stream.send_audio.get_duration()}", recording=True
+        )
+        self._show_level(stream.get_send_level())
+        # the latest block peak, the terminal meter owns the peak since last read
+        with np.errstate(divide="ignore"):
+            peaks = int24_to_dbfs(stream.meter.peak)
+        for i, key in enumerate(METER_KEYS[: stream.meter.channels]):
+            self.surface.show(
+                key,
+                partial(
+                    render_meter,
+                    float(peaks[i]),
+                    clip=bool(stream.meter.clips[i] > 0),
+                    label=labels[i] if i < len(labels) else str(i + 1),
+                ),
+            )
+
+        while (command := self.surface.next_command(0)) is not None:
+            if command == "start":
+                return False
+            elif command in ("level_up", "level_down"):
+                self._nudge(stream, command)
+        return True
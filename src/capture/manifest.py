@@ -1,9 +1,9 @@
 import numpy as np
 from numpy import typing as npt
 from pathlib import Path
-import wavio
 
-from core.util import read_config
+from core.storage import get_storage, open_reader
+from core.util import read_config, write_config
 
 
 class CaptureManifest:
@@ -14,16 +14,27 @@ class CaptureManifest:
     switches: dict
     channels: list[str]
     level_dbu: float
+    sends: list[int] | None
+    format: str
+    export_channels: bool
+    alignment: dict | None
 
+    path: Path
     output_dir: Path
     input_path: Path
-    input_data: npt.NDArray[np.int32]
+    input: object
     samplerate: int
 
+    @staticmethod
+    def find(path: Path) -> list[Path]:
+        if Path(path, "manifest.json").exists() or path.is_file():
+            return [path]
+        return sorted(manifest_path.parent for manifest_path in path.glob("*/manifest.json"))
+
     def __init__(self, path: Path):
         if not path.exists():
             raise FileNotFoundError(f"{path} does not exist")
-        elif not path.is_dir():
+        elif path.is_dir():
             path = Path(path, "manifest.json")
 
         config = read_config(path)
@@ -34,10 +45,36 @@ class CaptureManifest:
         self.switches = config.get("switches", {})
         self.channels = config.get("channels", [])
         self.level_dbu = config["level_dbu"]
+        # interface outputs (1 indexed) the input is sent to, None uses the interface send channel
+        self.sends = config.get("sends", None)
+        # storage format of the recording and channel files, see core.storage
+        self.format = config.get("format", "wav")
+        # write a file per channel next to the interleaved capture file
+        self.export_channels = config.get("export_channels", False)
+        self.alignment = config.get("alignment", None)
 
+        self.path = path
         self.output_dir = path.parent
-        self.input_path = Path(self.output_dir.parent, "inputs", self.input_id)
+        self.input_path = Path(self.output_dir.parent.parent, "inputs", self.input_id)
+
+        # the input is memmapped (or seeked for compressed formats), samples are only read once they are used
+        self.input = open_reader(self.input_path)
+        self.samplerate = self.input.samplerate
+
+    @property
+    def input_data(self) -> npt.NDArray[np.int32]:
+        return self.input[:]
+
+    def output_path(self, name: str) -> Path:
+        return get_storage(self.format).path(self.output_dir, name)
 
-        input_wav = wavio.read(self.input_path)
-        self.input_data = input_wav.data
-        self.samplerate = input_wav.rate
+    def update(self, fields: dict) -> None:
+        config = read_config(self.path)
+        config.update(fields)
+        write_config(self.output_dir, config, "manifest")
+        if "alignment" in fields:
+            self.alignment = fields["alignment"]
+        if "format" in fields:
+            self.format = fields["format"]
+        if "export_channels" in fields:
+            self.export_channels = fields["export_channels"]
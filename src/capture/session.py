@@ -0,0 +1,103 @@
+from enum import Enum
+import json
+import os
+from pathlib import Path
+
+from core.util import file_lock, read_config, timestamp, write_config_atomic
+from core.wavfile import WavReader
+from capture.align import RECORDING_FILE
+
+
+SESSION_NAME = "session"
+STATE_NAME = "state"
+PARTIAL_RECORDING_FILE = "recording.partial.wav"
+# a partial take needs at least the cross correlation window alignment uses
+MIN_PARTIAL_SECONDS = 5
+
+
+class CaptureState(Enum):
+    PENDING = "pending"
+    RECORDING = "recording"
+    RECORDED = "recorded"
+    PROCESSED = "processed"
+    UPLOADED = "uploaded"
+
+
+# each capture keeps its own state file. The recording loop, the processing worker and the upload process
+# all write it, so every write holds the capture's state lock
+def read_state(output_dir: Path) -> dict:
+    path = Path(output_dir, STATE_NAME + ".json")
+    if not path.exists():
+        return {"state": CaptureState.PENDING.value}
+    try:
+        return read_config(path)
+    except json.JSONDecodeError:
+        return {"state": CaptureState.PENDING.value}
+
+
+def get_state(output_dir: Path) -> CaptureState:
+    return CaptureState(read_state(output_dir)["state"])
+
+
+def _write_state(output_dir: Path, state: CaptureState, fields: dict) -> None:
+    write_config_atomic(output_dir, {"state": state.value, "updated": timestamp(), **fields}, STATE_NAME)
+
+
+def set_state(output_dir: Path, state: CaptureState, **fields) -> None:
+    with file_lock(Path(output_dir, STATE_NAME + ".lock")):
+        _write_state(output_dir, state, fields)
+
+
+# only moves the capture to state if it's still in one of from_states, returns whether it did
+# the upload process uses it so it never overwrites a capture the recording loop has moved on, e.g. re-recorded
+def transition_state(output_dir: Path, from_states: list[CaptureState], state: CaptureState, **fields) -> bool:
+    with file_lock(Path(output_dir, STATE_NAME + ".lock")):
+        if get_state(output_dir) not in from_states:
+            return False
+        _write_state(output_dir, state, fields)
+        return True
+
+
+# keep the part of a take that was on disk when recording stopped, if it's still usable
+# returns the state the capture is left in
+def recover_partial(output_dir: Path, send_frames: int, samplerate: int) -> CaptureState:
+    partial_path = Path(output_dir, PARTIAL_RECORDING_FILE)
+    if not partial_path.exists():
+        set_state(output_dir, CaptureState.PENDING)
+        return CaptureState.PENDING
+    try:
+        frames = len(WavReader(partial_path))
+    except ValueError:
+        frames = 0
+
+    # a take that only misses the latency tail is complete, a shorter one can still be aligned and analyzed,
+    # processing trims the capture to what was recorded
+    if frames >= min(send_frames, samplerate * MIN_PARTIAL_SECONDS):
+        os.replace(partial_path, Path(output_dir, RECORDING_FILE))
+        set_state(output_dir, CaptureState.RECORDED, partial_frames=frames, send_frames=send_frames)
+        return CaptureState.RECORDED
+    partial_path.unlink()
+    set_state(output_dir, CaptureState.PENDING)
+    return CaptureState.PENDING
+
+
+class CaptureSession:
+    path: Path
+    options: dict
+
+    def __init__(self, path: Path):
+        path = Path(path)
+        root = path if path.is_dir() else path.parent
+        self.path = Path(root, SESSION_NAME + ".json")
+        self.options = read_config(self.path)["options"] if self.path.exists() else {}
+
+    @property
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    # a new run starts every capture over, resume picks up the stored options and states
+    def start(self, options: dict, output_dirs: list[Path]) -> None:
+        self.options = options
+        write_config_atomic(self.path.parent, {"started": timestamp(), "options": options}, SESSION_NAME)
+        for output_dir in output_dirs:
+            set_state(output_dir, CaptureState.PENDING)
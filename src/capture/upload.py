@@ -0,0 +1,231 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from enum import Enum
+import multiprocessing
+import os
+from pathlib import Path
+import random
+import time
+
+from core.storage import find_audio
+from core.util import hash, read_config, write_config_atomic
+from capture.capturefile import CAPTURE_NAME, CaptureFile
+from capture.manifest import CaptureManifest
+from capture.session import CaptureState, read_state, transition_state
+from forge_cli.api import ForgeApi, RateLimiter
+
+
+UPLOADS_NAME = "uploads"
+MAX_UPLOADS = 2
+MAX_ATTEMPTS = 8
+BACKOFF_SECONDS = 2.0
+MAX_BACKOFF_SECONDS = 300.0
+UPLOAD_RATE = 8 * 2**20  # bytes per second
+POLL_SECONDS = 1.0
+# uploads run below the recording loop and processing workers
+NICENESS = 10
+
+
+class UploadStatus(Enum):
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+
+
+# only network errors, server errors and rate limits are worth another try, anything else fails the same way
+# every time. requests' connection errors and timeouts are OSErrors, a missing or unreadable file isn't transient
+def _retryable(error: Exception) -> bool:
+    if isinstance(error, ForgeApi.StatusException):
+        return error.status_code >= 500 or error.status_code == 429
+    return isinstance(error, OSError) and not isinstance(error, (FileNotFoundError, PermissionError))
+
+
+# one entry per output file, persisted after every change so uploads continue where they stopped
+# only the upload process writes it
+class UploadQueue:
+    path: Path
+    entries: dict[str, dict]
+
+    def __init__(self, root: Path):
+        self.path = Path(root, UPLOADS_NAME + ".json")
+        self.entries = read_config(self.path) if self.path.exists() else {}
+
+    def save(self) -> None:
+        write_config_atomic(self.path.parent, self.entries, UPLOADS_NAME)
+
+    def capture_entries(self, output_dir: Path) -> list[dict]:
+        return [entry for entry in self.entries.values() if entry["capture_dir"] == str(output_dir)]
+
+    # queues the interleaved capture file and any exported channel files of a processed capture
+    def add(self, manifest: CaptureManifest) -> None:
+        paths = [find_audio(manifest.output_dir, name) for name in [CAPTURE_NAME, *manifest.channels]]
+        capture_file = CaptureFile(manifest.output_dir)
+        for path in paths:
+            if path is None:
+                continue
+            # the sidecar already has the capture file checksum
+            digest = capture_file.sidecar["sha256"] if path == capture_file.path else hash(path)
+            entry = self.entries.get(str(path))
+            if entry is not None and entry["hash"] == digest and entry["status"] != UploadStatus.FAILED.value:
+                continue
+            self.entries[str(path)] = {
+                "capture_dir": str(manifest.output_dir),
+                "capture_id": manifest.capture_id,
+                "path": str(path),
+                "hash": digest,
+                # a re-recorded capture uploads to the file resource it had before
+                "file_id": entry["file_id"] if entry is not None else None,
+                "status": UploadStatus.PENDING.value,
+                "attempts": 0,
+                "next_attempt": 0.0,
+            }
+        self.save()
+
+    def due(self, now: float, running: set[str], limit: int) -> list[str]:
+        keys = [
+            key
+            for key, entry in self.entries.items()
+            if entry["status"] == UploadStatus.PENDING.value and entry["next_attempt"] <= now and key not in running
+        ]
+        return sorted(keys, key=lambda key: self.entries[key]["next_attempt"])[: max(limit, 0)]
+
+    def pending(self) -> int:
+        return sum(entry["status"] == UploadStatus.PENDING.value for entry in self.entries.values())
+
+    def complete(self, key: str, file_id: str) -> None:
+        self.entries[key].update({"status": UploadStatus.DONE.value, "file_id": file_id, "error": None})
+        self.save()
+
+    # exponential backoff with jitter, so captures that failed together don't retry together
+    def fail(self, key: str, file_id: str | None, error: Exception) -> None:
+        entry = self.entries[key]
+        attempts = entry["attempts"] + 1
+        entry.update({"file_id": file_id, "attempts": attempts, "error": str(error)})
+        if not _retryable(error) or attempts >= MAX_ATTEMPTS:
+            entry["status"] = UploadStatus.FAILED.value
+        else:
+            delay = min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+            entry["next_attempt"] = time.time() + delay * random.uniform(0.5, 1.0)
+        self.save()
+
+    # failed entries get a fresh set of attempts, e.g. after the api is reachable again
+    def retry_failed(self) -> None:
+        for entry in self.entries.values():
+            if entry["status"] == UploadStatus.FAILED.value:
+                entry.update({"status": UploadStatus.PENDING.value, "attempts": 0, "next_attempt": 0.0})
+        self.save()
+
+
+# creates the file resource on the first attempt, its id is kept so retries don't create another
+def _upload_file(api: ForgeApi, entry: dict, limiter: RateLimiter) -> tuple[str | None, Exception | None]:
+    file_id = entry["file_id"]
+    try:
+        if file_id is None:
+            config = {"capture": entry["capture_id"], "name": Path(entry["path"]).name, "hash": entry["hash"]}
+            file_id = str(api.create("file", config)["id"])
+        else:
+            api.update("file", file_id, {"hash": entry["hash"]})
+        api.upload("file", file_id, entry["path"], limiter)
+        return file_id, None
+    except Exception as e:
+        return file_id, e
+
+
+# a capture is uploaded once all of its files are, a failed file is noted in its state
+# the state only changes while the capture is still processed
+def _update_capture(queue: UploadQueue, output_dir: Path) -> None:
+    entries = queue.capture_entries(output_dir)
+    if any(entry["status"] == UploadStatus.PENDING.value for entry in entries):
+        return
+    failed = [entry for entry in entries if entry["status"] == UploadStatus.FAILED.value]
+    if len(failed) > 0:
+        transition_state(output_dir, [CaptureState.PROCESSED], CaptureState.PROCESSED, upload_error=failed[0]["error"])
+    else:
+        file_ids = [entry["file_id"] for entry in entries]
+        transition_state(output_dir, [CaptureState.PROCESSED], CaptureState.UPLOADED, file_ids=file_ids)
+
+
+# watches the captures for processed ones and uploads their files until stop is set and the queue is empty
+# without stop it uploads what's processed and queued, retrying captures that failed before
+def run_uploads(
+    root: Path,
+    api_str: str,
+    manifest_paths: list[Path],
+    stop=None,
+    max_uploads: int = MAX_UPLOADS,
+    rate: float | None = UPLOAD_RATE,
+) -> UploadQueue:
+    queue = UploadQueue(root)
+    api = ForgeApi(api_str)
+    limiter = RateLimiter(rate)
+    manifests = [CaptureManifest(path) for path in manifest_paths]
+    if stop is None:
+        queue.retry_failed()
+        for manifest in manifests:
+            if "upload_error" in read_state(manifest.output_dir):
+                transition_state(manifest.output_dir, [CaptureState.PROCESSED], CaptureState.PROCESSED)
+
+    running: dict[Future, str] = {}
+    with ThreadPoolExecutor(max_workers=max_uploads) as pool:
+        while True:
+            for manifest in manifests:
+                info = read_state(manifest.output_dir)
+                if info["state"] != CaptureState.PROCESSED.value or "upload_error" in info:
+                    continue
+                # captures with files in flight were already added
+                entries = queue.capture_entries(manifest.output_dir)
+                if not any(entry["status"] == UploadStatus.PENDING.value for entry in entries):
+                    queue.add(manifest)
+                    _update_capture(queue, manifest.output_dir)
+
+            for key in queue.due(time.time(), set(running.values()), max_uploads - len(running)):
+                running[pool.submit(_upload_file, api, queue.entries[key], limiter)] = key
+
+            if len(running) == 0 and queue.pending() == 0 and (stop is None or stop.is_set()):
+                return queue
+            done, _ = wait(running, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                file_id, error = future.result()
+                if error is None:
+                    queue.complete(key, file_id)
+                else:
+                    queue.fail(key, file_id, error)
+                    print(f"upload of {key} failed ({queue.entries[key]['attempts']} attempts): {error}")
+                _update_capture(queue, Path(queue.entries[key]["capture_dir"]))
+
+
+def _run_niced(*args) -> None:
+    if hasattr(os, "nice"):
+        os.nice(NICENESS)
+    try:
+        run_uploads(*args)
+    except KeyboardInterrupt:
+        # the queue is saved after every change, so the next run continues from it
+        pass
+
+
+# uploads in a lower priority process so they overlap with recording without competing with the audio thread
+class UploadWorker:
+    def __init__(
+        self,
+        root: Path,
+        api_str: str,
+        manifest_paths: list[Path],
+        max_uploads: int = MAX_UPLOADS,
+        rate: float | None = UPLOAD_RATE,
+    ):
+        self._stop = multiprocessing.Event()
+        self.process = multiprocessing.Process(
+            target=_run_niced,
+            args=(root, api_str, manifest_paths, self._stop, max_uploads, rate),
+            # the queue is persisted, so a run that fails doesn't wait on its uploads
+            daemon=True,
+        )
+
+    def start(self) -> None:
+        self.process.start()
+
+    # lets the queued uploads finish, they continue with forge-capture upload if the wait is interrupted
+    def stop(self) -> None:
+        self._stop.set()
+        self.process.join()
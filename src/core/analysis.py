@@ -0,0 +1,134 @@
+import numpy as np
+from numpy import typing as npt
+
+from core.audio import MAX_VAL_INT24, cross_correlate, process_block
+
+
+SILENCE_THRESHOLD_DBFS = -60.0
+DRIFT_WINDOW_SECONDS = 1.0
+BLOCKSIZE = 2**16
+
+
+# json has no representation for inf or nan, silent or undefined values are stored as null
+def _finite(values: npt.NDArray[np.float64]) -> list[float | None]:
+    return [float(value) if np.isfinite(value) else None for value in values]
+
+
+def _to_dbfs(value: npt.NDArray[np.float64]) -> list[float | None]:
+    with np.errstate(divide="ignore"):
+        return _finite(20 * np.log10(value / MAX_VAL_INT24))
+
+
+# Number of frames at the start of the input before it rises above the silence threshold
+def silent_head(send_audio, threshold_dbfs: float = SILENCE_THRESHOLD_DBFS) -> int:
+    threshold = MAX_VAL_INT24 * 10 ** (threshold_dbfs / 20)
+    for start in range(0, len(send_audio), BLOCKSIZE):
+        block = send_audio[start : start + BLOCKSIZE, 0]
+        loud = np.flatnonzero(np.abs(block) > threshold)
+        if len(loud) > 0:
+            return start + int(loud[0])
+    return len(send_audio)
+
+
+# Peak level and number of full scale samples for each channel
+def clipping(return_audio) -> tuple[list[float | None], list[int]]:
+    num_returns = np.shape(return_audio)[1]
+    peaks = np.zeros(num_returns, dtype=np.int64)
+    clipped = np.zeros(num_returns, dtype=np.int64)
+    for start in range(0, len(return_audio), BLOCKSIZE):
+        block = np.abs(return_audio[start : start + BLOCKSIZE].astype(np.int64))
+        np.maximum(peaks, block.max(axis=0), out=peaks)
+        clipped += np.count_nonzero(block >= MAX_VAL_INT24, axis=0)
+    return _to_dbfs(peaks.astype(np.float64)), clipped.tolist()
+
+
+# RMS level of each channel over the silent head of the input
+def noise_floor(return_audio, head_frames: int) -> list[float | None]:
+    head = return_audio[:head_frames].astype(np.float64)
+    if len(head) == 0:
+        return [None for _ in range(np.shape(return_audio)[1])]
+    return _to_dbfs(np.sqrt(np.mean(head * head, axis=0)))
+
+
+def _window_delays(send_audio, return_audio, start: int, length: int) -> npt.NDArray[np.int64]:
+    send_window = send_audio[start : start + length, 0].astype(np.float64)
+    return_window = return_audio[start : start + length].astype(np.float64)
+    delays = np.zeros(return_window.shape[1], dtype=np.int64)
+    for i in range(return_window.shape[1]):
+        cross_corr = np.abs(cross_correlate(send_window, return_window[:, i]))
+        delays[i] = len(return_window) - int(np.argmax(cross_corr)) - 1
+    return delays
+
+
+# Change in delay between a window at the start of the input and one at the end
+def delay_drift(
+    send_audio,
+    return_audio,
+    samplerate: int,
+    head_frames: int,
+    window_seconds: float = DRIFT_WINDOW_SECONDS,
+) -> tuple[list[int], list[float]]:
+    length = int(samplerate * window_seconds)
+    end = min(len(send_audio), len(return_audio)) - length
+    if end <= head_frames:
+        return [0 for _ in range(np.shape(return_audio)[1])], [0.0 for _ in range(np.shape(return_audio)[1])]
+
+    drift = _window_delays(send_audio, return_audio, end, length) - _window_delays(
+        send_audio, return_audio, head_frames, length
+    )
+    ppm = drift / (end - head_frames) * 1e6
+    return drift.tolist(), ppm.tolist()
+
+
+# Error to signal ratio of each aligned channel against the gain matched input
+def null_esr(
+    send_audio,
+    return_audio,
+    channel_delays: list[int],
+    channel_inversions: list[bool],
+) -> tuple[list[float | None], list[float | None]]:
+    num_returns = np.shape(return_audio)[1]
+    delays = np.array(channel_delays[:num_returns], dtype=np.int64)
+    signs = np.where(channel_inversions[:num_returns], -1, 1).astype(np.int32)
+
+    # accumulate the correlation sums block by block so the take never has to fit in memory
+    sxx = 0.0
+    sxy = np.zeros(num_returns)
+    syy = np.zeros(num_returns)
+    num_frames = min(len(send_audio), len(return_audio))
+    for start in range(0, num_frames, BLOCKSIZE):
+        stop = min(start + BLOCKSIZE, num_frames)
+        x = send_audio[start:stop, 0].astype(np.float64)
+        y = process_block(return_audio, start, stop, delays, signs).astype(np.float64)
+        sxx += np.dot(x, x)
+        sxy += x @ y
+        syy += np.einsum("ij,ij->j", y, y)
+
+    # the residual energy after removing the least squares gain fit of the input
+    with np.errstate(divide="ignore", invalid="ignore"):
+        residual = np.maximum(syy - sxy * sxy / sxx, 0.0)
+        esr = residual / syy
+        null_db = 10 * np.log10(esr)
+    return _finite(esr), _finite(null_db)
+
+
+def analyze(
+    send_audio,
+    return_audio,
+    samplerate: int,
+    channel_delays: list[int],
+    channel_inversions: list[bool],
+) -> dict:
+    head_frames = silent_head(send_audio)
+    peak_dbfs, clipped_samples = clipping(return_audio)
+    drift_samples, drift_ppm = delay_drift(send_audio, return_audio, samplerate, head_frames)
+    esr, null_db = null_esr(send_audio, return_audio, channel_delays, channel_inversions)
+    return {
+        "peak_dbfs": peak_dbfs,
+        "clipped_samples": clipped_samples,
+        "noise_floor_dbfs": noise_floor(return_audio, head_frames),
+        "drift_samples": drift_samples,
+        "drift_ppm": drift_ppm,
+        "esr": esr,
+        "null_db": null_db,
+    }
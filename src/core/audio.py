@@ -1,9 +1,13 @@
+import hashlib
 import math
 from enum import Enum
+from pathlib import Path
 
 import numpy as np
 from numpy import typing as npt
 
+from core.storage import open_writer
+
 MAX_VAL_INT24 = 2 ** (24 - 1) - 1
 
 
@@ -21,6 +25,47 @@ def dbu_to_vrms(dbu: float) -> float:
     return 0.7746 * 10 ** (dbu / 20)
 
 
+# stream sample formats backed by numpy buffers, int24 streams use packed bytes
+NATIVE_DTYPES = {"int32": np.int32, "float32": np.float32}
+STREAM_DTYPES = ["int24", *NATIVE_DTYPES]
+INT24_SCALE = 2**23
+
+
+# Convert 24 bit samples to a native stream buffer, int32 is left justified and float32 is normalized to +-1.0
+# both conversions are exact so 24 bit audio survives the round trip unchanged
+def int24_to_native(
+    data: npt.NDArray[np.int32],
+    dtype: str,
+    out: npt.NDArray | None = None,
+) -> npt.NDArray:
+    if dtype == "int32":
+        return np.left_shift(data, 8, out=out)
+    elif dtype == "float32":
+        if out is None:
+            out = np.empty(data.shape, dtype=np.float32)
+        return np.multiply(data, 1 / INT24_SCALE, out=out)
+    raise ValueError(f"unsupported native dtype: {dtype}")
+
+
+# Convert a native stream buffer back to 24 bit samples, float32 values are rounded and clipped to the int24 range
+def native_to_int24(
+    data: npt.NDArray,
+    out: npt.NDArray[np.int32] | None = None,
+    scratch: npt.NDArray[np.float32] | None = None,
+) -> npt.NDArray[np.int32]:
+    if out is None:
+        out = np.empty(data.shape, dtype=np.int32)
+    if data.dtype == np.int32:
+        return np.right_shift(data, 8, out=out)
+    elif data.dtype == np.float32:
+        scaled = np.multiply(data, INT24_SCALE, out=scratch)
+        np.rint(scaled, out=scaled)
+        np.clip(scaled, -MAX_VAL_INT24 - 1, MAX_VAL_INT24, out=scaled)
+        out[:] = scaled
+        return out
+    raise ValueError(f"unsupported native dtype: {data.dtype}")
+
+
 # Convert 24 bit audio data to dBFS
 def int24_to_dbfs(max_val: npt.NDArray[np.int32]) -> npt.NDArray[np.float32]:
     return 20 * np.log10(max_val / (MAX_VAL_INT24))
@@ -35,6 +80,16 @@ class LatencyAdjustment(Enum):
     INDIVIDUAL = 2
 
 
+# Full cross correlation via fft, equivalent to np.correlate(a, b, mode="full") in O(n log n)
+def cross_correlate(a: npt.NDArray, b: npt.NDArray) -> npt.NDArray[np.float64]:
+    length = len(a) + len(b) - 1
+    n_fft = 1 << (length - 1).bit_length()
+    spectrum = np.fft.rfft(a, n_fft) * np.conj(np.fft.rfft(b, n_fft))
+    cross_corr = np.fft.irfft(spectrum, n_fft)
+    # rotate the negative lags to the front to match the layout of np.correlate
+    return np.concatenate((cross_corr[n_fft - len(b) + 1 :], cross_corr[: len(a)]))
+
+
 def calculate_latency(
     send_audio: npt.NDArray[np.int32],
     return_audio: npt.NDArray[np.int32],
@@ -56,7 +111,7 @@ def calculate_latency(
 
         # calculate cross correlation for each channel
         # if the maximum cross correlation is negative, invert the channel
-        cross_corr = np.correlate(reamp_short, output_data_short_normalized, mode="full")
+        cross_corr = cross_correlate(reamp_short, output_data_short_normalized)
         max_cc = np.argmax(cross_corr)
         min_cc = np.argmin(cross_corr)
         if np.abs(cross_corr[max_cc]) < np.abs(cross_corr[min_cc]):
@@ -68,6 +123,57 @@ def calculate_latency(
     return channel_delays, channel_inversions
 
 
+def _channel_delays(
+    channel_delays: list[int],
+    num_returns: int,
+    latency_adjustment: LatencyAdjustment,
+) -> npt.NDArray[np.int64]:
+    if latency_adjustment == LatencyAdjustment.BASE:
+        return np.array(channel_delays[:num_returns], dtype=np.int64)
+    elif latency_adjustment == LatencyAdjustment.INDIVIDUAL:
+        return np.full(num_returns, channel_delays[0], dtype=np.int64)
+    return np.zeros(num_returns, dtype=np.int64)
+
+
+def _channel_signs(
+    channel_inversions: list[bool],
+    num_returns: int,
+    inversion_adjustment: bool,
+) -> npt.NDArray[np.int32]:
+    signs = np.ones(num_returns, dtype=np.int32)
+    if inversion_adjustment:
+        for i in range(num_returns):
+            if channel_inversions[i]:
+                print(f"detected signal inversion on channel {i}, correcting")
+                signs[i] = -1
+    return signs
+
+
+# Shift and invert frames [start, stop) of every return channel in a single gather
+# return_audio can be any array-like indexed by frame, e.g. a memmapped WavReader
+def process_block(
+    return_audio,
+    start: int,
+    stop: int,
+    delays: npt.NDArray[np.int64],
+    signs: npt.NDArray[np.int32],
+) -> npt.NDArray[np.int32]:
+    num_frames = len(return_audio)
+    window_start = min(max(start + int(delays.min()), 0), num_frames)
+    window_stop = min(max(stop + int(delays.max()), window_start), num_frames)
+    if window_stop == window_start:
+        return np.zeros((stop - start, len(delays)), dtype=np.int32)
+    window = return_audio[window_start:window_stop]
+
+    rows = np.arange(start - window_start, stop - window_start)[:, None] + delays[None, :]
+    valid = (rows >= 0) & (rows < len(window))
+
+    block = window[np.clip(rows, 0, len(window) - 1), np.arange(len(delays))[None, :]]
+    block *= signs
+    block[~valid] = 0
+    return block.astype(np.int32, copy=False)
+
+
 def process_recordings(
     send_audio: npt.NDArray[np.int32],
     return_audio: npt.NDArray[np.int32],
@@ -77,26 +183,89 @@ def process_recordings(
     inversion_adjustment: bool = True,
 ) -> npt.NDArray:
     num_returns = np.shape(return_audio)[1]
-    result = np.zeros_like(return_audio)
+    delays = _channel_delays(channel_delays, num_returns, latency_adjustment)
+    signs = _channel_signs(channel_inversions, num_returns, inversion_adjustment)
 
-    # apply the calculated delays to the recording data
-    if latency_adjustment == LatencyAdjustment.BASE:
-        for i in range(num_returns):
-            result[: -channel_delays[i], i] = return_audio[channel_delays[i] :, i]
-    elif latency_adjustment == LatencyAdjustment.INDIVIDUAL:
-        for i in range(num_returns):
-            result[: -channel_delays[0], i] = return_audio[channel_delays[0] :, i]
-    else:
-        result[:, :] = return_audio[:, :]
+    # apply the delays and inversions, trimming the recording data to the length of the reamp data
+    return process_block(return_audio, 0, min(len(send_audio), len(return_audio)), delays, signs)
 
-    # invert the recording data if necessary
-    if inversion_adjustment:
-        for i in range(num_returns):
-            if channel_inversions[i]:
-                print(f"detected signal inversion on channel {i}, correcting")
-                result[:, i] *= -1
 
-    # trim the recording data to the length of the reamp data
-    result = result[: len(send_audio), :]
+def _processed_blocks(
+    send_length: int,
+    return_audio,
+    channel_delays: list[int],
+    channel_inversions: list[bool],
+    latency_adjustment: LatencyAdjustment,
+    inversion_adjustment: bool,
+    blocksize: int,
+):
+    num_returns = np.shape(return_audio)[1]
+    delays = _channel_delays(channel_delays, num_returns, latency_adjustment)
+    signs = _channel_signs(channel_inversions, num_returns, inversion_adjustment)
+
+    # only one block of the recording is held in memory at a time
+    num_frames = min(send_length, len(return_audio))
+    for start in range(0, num_frames, blocksize):
+        stop = min(start + blocksize, num_frames)
+        yield process_block(return_audio, start, stop, delays, signs)
+
 
-    return result
+def write_processed_recordings(
+    send_length: int,
+    return_audio,
+    channel_delays: list[int],
+    channel_inversions: list[bool],
+    output_paths: list[Path],
+    samplerate: int,
+    latency_adjustment: LatencyAdjustment = LatencyAdjustment.BASE,
+    inversion_adjustment: bool = True,
+    blocksize: int = 2**16,
+) -> None:
+    # the output format follows each path's extension
+    writers = [open_writer(path, samplerate, 1) for path in output_paths]
+    try:
+        for block in _processed_blocks(
+            send_length,
+            return_audio,
+            channel_delays,
+            channel_inversions,
+            latency_adjustment,
+            inversion_adjustment,
+            blocksize,
+        ):
+            for i, writer in enumerate(writers):
+                writer.write(block[:, i])
+    finally:
+        for writer in writers:
+            writer.close()
+
+
+# Write every processed return channel interleaved into one file in a single sequential pass
+# returns the sha256 of each channel's int32 samples, which doesn't depend on the storage format
+def write_processed_capture(
+    send_length: int,
+    return_audio,
+    channel_delays: list[int],
+    channel_inversions: list[bool],
+    output_path: Path,
+    samplerate: int,
+    latency_adjustment: LatencyAdjustment = LatencyAdjustment.BASE,
+    inversion_adjustment: bool = True,
+    blocksize: int = 2**16,
+) -> list[str]:
+    num_returns = np.shape(return_audio)[1]
+    digests = [hashlib.sha256() for _ in range(num_returns)]
+    with open_writer(output_path, samplerate, num_returns) as writer:
+        for block in _processed_blocks(
+            send_length,
+            return_audio,
+            channel_delays,
+            channel_inversions,
+            latency_adjustment,
+            inversion_adjustment,
+            blocksize,
+        ):
+            writer.write(block)
+            for i, digest in enumerate(digests):
+                digest.update(np.ascontiguousarray(block[:, i], dtype="<i4"))
+    return [digest.hexdigest() for digest in digests]
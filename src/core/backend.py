@@ -0,0 +1,327 @@
+from abc import ABC, abstractmethod
+import threading
+from time import perf_counter, sleep
+
+import numpy as np
+from numpy import typing as npt
+
+from core.audio import MAX_VAL_INT24, NATIVE_DTYPES, db_to_scalar, int24_to_native, native_to_int24
+from core.wavfile import decode_pcm, encode_pcm
+
+
+class Backend(ABC):
+    NAME: str
+    CallbackStop: type[Exception]
+
+    @abstractmethod
+    def open_output(
+        self,
+        samplerate: int,
+        blocksize: int,
+        device,
+        channels: int,
+        dtype: str,
+        callback,
+        finished_callback,
+        latency: str | float | None = None,
+    ):
+        pass
+
+    @abstractmethod
+    def open_duplex(
+        self,
+        samplerate: int,
+        blocksize: int,
+        device,
+        channels: tuple[int, int],
+        dtype: str,
+        callback,
+        finished_callback,
+        latency: str | float | None = None,
+    ):
+        pass
+
+
+class SoundDeviceBackend(Backend):
+    NAME = "sounddevice"
+
+    def __init__(self):
+        import sounddevice as sd
+
+        self.sd = sd
+        self.CallbackStop = sd.CallbackStop
+
+    # int24 has no numpy type so it uses raw streams of packed bytes, other dtypes get numpy buffers
+    def open_output(self, samplerate, blocksize, device, channels, dtype, callback, finished_callback, latency=None):
+        stream_type = self.sd.RawOutputStream if dtype == "int24" else self.sd.OutputStream
+        return stream_type(
+            samplerate=samplerate,
+            blocksize=blocksize,
+            device=device,
+            channels=channels,
+            dtype=dtype,
+            latency=latency,
+            callback=callback,
+            finished_callback=finished_callback,
+        )
+
+    def open_duplex(self, samplerate, blocksize, device, channels, dtype, callback, finished_callback, latency=None):
+        stream_type = self.sd.RawStream if dtype == "int24" else self.sd.Stream
+        return stream_type(
+            samplerate=samplerate,
+            blocksize=blocksize,
+            device=device,
+            channels=channels,
+            dtype=dtype,
+            latency=latency,
+            callback=callback,
+            finished_callback=finished_callback,
+        )
+
+
+class VirtualCallbackStop(Exception):
+    pass
+
+
+# mirrors the status flags sounddevice passes to callbacks
+class VirtualCallbackFlags:
+    def __init__(self, xrun: bool = False):
+        self.input_underflow = False
+        self.input_overflow = xrun
+        self.output_underflow = xrun
+        self.output_overflow = False
+        self.priming_output = False
+
+    def __bool__(self) -> bool:
+        return self.input_overflow or self.output_underflow
+
+    def __str__(self) -> str:
+        return "input overflow, output underflow" if self else ""
+
+
+class VirtualDevice:
+    # the audio path between the interface sends and returns, e.g. a loopback cable or a simulated device
+    DEFAULT_SETTINGS = {
+        "latency": 256,
+        "invert": False,
+        "gain_db": 0.0,
+        "noise_dbfs": None,
+        "drive": 0.0,
+        "xrun_frames": [],
+        "xrun_probability": 0.0,
+        "speed": 1.0,
+        "seed": None,
+    }
+
+    latency: int
+    invert: bool
+    gain_db: float
+    noise_dbfs: float | None
+    drive: float
+    xrun_frames: list[int]
+    xrun_probability: float
+    speed: float
+
+    def __init__(self, config: dict | None = None):
+        config = self.DEFAULT_SETTINGS | (config or {})
+        self.latency = config["latency"]
+        self.invert = config["invert"]
+        self.gain_db = config["gain_db"]
+        self.noise_dbfs = config["noise_dbfs"]
+        self.drive = config["drive"]
+        self.xrun_frames = sorted(config["xrun_frames"])
+        self.xrun_probability = config["xrun_probability"]
+        # 1.0 runs in real time, 0 runs as fast as the callbacks allow
+        self.speed = config["speed"]
+        self.rng = np.random.default_rng(config["seed"])
+
+    def is_xrun(self, frame: int, frames: int) -> bool:
+        if any(frame <= xrun_frame < frame + frames for xrun_frame in self.xrun_frames):
+            return True
+        return self.xrun_probability > 0 and self.rng.random() < self.xrun_probability
+
+    def process(self, send: npt.NDArray[np.int32], num_returns: int) -> npt.NDArray[np.int32]:
+        x = np.sum(send, axis=1, dtype=np.float64) / MAX_VAL_INT24
+        x *= db_to_scalar(self.gain_db)
+        if self.drive > 0:
+            x = np.tanh(self.drive * x) / np.tanh(self.drive)
+        if self.invert:
+            x = -x
+        if self.noise_dbfs is not None:
+            x += self.rng.normal(0.0, db_to_scalar(self.noise_dbfs), len(x))
+        y = np.clip(np.round(x * MAX_VAL_INT24), -MAX_VAL_INT24 - 1, MAX_VAL_INT24).astype(np.int32)
+        return np.repeat(y[:, None], num_returns, axis=1)
+
+
+class VirtualStream:
+    # drives stream callbacks from a thread the same way a portaudio raw stream does
+    samplerate: int
+    blocksize: int
+    channels: tuple[int, int]
+    cpu_load: float
+    active: bool
+
+    SAMPWIDTH = 3
+
+    def __init__(
+        self,
+        device: VirtualDevice,
+        samplerate: int,
+        blocksize: int,
+        channels: tuple[int, int],
+        callback,
+        finished_callback,
+        duplex: bool,
+        dtype: str = "int24",
+    ):
+        self.device = device
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.channels = channels
+        self.dtype = dtype
+        self.callback = callback
+        self.finished_callback = finished_callback
+        self.duplex = duplex
+
+        self.cpu_load = 0.0
+        self.active = False
+        self.closed = False
+
+        # a block can't be returned before the callback produced it, so latency is at least one block
+        latency = max(device.latency, blocksize)
+        self.latency = (latency / samplerate, latency / samplerate)
+
+        num_returns, num_sends = channels
+        # the delay line holds the returned audio that hasn't reached the inputs yet
+        self.delay_line = np.zeros((latency, num_returns), dtype=np.int32)
+        if dtype == "int24":
+            self.outdata = bytearray(blocksize * num_sends * self.SAMPWIDTH)
+        else:
+            self.outdata = np.zeros((blocksize, num_sends), dtype=NATIVE_DTYPES[dtype])
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self.active:
+            return
+        self._stop.clear()
+        self.active = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def close(self) -> None:
+        self.stop()
+        self.closed = True
+
+    def _encode(self, data: npt.NDArray[np.int32]):
+        if self.dtype == "int24":
+            return encode_pcm(data, self.SAMPWIDTH)
+        return int24_to_native(data, self.dtype)
+
+    def _decode(self, data, channels: int) -> npt.NDArray[np.int32]:
+        if self.dtype == "int24":
+            raw = np.frombuffer(data, dtype=np.uint8).reshape((self.blocksize, channels, self.SAMPWIDTH))
+            return decode_pcm(raw, self.SAMPWIDTH)
+        return native_to_int24(data)
+
+    def _run(self) -> None:
+        num_returns, num_sends = self.channels
+        block_duration = self.blocksize / self.samplerate
+        deadline = perf_counter()
+        frame = 0
+        try:
+            while not self._stop.is_set():
+                xrun = self.device.is_xrun(frame, self.blocksize)
+                indata = self._encode(self.delay_line[: self.blocksize])
+                status = VirtualCallbackFlags(xrun)
+
+                start = perf_counter()
+                try:
+                    if self.duplex:
+                        self.callback(indata, self.outdata, self.blocksize, None, status)
+                    else:
+                        self.callback(self.outdata, self.blocksize, None, status)
+                    stopped = False
+                except VirtualCallbackStop:
+                    stopped = True
+                self.cpu_load = 0.9 * self.cpu_load + 0.1 * (perf_counter() - start) / block_duration
+
+                send = self._decode(self.outdata, num_sends)
+                returned = self.device.process(send, num_returns)
+                if xrun:
+                    # the block that overran never makes it to the inputs
+                    returned[:] = 0
+                self.delay_line = np.concatenate((self.delay_line[self.blocksize :], returned))
+                frame += self.blocksize
+
+                if stopped:
+                    break
+                if self.device.speed > 0:
+                    deadline += block_duration / self.device.speed
+                    delay = deadline - perf_counter()
+                    if delay > 0:
+                        sleep(delay)
+        finally:
+            self.active = False
+            if self.finished_callback is not None:
+                self.finished_callback()
+
+
+class VirtualBackend(Backend):
+    NAME = "virtual"
+    CallbackStop = VirtualCallbackStop
+
+    def __init__(self, config: dict | None = None):
+        self.config = config
+
+    @staticmethod
+    def _check_dtype(dtype: str) -> None:
+        if dtype != "int24" and dtype not in NATIVE_DTYPES:
+            raise ValueError(f"virtual backend does not support dtype {dtype}")
+
+    def open_output(self, samplerate, blocksize, device, channels, dtype, callback, finished_callback, latency=None):
+        self._check_dtype(dtype)
+        return VirtualStream(
+            VirtualDevice(self.config),
+            samplerate,
+            blocksize,
+            (0, channels),
+            callback,
+            finished_callback,
+            duplex=False,
+            dtype=dtype,
+        )
+
+    def open_duplex(self, samplerate, blocksize, device, channels, dtype, callback, finished_callback, latency=None):
+        self._check_dtype(dtype)
+        return VirtualStream(
+            VirtualDevice(self.config),
+            samplerate,
+            blocksize,
+            channels,
+            callback,
+            finished_callback,
+            duplex=True,
+            dtype=dtype,
+        )
+
+
+BACKENDS = {
+    SoundDeviceBackend.NAME: SoundDeviceBackend,
+    VirtualBackend.NAME: VirtualBackend,
+}
+
+
+def get_backend(name: str, config: dict | None = None) -> Backend:
+    if name not in BACKENDS:
+        raise ValueError(f"Invalid backend: {name}. Must be one of {list(BACKENDS.keys())}")
+    if name == VirtualBackend.NAME:
+        return VirtualBackend(config)
+    return BACKENDS[name]()
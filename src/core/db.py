@@ -25,6 +25,21 @@ class ForgeDB:
         with open(Path(cls.FORGE_DIR, "db.json"), "w") as fp:
             json.dump(db, fp, indent=4)
 
+    # probed device capabilities are kept out of db.json so it stays readable
+    @classmethod
+    def _read_devices(cls) -> dict:
+        devices_path = Path(cls.FORGE_DIR, "devices.json")
+        if not devices_path.exists():
+            return {}
+        with open(devices_path, "r") as fp:
+            devices = json.load(fp)
+        return devices
+
+    @classmethod
+    def _write_devices(cls, devices: dict) -> None:
+        with open(Path(cls.FORGE_DIR, "devices.json"), "w") as fp:
+            json.dump(devices, fp, indent=4)
+
     def __init__(
         self,
         overwrite: bool = False,
@@ -70,3 +85,12 @@ class ForgeDB:
         db = self._read_db()
         db["interface"] = interface
         self._write_db(db)
+
+    def get_device(self, key: str) -> dict | None:
+        devices = self._read_devices()
+        return devices.get(key, None)
+
+    def set_device(self, key: str, capabilities: dict) -> None:
+        devices = self._read_devices()
+        devices[key] = capabilities
+        self._write_devices(devices)
@@ -1,22 +1,30 @@
-import sounddevice as sd
-
-
 class AudioInterface:
-    device: int
+    backend: str
+    virtual: dict
     blocksize: int
+    dtype: str
+    latency: str | float | None
+    round_trip_latency: int | None
     num_sends: int
     num_returns: int
     send_calibrated: bool
     return_calibrated: bool
     send_level_dbu: float
+    send_levels_dbu: list[float | None] | None
     return_levels_dbu: list[float]
 
     INIT_SETTINGS = {
-        "device": sd.default.device[1],
+        "backend": "sounddevice",
+        "virtual": None,
+        "device": None,
         "blocksize": 512,
+        "dtype": "int24",
+        "latency": None,
+        "round_trip_latency": None,
         "send_channel": 1,
         "return_channels": 1,
         "send_level_dbu": None,
+        "send_levels_dbu": None,
         "return_levels_dbu": None,
     }
 
@@ -28,30 +36,57 @@ class AudioInterface:
             super().__init__(self.message)
 
     def __init__(self, config: dict):
-        self.device = config["device"]
+        self.backend = config.get("backend", "sounddevice")
+        # settings for the virtual loopback device when running without audio hardware
+        self.virtual = config.get("virtual", None)
+        # None selects the default output device, which is only looked up once it's needed
+        self._device = config["device"]
         self.blocksize = config["blocksize"]
+        # stream sample format, int24 streams packed bytes, int32 and float32 let portaudio convert into numpy buffers
+        self.dtype = config.get("dtype", "int24")
+        # portaudio suggested latency, "low", "high" or seconds. None uses the backend default
+        self.latency = config.get("latency", None)
+        # measured send to return latency in frames, set by forge-interface tune
+        self.round_trip_latency = config.get("round_trip_latency", None)
         self.num_sends = config["send_channel"]
         self.num_returns = config["return_channels"]
 
-        self.send_calibrated = config["send_level_dbu"] is not None
+        self.send_calibrated = config["send_level_dbu"] is not None or config.get("send_levels_dbu") is not None
         self.return_calibrated = config["return_levels_dbu"] is not None
 
         # calibration values
         # the level (dBu) being sent from the interface to the gear corresponding to a 1kHz sine wave with 0dBFS peak
         self.send_level_dbu = config.get("send_level_dbu", 0.0)
+        # optional per output levels like above, outputs without their own level fall back to send_level_dbu
+        self.send_levels_dbu = config.get("send_levels_dbu", None)
         # an array of levels like above that correspond to the return channels
-        self.return_levels_dbu = config.get("return_levels_dbu", [0.0 for _ in range(self.num_returns)])
+        # uncalibrated interfaces store None, the levels are filled in channel by channel
+        self.return_levels_dbu = config.get("return_levels_dbu") or [0.0 for _ in range(self.num_returns)]
 
     def get_config(self) -> dict:
         return {
-            "device": self.device,
+            "backend": self.backend,
+            "virtual": self.virtual,
+            "device": self._device,
             "blocksize": self.blocksize,
+            "dtype": self.dtype,
+            "latency": self.latency,
+            "round_trip_latency": self.round_trip_latency,
             "send_channel": self.num_sends,
             "return_channels": self.num_returns,
             "send_level_dbu": self.send_level_dbu if self.send_calibrated else None,
+            "send_levels_dbu": self.send_levels_dbu if self.send_calibrated else None,
             "return_levels_dbu": self.return_levels_dbu if self.return_calibrated else None,
         }
 
+    @property
+    def device(self) -> int | None:
+        if self._device is None and self.backend == "sounddevice":
+            import sounddevice as sd
+
+            self._device = sd.default.device[1]
+        return self._device
+
     def set_send_calibrated(self, calibrated: bool = True):
         self.send_calibrated = calibrated
 
@@ -62,8 +97,14 @@ class AudioInterface:
         self,
         measured_send_level_dbu: float,
         send_level_dbfs: float = 0.0,
+        channel: int | None = None,
     ):
-        self.send_level_dbu = measured_send_level_dbu - send_level_dbfs
+        if channel is None:
+            self.send_level_dbu = measured_send_level_dbu - send_level_dbfs
+            return
+        if self.send_levels_dbu is None:
+            self.send_levels_dbu = [None for _ in range(self.num_sends)]
+        self.send_levels_dbu[channel - 1] = measured_send_level_dbu - send_level_dbfs
 
     def set_return_level_dbu(
         self,
@@ -74,17 +115,22 @@ class AudioInterface:
         send_level_dbu = self.send_dbfs_to_dbu(send_level_dbfs)
         self.return_levels_dbu[channel] = send_level_dbu - return_level_dbfs
 
-    # Convert send level dBu to dBFS
-    def send_dbu_to_dbfs(self, send_level_dbu: float) -> float:
+    # Calibrated send level for the given output channel, or the default send when no channel is given
+    def get_send_level_dbu(self, channel: int | None = None) -> float:
+        if channel is not None and self.send_levels_dbu is not None:
+            if self.send_levels_dbu[channel - 1] is not None:
+                return self.send_levels_dbu[channel - 1]
         if self.send_level_dbu is None:
             raise RuntimeError("send levels not set. exitting...")
-        return send_level_dbu - self.send_level_dbu
+        return self.send_level_dbu
+
+    # Convert send level dBu to dBFS
+    def send_dbu_to_dbfs(self, send_level_dbu: float, channel: int | None = None) -> float:
+        return send_level_dbu - self.get_send_level_dbu(channel)
 
     # Convert send level dBFS to dBu
-    def send_dbfs_to_dbu(self, send_level_dbfs: float) -> float:
-        if self.send_level_dbu is None:
-            raise RuntimeError("send levels not set. exitting...")
-        return send_level_dbfs + self.send_level_dbu
+    def send_dbfs_to_dbu(self, send_level_dbfs: float, channel: int | None = None) -> float:
+        return send_level_dbfs + self.get_send_level_dbu(channel)
 
     # Convert return level dBu to dBFS for the given channel
     def return_dbu_to_dbfs(
@@ -0,0 +1,168 @@
+import sys
+import threading
+
+import numpy as np
+from numpy import typing as npt
+
+from core.audio import MAX_VAL_INT24
+
+
+class LevelMeter:
+    channels: int
+    sequence: int
+
+    peak: npt.NDArray[np.int32]
+    window_peak: npt.NDArray[np.int32]
+    mean_square: npt.NDArray[np.float64]
+    max_peak: npt.NDArray[np.int32]
+    clips: npt.NDArray[np.int64]
+
+    def __init__(self, channels: int, blocksize: int):
+        self.channels = channels
+        # the audio callback publishes into these buffers, nothing is allocated per block
+        self.peak = np.zeros(channels, dtype=np.int32)
+        self.window_peak = np.zeros(channels, dtype=np.int32)
+        self.mean_square = np.zeros(channels, dtype=np.float64)
+        self.max_peak = np.zeros(channels, dtype=np.int32)
+        self.clips = np.zeros(channels, dtype=np.int64)
+        self._allocate(blocksize)
+        self.sequence = 0
+
+    def _allocate(self, blocksize: int) -> None:
+        self._abs = np.zeros((blocksize, self.channels), dtype=np.int32)
+        self._square = np.zeros((blocksize, self.channels), dtype=np.float64)
+        self._clipped = np.zeros((blocksize, self.channels), dtype=bool)
+        self._clip_counts = np.zeros((blocksize, self.channels), dtype=np.int32)
+        self._block_clips = np.zeros(self.channels, dtype=np.int32)
+
+    def reset(self) -> None:
+        self.peak[:] = 0
+        self.window_peak[:] = 0
+        self.mean_square[:] = 0
+        self.max_peak[:] = 0
+        self.clips[:] = 0
+        self.sequence = 0
+
+    # called from the audio callback with the block of return samples
+    def publish(self, block: npt.NDArray[np.int32]) -> None:
+        frames = len(block)
+        if frames == 0:
+            return
+        if frames > len(self._abs):
+            self._allocate(frames)
+
+        magnitude = self._abs[:frames]
+        np.abs(block, out=magnitude)
+        np.max(magnitude, axis=0, out=self.peak)
+        np.maximum(self.window_peak, self.peak, out=self.window_peak)
+        np.maximum(self.max_peak, self.peak, out=self.max_peak)
+
+        # mixed dtype ufuncs and reductions cast through temporary buffers the size of the block,
+        # so samples are converted into the preallocated buffers first and reduced in their own dtype
+        square = self._square[:frames]
+        np.copyto(square, block)
+        np.multiply(square, square, out=square)
+        np.mean(square, axis=0, out=self.mean_square)
+
+        np.greater_equal(magnitude, MAX_VAL_INT24, out=self._clipped[:frames])
+        np.copyto(self._clip_counts[:frames], self._clipped[:frames])
+        np.sum(self._clip_counts[:frames], axis=0, out=self._block_clips)
+        self.clips += self._block_clips
+
+        self.sequence += 1
+
+    # peak since the last read and rms of the latest block, read from the display thread
+    def read_levels(self) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+        window_peak = self.window_peak.copy()
+        self.window_peak[:] = 0
+        with np.errstate(divide="ignore"):
+            peak_dbfs = 20 * np.log10(window_peak / MAX_VAL_INT24)
+            rms_dbfs = 10 * np.log10(self.mean_square / MAX_VAL_INT24**2)
+        return peak_dbfs, rms_dbfs
+
+
+class MeterDisplay(threading.Thread):
+    FLOOR_DBFS = -60.0
+    WIDTH = 30
+
+    def __init__(
+        self,
+        meter: LevelMeter,
+        labels: list[str] | None = None,
+        status=None,
+        fps: float = 15.0,
+        decay_db_per_second: float = 20.0,
+        hold_seconds: float = 2.0,
+        rms_seconds: float = 0.3,
+        output=sys.stdout,
+    ):
+        super().__init__(daemon=True)
+        self.meter = meter
+        self.labels = labels if labels is not None else [str(i + 1) for i in range(meter.channels)]
+        # optional callable returning text shown before the meters, e.g. the capture position
+        self.status = status
+        self.interval = 1 / fps
+        self.decay = decay_db_per_second * self.interval
+        self.hold_frames = int(hold_seconds * fps)
+        self.rms_coefficient = min(self.interval / rms_seconds, 1.0)
+        self.output = output
+
+        self.peak = np.full(meter.channels, self.FLOOR_DBFS)
+        self.rms = np.full(meter.channels, self.FLOOR_DBFS)
+        self.hold = np.full(meter.channels, self.FLOOR_DBFS)
+        self.hold_age = np.zeros(meter.channels, dtype=np.int64)
+
+        self._halt = threading.Event()
+
+    def __enter__(self) -> "MeterDisplay":
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def stop(self) -> None:
+        self._halt.set()
+        if self.is_alive():
+            self.join()
+        self.output.write("\n")
+        self.output.flush()
+
+    def _update(self) -> None:
+        peak_dbfs, rms_dbfs = self.meter.read_levels()
+        peak_dbfs = np.maximum(peak_dbfs, self.FLOOR_DBFS)
+        rms_dbfs = np.maximum(rms_dbfs, self.FLOOR_DBFS)
+
+        # instant attack with a linear release in dB
+        self.peak = np.maximum(peak_dbfs, self.peak - self.decay)
+        self.rms += self.rms_coefficient * (rms_dbfs - self.rms)
+
+        held = (self.peak >= self.hold) | (self.hold_age >= self.hold_frames)
+        self.hold = np.where(held, self.peak, self.hold)
+        self.hold_age = np.where(held, 0, self.hold_age + 1)
+
+    def _bar(self, peak: float, rms: float, hold: float) -> str:
+        scale = self.WIDTH / -self.FLOOR_DBFS
+        peak_width = int((peak - self.FLOOR_DBFS) * scale)
+        rms_width = min(int((rms - self.FLOOR_DBFS) * scale), peak_width)
+        hold_index = min(int((hold - self.FLOOR_DBFS) * scale), self.WIDTH - 1)
+        bar = ["#"] * rms_width + ["="] * (peak_width - rms_width) + [" "] * (self.WIDTH - peak_width)
+        if hold > self.FLOOR_DBFS:
+            bar[hold_index] = "|"
+        return "".join(bar)
+
+    def render(self) -> str:
+        meters = []
+        for i, label in enumerate(self.labels):
+            clip = "CLIP" if self.meter.clips[i] > 0 else "    "
+            meters.append(f"{label} [{self._bar(self.peak[i], self.rms[i], self.hold[i])}] {self.hold[i]:6.1f} {clip}")
+        line = " ".join(meters)
+        if self.status is not None:
+            line = f"{self.status()} {line}"
+        return line
+
+    def run(self) -> None:
+        while not self._halt.wait(self.interval):
+            self._update()
+            self.output.write("\r" + self.render())
+            self.output.flush()
@@ -1,6 +1,72 @@
+from pathlib import Path
+
 import numpy as np
 import numpy.typing as npt
-import matplotlib.pyplot as plt
+
+from core.audio import MAX_VAL_INT24
+
+
+PLOT_SECONDS = 5
+# plots are decimated to about one min/max pair per pixel column
+PLOT_WIDTH = 1600
+PLOT_DPI = 100
+ONSET_FRAMES = 512
+LEVEL_WINDOW_SECONDS = 0.05
+SPECTRUM_SIZE = 2**14
+MAX_SPECTRUM_SEGMENTS = 64
+BLOCKSIZE = 2**16
+
+
+# matplotlib is only imported when plotting, headless plots render with agg so no display is needed
+def _pyplot(headless: bool = False):
+    import matplotlib
+
+    if headless:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+# min and max of each column of samples, peaks survive decimation unlike plain striding
+def envelope(
+    data: npt.NDArray,
+    width: int = PLOT_WIDTH,
+) -> tuple[npt.NDArray[np.int64], npt.NDArray, npt.NDArray]:
+    data = np.asarray(data)
+    if len(data) <= 2 * width:
+        return np.arange(len(data)), data, data
+
+    step = -(-len(data) // width)
+    columns = len(data) // step
+    blocks = data[: columns * step].reshape(columns, step, *data.shape[1:])
+    mins = blocks.min(axis=1)
+    maxs = blocks.max(axis=1)
+    if columns * step < len(data):
+        tail = data[columns * step :]
+        mins = np.concatenate([mins, tail.min(axis=0, keepdims=True)])
+        maxs = np.concatenate([maxs, tail.max(axis=0, keepdims=True)])
+    return np.arange(len(mins)) * step, mins, maxs
+
+
+# peak of an envelope, taken from the decimated data instead of another pass over the samples
+def _envelope_peak(mins: npt.NDArray, maxs: npt.NDArray) -> float:
+    return max(-float(np.min(mins, initial=0)), float(np.max(maxs, initial=0))) or 1.0
+
+
+# plots the envelope scaled to +-1 of peak (its own peak by default), returns the peak
+def _plot_envelope(
+    ax, data: npt.NDArray, width: int, samplerate: int, offset: int = 0, peak: float | None = None, **kwargs
+) -> float:
+    x, mins, maxs = envelope(data, width)
+    if peak is None:
+        peak = _envelope_peak(mins, maxs)
+    seconds = (x + offset) / samplerate
+    if len(x) == len(data):
+        ax.plot(seconds, mins / peak, linewidth=0.8, **kwargs)
+    else:
+        ax.fill_between(seconds, mins / peak, maxs / peak, linewidth=0, alpha=0.5, step="post", **kwargs)
+    return peak
 
 
 def plot_latency(
@@ -12,24 +78,173 @@ def plot_latency(
     channel_delays: list[int],
     channel_inversions: list[bool],
 ) -> None:
-    samples = samplerate * 5
-    plt.figure(figsize=(16, 5))
-    plt.plot(
-        np.divide(send_audio[:samples], np.max(send_audio[:samples])),
-        label="reamp",
-    )
-    plt.plot(
-        np.divide(return_audio[:samples, channel], np.max(return_audio[:samples, channel])),
-        linestyle="--",
-        label="raw recording",
-    )
-    plt.plot(
-        np.divide(processed_return_audio[:samples, channel], np.max(processed_return_audio[:samples, channel])),
-        linestyle="-.",
-        label="processed recording",
-    )
-    plt.title(
+    plt = _pyplot()
+    samples = samplerate * PLOT_SECONDS
+    fig, ax = plt.subplots(figsize=(16, 5))
+    _plot_envelope(ax, send_audio[:samples].reshape(-1), PLOT_WIDTH, samplerate, label="reamp")
+    _plot_envelope(ax, return_audio[:samples, channel], PLOT_WIDTH, samplerate, label="raw recording")
+    _plot_envelope(ax, processed_return_audio[:samples, channel], PLOT_WIDTH, samplerate, label="processed recording")
+    ax.set_title(
         f"channel={channel} | base delay={channel_delays[0]} | channel_delay={channel_delays[channel]} | invert={channel_inversions[channel]}"
     )
-    plt.legend()
+    ax.legend()
     plt.show(block=True)
+
+
+def _save(plt, fig, path: Path) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(path, dpi=PLOT_DPI)
+    plt.close(fig)
+    return path
+
+
+# overview of the start of the capture and a sample level zoom on the first onset, per channel
+def save_alignment_plot(
+    path: Path,
+    samplerate: int,
+    send_audio,
+    return_audio,
+    processed_audio,
+    channels: list[str],
+    alignment: dict,
+    onset: int = 0,
+) -> Path:
+    plt = _pyplot(headless=True)
+    samples = samplerate * PLOT_SECONDS
+    zoom = slice(max(onset - ONSET_FRAMES // 4, 0), onset + ONSET_FRAMES)
+
+    fig, axes = plt.subplots(
+        len(channels),
+        2,
+        figsize=(PLOT_WIDTH / PLOT_DPI, 3 * len(channels)),
+        squeeze=False,
+        gridspec_kw={"width_ratios": [3, 1]},
+    )
+    series = [
+        ("reamp", lambda frames, i: send_audio[frames, 0]),
+        ("raw recording", lambda frames, i: return_audio[frames, i]),
+        ("processed", lambda frames, i: processed_audio[frames, i]),
+    ]
+    for i, channel in enumerate(channels):
+        overview, detail = axes[i]
+        for label, audio in series:
+            # the zoom shares the overview scale so a silent stretch isn't blown up to full height
+            peak = _plot_envelope(overview, audio(slice(0, samples), i), PLOT_WIDTH * 3 // 4, samplerate, label=label)
+            _plot_envelope(detail, audio(zoom, i), ONSET_FRAMES * 2, samplerate, zoom.start, peak, label=label)
+        overview.set_ylim(-1.05, 1.05)
+        detail.set_ylim(-1.05, 1.05)
+        overview.set_title(
+            f"{channel} | delay={alignment['channel_delays'][i]} | invert={alignment['channel_inversions'][i]}"
+        )
+        overview.set_xlabel("seconds")
+        detail.set_title("first onset")
+        detail.set_xlabel("seconds")
+    axes[0][0].legend(loc="upper right")
+    fig.tight_layout()
+    return _save(plt, fig, path)
+
+
+# rms level in dBFS of consecutive windows, read block by block so long captures aren't loaded at once
+def windowed_levels(audio, samplerate: int, window_seconds: float = LEVEL_WINDOW_SECONDS) -> npt.NDArray[np.float64]:
+    window = max(int(samplerate * window_seconds), 1)
+    blocksize = max(BLOCKSIZE // window, 1) * window
+    levels = []
+    for start in range(0, len(audio) - window + 1, blocksize):
+        block = np.asarray(audio[start : start + blocksize], dtype=np.float64)
+        if block.ndim == 1:
+            block = block.reshape(-1, 1)
+        windows = len(block) // window
+        block = block[: windows * window].reshape(windows, window, -1)
+        levels.append(np.sqrt(np.mean(block * block, axis=1)))
+    if len(levels) == 0:
+        return np.zeros((0, np.shape(audio)[1] if len(np.shape(audio)) > 1 else 1))
+    with np.errstate(divide="ignore"):
+        return 20 * np.log10(np.concatenate(levels) / MAX_VAL_INT24)
+
+
+def save_level_plot(
+    path: Path,
+    samplerate: int,
+    send_audio,
+    processed_audio,
+    channels: list[str],
+    floor_dbfs: float = -90.0,
+) -> Path:
+    plt = _pyplot(headless=True)
+    send_levels = windowed_levels(send_audio, samplerate)
+    return_levels = windowed_levels(processed_audio, samplerate)
+
+    fig, ax = plt.subplots(figsize=(PLOT_WIDTH / PLOT_DPI, 5))
+    for levels, labels, style in ((send_levels, ["reamp"], "--"), (return_levels, channels, "-")):
+        # levels already have one point per window, decimate further only if there are more windows than pixels
+        x, mins, maxs = envelope(np.maximum(levels, floor_dbfs), PLOT_WIDTH)
+        seconds = x * LEVEL_WINDOW_SECONDS
+        for i, label in enumerate(labels[: levels.shape[1]]):
+            if len(x) == len(levels):
+                ax.plot(seconds, maxs[:, i], linestyle=style, linewidth=0.8, label=label)
+            else:
+                # a band from the quietest to the loudest window in each column, so dropouts stay visible
+                ax.fill_between(
+                    seconds, mins[:, i], maxs[:, i], linestyle=style, linewidth=0.8, alpha=0.5, step="post", label=label
+                )
+    ax.set_ylim(floor_dbfs, 0)
+    ax.set_xlabel("seconds")
+    ax.set_ylabel("rms dBFS")
+    ax.set_title(f"levels ({LEVEL_WINDOW_SECONDS * 1000:.0f} ms windows)")
+    ax.grid(alpha=0.3)
+    ax.legend(loc="lower right")
+    fig.tight_layout()
+    return _save(plt, fig, path)
+
+
+# averaged magnitude spectrum in dBFS from hann windowed segments spread over the audio
+def spectrum(
+    audio,
+    samplerate: int,
+    size: int = SPECTRUM_SIZE,
+    max_segments: int = MAX_SPECTRUM_SEGMENTS,
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    channels = np.shape(audio)[1] if len(np.shape(audio)) > 1 else 1
+    freqs = np.fft.rfftfreq(size, 1 / samplerate)
+    power = np.zeros((len(freqs), channels))
+    window = np.hanning(size)
+    starts = np.linspace(0, max(len(audio) - size, 0), num=min(max(len(audio) // size, 1), max_segments), dtype=np.int64)
+    for start in starts:
+        segment = np.zeros((size, channels))
+        data = np.asarray(audio[start : start + size], dtype=np.float64).reshape(-1, channels)
+        segment[: len(data)] = data
+        magnitude = np.abs(np.fft.rfft(segment * window[:, None], axis=0))
+        power += magnitude * magnitude
+    # full scale sine reads 0 dBFS
+    magnitude = np.sqrt(power / len(starts)) * 2 / np.sum(window) / MAX_VAL_INT24
+    with np.errstate(divide="ignore"):
+        return freqs, 20 * np.log10(magnitude)
+
+
+def save_spectrum_plot(
+    path: Path,
+    samplerate: int,
+    send_audio,
+    processed_audio,
+    channels: list[str],
+    floor_dbfs: float = -140.0,
+) -> Path:
+    plt = _pyplot(headless=True)
+    fig, ax = plt.subplots(figsize=(PLOT_WIDTH / PLOT_DPI, 5))
+    for audio, labels, style in ((send_audio, ["reamp"], "--"), (processed_audio, channels, "-")):
+        freqs, levels = spectrum(audio, samplerate)
+        # the dc bin has no place on a log axis
+        levels = np.maximum(levels[1:], floor_dbfs)
+        for i, label in enumerate(labels[: levels.shape[1]]):
+            ax.plot(freqs[1:], levels[:, i], linestyle=style, linewidth=0.8, label=label)
+    ax.set_xscale("log")
+    ax.set_xlim(20, samplerate / 2)
+    ax.set_ylim(floor_dbfs, 0)
+    ax.set_xlabel("Hz")
+    ax.set_ylabel("dBFS")
+    ax.set_title("spectrum")
+    ax.grid(alpha=0.3, which="both")
+    ax.legend(loc="lower left")
+    fig.tight_layout()
+    return _save(plt, fig, path)
@@ -0,0 +1,137 @@
+from core.db import ForgeDB
+from core.interface import AudioInterface
+
+
+SAMPLERATES = [32000, 44100, 48000, 88200, 96000, 128000, 192000]  # Hz
+DTYPES = ["int16", "int24", "int32", "float32"]
+BLOCKSIZES = [32, 64, 128, 256, 512, 1024, 2048, 4096]  # frames
+
+
+def _check(check, **kwargs) -> bool:
+    try:
+        check(**kwargs)
+    except Exception:
+        return False
+    return True
+
+
+# devices are identified by host api, name and channel counts since portaudio device ids change between boots
+def device_key(device_info: dict, hostapi_name: str) -> str:
+    return (
+        f"{hostapi_name}:{device_info['name']}:"
+        f"{device_info['max_input_channels']}:{device_info['max_output_channels']}"
+    )
+
+
+def probe_device(device: int) -> dict:
+    import sounddevice as sd
+
+    info = dict(sd.query_devices(device))
+    hostapi_name = sd.query_hostapis(info["hostapi"])["name"]
+    num_inputs = info["max_input_channels"]
+    num_outputs = info["max_output_channels"]
+
+    capabilities = {
+        "key": device_key(info, hostapi_name),
+        "name": info["name"],
+        "hostapi": hostapi_name,
+        "max_input_channels": num_inputs,
+        "max_output_channels": num_outputs,
+        "default_samplerate": info["default_samplerate"],
+        "input_samplerates": [],
+        "output_samplerates": [],
+        "input_dtypes": [],
+        "output_dtypes": [],
+        "blocksizes": {},
+    }
+
+    for samplerate in SAMPLERATES:
+        if num_inputs > 0 and _check(sd.check_input_settings, device=device, samplerate=samplerate):
+            capabilities["input_samplerates"].append(samplerate)
+        if num_outputs > 0 and _check(sd.check_output_settings, device=device, samplerate=samplerate):
+            capabilities["output_samplerates"].append(samplerate)
+
+    for dtype in DTYPES:
+        if num_inputs > 0 and _check(sd.check_input_settings, device=device, dtype=dtype):
+            capabilities["input_dtypes"].append(dtype)
+        if num_outputs > 0 and _check(sd.check_output_settings, device=device, dtype=dtype):
+            capabilities["output_dtypes"].append(dtype)
+
+    # open (but don't start) a stream per block size to see which ones portaudio accepts and the latency it reports
+    channels = (min(num_inputs, 1), min(num_outputs, 1))
+    for blocksize in BLOCKSIZES:
+        try:
+            if channels[0] > 0 and channels[1] > 0:
+                stream = sd.RawStream(device=device, channels=channels, blocksize=blocksize, dtype="int24")
+                input_latency, output_latency = stream.latency
+            elif channels[1] > 0:
+                stream = sd.RawOutputStream(device=device, channels=channels[1], blocksize=blocksize, dtype="int24")
+                input_latency, output_latency = None, stream.latency
+            else:
+                stream = sd.RawInputStream(device=device, channels=channels[0], blocksize=blocksize, dtype="int24")
+                input_latency, output_latency = stream.latency, None
+            stream.close()
+        except Exception:
+            continue
+        capabilities["blocksizes"][str(blocksize)] = {
+            "input_latency": input_latency,
+            "output_latency": output_latency,
+        }
+
+    return capabilities
+
+
+def get_capabilities(db: ForgeDB, device: int, refresh: bool = False) -> dict:
+    import sounddevice as sd
+
+    info = dict(sd.query_devices(device))
+    key = device_key(info, sd.query_hostapis(info["hostapi"])["name"])
+
+    capabilities = None if refresh else db.get_device(key)
+    if capabilities is None:
+        capabilities = probe_device(device)
+        db.set_device(key, capabilities)
+    return capabilities
+
+
+def validate_config(
+    capabilities: dict,
+    samplerate: int,
+    blocksize: int,
+    num_sends: int,
+    num_returns: int,
+    dtype: str = "int24",
+) -> None:
+    errors = []
+    if num_sends > capabilities["max_output_channels"]:
+        errors.append(f"{num_sends} sends requested, device has {capabilities['max_output_channels']} outputs")
+    if num_returns > capabilities["max_input_channels"]:
+        errors.append(f"{num_returns} returns requested, device has {capabilities['max_input_channels']} inputs")
+    if num_sends > 0 and samplerate not in capabilities["output_samplerates"]:
+        errors.append(f"samplerate {samplerate} not supported on outputs")
+    if num_returns > 0 and samplerate not in capabilities["input_samplerates"]:
+        errors.append(f"samplerate {samplerate} not supported on inputs")
+    if num_sends > 0 and dtype not in capabilities["output_dtypes"]:
+        errors.append(f"dtype {dtype} not supported on outputs")
+    if num_returns > 0 and dtype not in capabilities["input_dtypes"]:
+        errors.append(f"dtype {dtype} not supported on inputs")
+    if blocksize in BLOCKSIZES and str(blocksize) not in capabilities["blocksizes"]:
+        errors.append(f"blocksize {blocksize} not supported")
+
+    if len(errors) > 0:
+        raise ValueError(f"interface config not supported by {capabilities['name']}: " + ", ".join(errors))
+
+
+# only hardware interfaces are probed, the virtual backend accepts any config
+def validate_interface(db: ForgeDB, interface: AudioInterface, samplerate: int, num_returns: int | None = None) -> None:
+    if interface.backend != "sounddevice":
+        return
+    capabilities = get_capabilities(db, interface.device)
+    validate_config(
+        capabilities,
+        samplerate,
+        interface.blocksize,
+        interface.num_sends,
+        interface.num_returns if num_returns is None else num_returns,
+        interface.dtype,
+    )
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import time
+
+import numpy as np
+from numpy import typing as npt
+
+from core.audio import MAX_VAL_INT24, db_to_scalar
+from core.storage import open_reader
+from core.util import FORGE_DIR, file_lock, find_forge_dir, hash, read_config, unique_tmp_path, write_config_atomic
+from core.wave import PackedWave
+from core.wavfile import encode_pcm
+
+
+SEND_CACHE_NAME = "cache"
+INDEX_NAME = "index"
+SEND_CACHE_MAX_BYTES = 4 * 2**30
+SAMPWIDTH = 3
+BLOCKSIZE = 2**18
+
+
+# the cache belongs to the forge project path is in (the working directory's by default), so a run from a
+# subdirectory of the project uses the same cache
+def send_cache_dir(path: Path | None = None) -> Path:
+    forge_dir = find_forge_dir(Path.cwd() if path is None else path)
+    return Path(forge_dir if forge_dir is not None else FORGE_DIR, SEND_CACHE_NAME)
+
+
+# Send buffers for an input at a level and samplerate, scaled and packed as raw int24 once so
+# later captures memmap them instead of decoding and rescaling the input again
+class SendCache:
+    cache_dir: Path
+    max_bytes: int
+
+    def __init__(self, cache_dir: Path | None = None, max_bytes: int = SEND_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else send_cache_dir()
+        self.max_bytes = max_bytes
+        self.index_path = Path(self.cache_dir, INDEX_NAME + ".json")
+
+    @staticmethod
+    def key(input_hash: str, level_dbfs: float, samplerate: int) -> str:
+        # levels are rounded so float noise from dBu conversions doesn't miss the cache
+        return hashlib.sha256(f"{input_hash}:{level_dbfs:.6f}:{samplerate}:int24".encode()).hexdigest()[:32]
+
+    def path(self, key: str) -> Path:
+        return Path(self.cache_dir, key + ".pcm")
+
+    def _read_index(self) -> dict:
+        if not self.index_path.exists():
+            return {}
+        try:
+            return read_config(self.index_path)
+        except json.JSONDecodeError:
+            return {}
+
+    def _write_index(self, index: dict) -> None:
+        write_config_atomic(self.cache_dir, index, INDEX_NAME)
+
+    # drop least recently used buffers until the cache fits in the budget, keep is never evicted
+    def _evict(self, index: dict, keep: str | None = None) -> None:
+        total = sum(entry["size"] for entry in index.values())
+        for key in sorted(index, key=lambda key: index[key]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self.path(key).unlink(missing_ok=True)
+            total -= index.pop(key)["size"]
+
+    def _build(self, input_path: Path, level_dbfs: float, path: Path) -> int:
+        scalar = db_to_scalar(level_dbfs)
+        tmp_path = unique_tmp_path(path)
+        with open_reader(input_path) as reader, open(tmp_path, "wb") as fp:
+            for start in range(0, len(reader), BLOCKSIZE):
+                # the same scaling as Wave and clipping as Stream.render, so cached and uncached sends are bit-exact
+                block = (reader[start : start + BLOCKSIZE, 0] * scalar).astype(np.int32)
+                np.clip(block, -MAX_VAL_INT24 - 1, MAX_VAL_INT24, out=block)
+                fp.write(encode_pcm(block, SAMPWIDTH))
+            frames = len(reader)
+        os.replace(tmp_path, path)
+        return frames
+
+    def get(self, input_path: Path, level_dbfs: float, samplerate: int) -> tuple[Path, int]:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        input_hash = hash(input_path)
+        key = self.key(input_hash, level_dbfs, samplerate)
+        path = self.path(key)
+
+        # runs that share the cache take turns, so neither drops the other's entries or evicts a buffer
+        # the other just built
+        with file_lock(Path(self.cache_dir, INDEX_NAME + ".lock")):
+            index = self._read_index()
+            entry = index.get(key)
+            if entry is None or not path.exists() or path.stat().st_size != entry["size"]:
+                frames = self._build(input_path, level_dbfs, path)
+                entry = {
+                    "input": input_hash,
+                    "level_dbfs": level_dbfs,
+                    "samplerate": samplerate,
+                    "frames": frames,
+                    "size": path.stat().st_size,
+                }
+            index[key] = entry | {"last_used": time.time()}
+            self._evict(index, keep=key)
+            self._write_index(index)
+        return path, entry["frames"]
+
+    def wave(self, input_path: Path, level_dbfs: float, samplerate: int) -> PackedWave:
+        path, frames = self.get(input_path, level_dbfs, samplerate)
+        # empty files can't be memmapped
+        packed: npt.NDArray[np.uint8] = (
+            np.memmap(path, dtype=np.uint8, mode="r", shape=(frames, SAMPWIDTH))
+            if frames > 0
+            else np.zeros((0, SAMPWIDTH), dtype=np.uint8)
+        )
+        return PackedWave(packed, samplerate, level_dbfs)
+
+    def clear(self) -> None:
+        for key in self._read_index():
+            self.path(key).unlink(missing_ok=True)
+        self.index_path.unlink(missing_ok=True)
@@ -0,0 +1,274 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import operator
+from pathlib import Path
+
+import numpy as np
+from numpy import typing as npt
+
+from core.wavfile import WavReader, WavWriter
+
+
+# soundfile (libsndfile) is an optional dependency, only compressed formats need it
+def _soundfile():
+    try:
+        import soundfile
+    except ImportError:
+        raise RuntimeError("flac storage requires soundfile, install it with: pip install forge_cli[flac]") from None
+    return soundfile
+
+
+FLAC_SUBTYPES = {1: "PCM_S8", 2: "PCM_16", 3: "PCM_24"}
+
+
+class FlacReader:
+    path: Path
+    samplerate: int
+    channels: int
+    sampwidth: int
+    frames: int
+
+    def __init__(self, path: Path):
+        sf = _soundfile()
+        self.path = Path(path)
+        # flac frames are indexed by a seek table, so slices only decode the blocks they cover
+        self.file = sf.SoundFile(self.path)
+        self.samplerate = self.file.samplerate
+        self.channels = self.file.channels
+        self.frames = self.file.frames
+        self.sampwidth = next((width for width, subtype in FLAC_SUBTYPES.items() if subtype == self.file.subtype), 3)
+
+    def __len__(self) -> int:
+        return self.frames
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return (self.frames, self.channels)
+
+    def _read(self, start: int, stop: int) -> npt.NDArray[np.int32]:
+        self.file.seek(start)
+        # libsndfile returns left justified int32 samples
+        data = self.file.read(max(stop - start, 0), dtype="int32", always_2d=True)
+        data >>= 32 - 8 * self.sampwidth
+        return data
+
+    def __getitem__(self, key) -> npt.NDArray[np.int32]:
+        if isinstance(key, tuple):
+            rows, columns = key
+        else:
+            rows, columns = key, slice(None)
+        # numpy integers index like ints
+        if not isinstance(rows, slice):
+            rows = operator.index(rows)
+            row = rows + self.frames if rows < 0 else rows
+            return self._read(row, row + 1)[0, columns]
+        start, stop, step = rows.indices(self.frames)
+        return self._read(start, stop)[::step, columns]
+
+    def read(self, start: int = 0, stop: int | None = None) -> npt.NDArray[np.int32]:
+        return self[start:stop]
+
+    def __enter__(self) -> "FlacReader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class FlacWriter:
+    path: Path
+    samplerate: int
+    channels: int
+    sampwidth: int
+    frames: int
+
+    CHUNK_FRAMES = 2**16
+
+    def __init__(
+        self,
+        path: Path,
+        samplerate: int,
+        channels: int,
+        sampwidth: int = 3,
+    ):
+        sf = _soundfile()
+        if sampwidth not in FLAC_SUBTYPES:
+            raise ValueError(f"unsupported sample width for flac: {sampwidth}")
+        self.path = Path(path)
+        self.samplerate = samplerate
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self.frames = 0
+
+        self.file = sf.SoundFile(
+            self.path,
+            "w",
+            samplerate=samplerate,
+            channels=channels,
+            format="FLAC",
+            subtype=FLAC_SUBTYPES[sampwidth],
+        )
+
+    def __enter__(self) -> "FlacWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def write(self, data: npt.NDArray[np.int32]) -> None:
+        data = np.asarray(data)
+        if data.ndim == 1:
+            data = data.reshape((-1, 1))
+        if data.shape[1] != self.channels:
+            raise ValueError(f"expected {self.channels} channels, got {data.shape[1]}")
+        for start in range(0, data.shape[0], self.CHUNK_FRAMES):
+            chunk = data[start : start + self.CHUNK_FRAMES].astype(np.int32)
+            chunk <<= 32 - 8 * self.sampwidth
+            self.file.write(chunk)
+        self.frames += data.shape[0]
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.file.close()
+
+
+class Storage(ABC):
+    FORMAT: str
+    EXTENSION: str
+    CONTENT_TYPE: str
+
+    @abstractmethod
+    def reader(self, path: Path):
+        pass
+
+    @abstractmethod
+    def writer(self, path: Path, samplerate: int, channels: int, sampwidth: int = 3):
+        pass
+
+    def path(self, directory: Path, name: str) -> Path:
+        return Path(directory, name + self.EXTENSION)
+
+
+class WavStorage(Storage):
+    FORMAT = "wav"
+    EXTENSION = ".wav"
+    CONTENT_TYPE = "audio/wav"
+
+    def reader(self, path: Path) -> WavReader:
+        return WavReader(path)
+
+    def writer(self, path: Path, samplerate: int, channels: int, sampwidth: int = 3) -> WavWriter:
+        return WavWriter(path, samplerate, channels, sampwidth)
+
+
+class FlacStorage(Storage):
+    FORMAT = "flac"
+    EXTENSION = ".flac"
+    CONTENT_TYPE = "audio/flac"
+
+    def __init__(self):
+        # fail when the format is chosen rather than after a take has been recorded
+        _soundfile()
+
+    def reader(self, path: Path) -> FlacReader:
+        return FlacReader(path)
+
+    def writer(self, path: Path, samplerate: int, channels: int, sampwidth: int = 3) -> FlacWriter:
+        return FlacWriter(path, samplerate, channels, sampwidth)
+
+
+STORAGES = {
+    WavStorage.FORMAT: WavStorage,
+    FlacStorage.FORMAT: FlacStorage,
+}
+EXTENSIONS = {storage.EXTENSION: storage.FORMAT for storage in STORAGES.values()}
+CONTENT_TYPES = {storage.EXTENSION: storage.CONTENT_TYPE for storage in STORAGES.values()}
+
+
+def get_storage(format: str) -> Storage:
+    if format not in STORAGES:
+        raise ValueError(f"Invalid format: {format}. Must be one of {list(STORAGES.keys())}")
+    return STORAGES[format]()
+
+
+def storage_for_path(path: Path) -> Storage:
+    suffix = Path(path).suffix.lower()
+    if suffix not in EXTENSIONS:
+        raise ValueError(f"unsupported audio file: {path}")
+    return get_storage(EXTENSIONS[suffix])
+
+
+def open_reader(path: Path):
+    return storage_for_path(path).reader(path)
+
+
+def open_writer(path: Path, samplerate: int, channels: int, sampwidth: int = 3):
+    return storage_for_path(path).writer(path, samplerate, channels, sampwidth)
+
+
+# the file stored under name in any supported format, None if there isn't one
+def find_audio(directory: Path, name: str) -> Path | None:
+    for storage in STORAGES.values():
+        path = Path(directory, name + storage.EXTENSION)
+        if path.exists():
+            return path
+    return None
+
+
+# remove copies of a file left in other formats, e.g. after a capture is re-run with a new format
+def remove_other_formats(path: Path) -> None:
+    path = Path(path)
+    for storage in STORAGES.values():
+        other = path.with_suffix(storage.EXTENSION)
+        if other != path and other.exists():
+            other.unlink()
+
+
+# re-encode an audio file in another format block by block, returns the new path
+def encode_file(
+    path: Path,
+    format: str,
+    remove_source: bool = False,
+    blocksize: int = 2**18,
+) -> Path:
+    path = Path(path)
+    storage = get_storage(format)
+    output_path = path.with_suffix(storage.EXTENSION)
+    if output_path == path:
+        return path
+
+    with (
+        open_reader(path) as reader,
+        storage.writer(output_path, reader.samplerate, reader.channels, reader.sampwidth) as writer,
+    ):
+        for start in range(0, len(reader), blocksize):
+            writer.write(reader.read(start, start + blocksize))
+
+    if remove_source:
+        path.unlink()
+    return output_path
+
+
+# encoding is cpu bound, so files are spread over worker processes
+# returns the new paths of the encoded files and the errors of the ones that failed
+def encode_files(
+    paths: list[Path],
+    format: str,
+    max_workers: int | None = None,
+    remove_source: bool = False,
+) -> tuple[dict[Path, Path], dict[Path, Exception]]:
+    get_storage(format)
+    results = {}
+    failures = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(encode_file, path, format, remove_source): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                failures[path] = e
+    return results, failures
@@ -1,64 +1,261 @@
-import sys
+from abc import ABC, abstractmethod
+import math
 import threading
 
 import numpy as np
 from numpy import typing as npt
 
-import sounddevice as sd
-
-from core.audio import int24_to_dbfs
+from core.audio import MAX_VAL_INT24, db_to_scalar, int24_to_dbfs, int24_to_native, native_to_int24
+from core.backend import Backend, get_backend
 from core.interface import AudioInterface
-from core.wave import Wave, SineWave, SweepWave, AudioWave
+from core.meter import LevelMeter
+from core.telemetry import StreamTelemetry
+from core.wave import Wave, SineWave, SweepWave, AudioWave, PackedWave
+from core.wavfile import decode_pcm, encode_pcm
 
 
-class Stream:
+# one duplex stream kept running across takes, so the device is opened once per session and the
+# round trip latency stays the same from take to take
+# streams created with the engine run in its callback while entered, they're swapped in and out at block
+# boundaries and the outputs are silent in between
+class DuplexEngine:
     interface: AudioInterface
+    samplerate: int
+    backend: Backend
+    stream: object
+
+    def __init__(self, interface: AudioInterface, samplerate: int):
+        self.interface = interface
+        self.samplerate = samplerate
+        self.backend = get_backend(self.interface.backend, self.interface.virtual)
+        self._take = None
+        # only held to swap the take, never while processing a block
+        self._lock = threading.Lock()
+        self.stream = self.backend.open_duplex(
+            samplerate=samplerate,
+            blocksize=self.interface.blocksize,
+            device=self.interface.device,
+            channels=(self.interface.num_returns, self.interface.num_sends),
+            dtype=self.interface.dtype,
+            latency=self.interface.latency,
+            callback=self._callback,
+            finished_callback=self._finished,
+        )
+        # a take starts once the previous send has made it back, so no return starts with another take's tail
+        # the round trip measured by forge-interface tune includes the converters, the reported latency doesn't
+        if self.interface.round_trip_latency is not None:
+            round_trip = self.interface.round_trip_latency
+        else:
+            round_trip = sum(self.stream.latency) * samplerate
+        self._settle_blocks = math.ceil(round_trip / self.interface.blocksize) + 1
+        self._silent_blocks = 0
+        self._started = None
+
+    def __enter__(self) -> "DuplexEngine":
+        self.stream.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stream.stop()
+        self.stream.close()
+
+    def _callback(self, indata, outdata, frames, time, status) -> None:
+        # read once, a take attached during this block starts with the next one
+        take = self._take
+        if take is not None and take is not self._started and self._silent_blocks >= self._settle_blocks:
+            self._started = take
+        if take is None or take is not self._started:
+            if isinstance(outdata, np.ndarray):
+                outdata.fill(0)
+            else:
+                np.frombuffer(outdata, dtype=np.uint8)[:] = 0
+            self._silent_blocks += 1
+            return
+        self._silent_blocks = 0
+        if not take.process(indata, outdata, frames, status):
+            self.detach(take)
+            take.done.set()
+
+    # the device stopped, e.g. it was unplugged
+    def _finished(self) -> None:
+        take = self._take
+        if take is not None:
+            self.detach(take)
+            take.done.set()
+
+    def attach(self, take: "Stream") -> None:
+        if take.send_audio.samplerate != self.samplerate:
+            raise ValueError(
+                f"stream samplerate {take.send_audio.samplerate} doesn't match the engine's {self.samplerate}"
+            )
+        if not self.stream.active:
+            raise RuntimeError("the duplex engine stream is not running")
+        with self._lock:
+            if self._take is not None and self._take is not take:
+                raise RuntimeError("the duplex engine is already running a stream")
+            self._take = take
+
+    # a take attached again waits for the outputs to settle again
+    def detach(self, take: "Stream") -> None:
+        with self._lock:
+            if self._take is take:
+                self._take = None
+                self._started = None
+
+
+class Stream(ABC):
+    interface: AudioInterface
+    waves: list[Wave]
     send_audio: Wave
+    routing: npt.NDArray[np.float64]
 
-    stream: sd._StreamBase
+    backend: Backend
+    engine: DuplexEngine | None
+    stream: object
     done: threading.Event
+    telemetry: StreamTelemetry
 
-    def __init__(self, interface: AudioInterface, wave: Wave):
-        if type(self) is Stream:
-            raise Exception("Stream is an abstract class and cannot be instantiated directly")
-
+    def __init__(self, interface: AudioInterface, wave: Wave | list[Wave], engine: DuplexEngine | None = None):
         self.interface = interface
-        self.send_audio = wave
+        self.waves = wave if isinstance(wave, list) else [wave]
+        # the first wave drives the stream length, levels and progress
+        self.send_audio = self.waves[0]
+        self.engine = engine
+        if engine is not None:
+            self.backend = engine.backend
+        else:
+            self.backend = get_backend(self.interface.backend, self.interface.virtual)
+
+        # linear gain from each wave (rows) to each interface output (columns)
+        # by default the first wave is sent to the last output only
+        routing = np.zeros((len(self.waves), self.interface.num_sends), dtype=np.float64)
+        routing[0, self.interface.num_sends - 1] = 1.0
+        self.set_routing(routing)
+        self._allocate(self.interface.blocksize)
 
         self.done = threading.Event()
-
-    def __enter__(self) -> sd._StreamBase:
-        self.stream.start()
+        self.telemetry = StreamTelemetry(self.send_audio.samplerate, self.interface.blocksize)
+
+    def _allocate(self, blocksize: int) -> None:
+        self._waves_block = np.zeros((blocksize, len(self.waves)), dtype=np.float64)
+        self._mix = np.zeros((blocksize, self.interface.num_sends), dtype=np.float64)
+        self._output = np.zeros((blocksize, self.interface.num_sends), dtype=np.int32)
+        self._input = np.zeros((blocksize, self.interface.num_returns), dtype=np.int32)
+        self._input_scratch = np.zeros((blocksize, self.interface.num_returns), dtype=np.float32)
+
+    def __enter__(self):
+        if self.engine is not None:
+            self.engine.attach(self)
+        else:
+            self.stream.start()
         return self.stream
 
     def __exit__(self, *args) -> None:
-        self.stream.stop()
-        self.stream.close()
+        self.poll()
+        if self.engine is not None:
+            self.engine.detach(self)
+        else:
+            self.stream.stop()
+            self.stream.close()
+
+    # runs one block, returns False once the stream is finished
+    @abstractmethod
+    def process(self, indata, outdata, frames: int, status) -> bool:
+        pass
+
+    # sample stream statistics that can't be read from the audio thread
+    def poll(self) -> None:
+        if self.stream.active:
+            self.telemetry.sample_cpu_load(self.stream.cpu_load)
+
+    def get_telemetry(self) -> dict:
+        return self.telemetry.summary()
 
     @staticmethod
     def pack(data: npt.NDArray[np.int32]) -> bytes:
-        return b"".join(
-            int(sample).to_bytes(
-                3,
-                byteorder="little",
-                signed=True,
-            )
-            for sample in data.flatten()
-        )
+        return encode_pcm(data, 3)
 
     @staticmethod
     def unpack(data: bytes, channels: int) -> npt.NDArray[np.int32]:
-        return np.array(
-            [
-                int.from_bytes(
-                    data[i : i + 3],
-                    byteorder="little",
-                    signed=True,
-                )
-                for i in range(0, len(data), 3)
-            ],
-            dtype=np.int32,
-        ).reshape((-1, channels))
+        return decode_pcm(np.frombuffer(data, dtype=np.uint8).reshape((-1, channels, 3)), 3)
+
+    # write a block of 24 bit samples to the stream output buffer in the interface dtype
+    def write_output(self, outdata, output: npt.NDArray[np.int32]) -> None:
+        if self.interface.dtype == "int24":
+            outdata[:] = self.pack(output)
+        else:
+            int24_to_native(output, self.interface.dtype, out=outdata)
+
+    # read the stream input buffer as 24 bit samples, native buffers are converted without allocating
+    def read_input(self, indata, frames: int) -> npt.NDArray[np.int32]:
+        if self.interface.dtype == "int24":
+            return self.unpack(indata, self.interface.num_returns)
+        if frames > len(self._input):
+            self._allocate(frames)
+        return native_to_int24(indata, out=self._input[:frames], scratch=self._input_scratch[:frames])
+
+    def set_routing(self, routing: npt.ArrayLike) -> None:
+        routing = np.array(routing, dtype=np.float64)
+        if routing.shape != (len(self.waves), self.interface.num_sends):
+            raise ValueError(
+                f"routing matrix must have shape {(len(self.waves), self.interface.num_sends)}, got {routing.shape}"
+            )
+        # the output a single wave is sent to at unity gain, which packed waves can be copied to directly
+        sends = np.flatnonzero(routing[0])
+        packed_send = int(sends[0]) if len(self.waves) == 1 and len(sends) == 1 and routing[0, sends[0]] == 1.0 else None
+        # swapped in whole so the audio callback never sees a partially updated matrix
+        self.routing = routing
+        self._packed_send = packed_send
+
+    # send a wave to the given output channels (1 indexed), replacing its current routing
+    def route(self, wave: int, outputs: list[int], gains_db: list[float] | None = None) -> None:
+        if gains_db is None:
+            gains_db = [0.0 for _ in outputs]
+        if len(gains_db) != len(outputs):
+            raise ValueError(f"{len(outputs)} outputs given with {len(gains_db)} gains")
+
+        routing = self.routing.copy()
+        routing[wave] = 0.0
+        for output, gain_db in zip(outputs, gains_db):
+            if not 1 <= output <= self.interface.num_sends:
+                raise ValueError(f"output {output} out of range, interface has {self.interface.num_sends} sends")
+            routing[wave, output - 1] = db_to_scalar(gain_db)
+        self.set_routing(routing)
+
+    # the next block of every wave mixed to the interface outputs
+    def render(self, frames: int) -> npt.NDArray[np.int32]:
+        if frames > len(self._waves_block):
+            self._allocate(frames)
+
+        waves_block = self._waves_block[:frames]
+        for i, wave in enumerate(self.waves):
+            chunksize = frames if wave.loop else min(len(wave) - wave.frame, frames)
+            waves_block[:chunksize, i] = wave.next(chunksize)
+            waves_block[chunksize:, i] = 0.0
+
+        mix = self._mix[:frames]
+        np.matmul(waves_block, self.routing, out=mix)
+        np.rint(mix, out=mix)
+        np.clip(mix, -MAX_VAL_INT24 - 1, MAX_VAL_INT24, out=mix)
+        output = self._output[:frames]
+        output[:] = mix
+        return output
+
+    # write the next block to the stream output buffer
+    def write_block(self, outdata, frames: int) -> None:
+        wave = self.send_audio
+        packed_send = self._packed_send
+        packed = isinstance(wave, PackedWave) and wave.prescaled and self.interface.dtype == "int24"
+        if packed_send is None or not packed:
+            self.write_output(outdata, self.render(frames))
+            return
+
+        # the packed samples are already at the send level, so they're copied into the output
+        # buffer byte for byte without decoding, mixing or packing
+        output = np.frombuffer(outdata, dtype=np.uint8).reshape((frames, self.interface.num_sends, 3))
+        block = wave.next_packed(frames)
+        output[:] = 0
+        output[: len(block), packed_send] = block
 
     def get_send_level(self) -> float:
         return self.send_audio.get_level()
@@ -74,85 +271,117 @@ class SendStream(Stream):
     def __init__(
         self,
         interface: AudioInterface,
-        send_audio: Wave,
+        send_audio: Wave | list[Wave],
+        engine: DuplexEngine | None = None,
     ):
-        super().__init__(interface, send_audio)
+        super().__init__(interface, send_audio, engine)
+        if engine is not None:
+            # the engine's returns are ignored
+            self.stream = engine.stream
+            return
 
         def callback(outdata, frames, time, status):
-            if status:
-                print(status, file=sys.stderr)
-            if not self.send_audio.loop:
-                chunksize = min(len(self.send_audio) - self.send_audio.frame, frames)
-            else:
-                chunksize = frames
-
-            output = np.zeros((frames, self.interface.num_sends), dtype=np.int32)
-            output[:chunksize, self.interface.num_sends - 1] = self.send_audio.next(chunksize)
-            outdata[:] = self.pack(output)
+            self.process(None, outdata, frames, status)
 
-        self.stream = sd.RawOutputStream(
+        self.stream = self.backend.open_output(
             samplerate=self.send_audio.samplerate,
             blocksize=self.interface.blocksize,
             device=self.interface.device,
             channels=self.interface.num_sends,
-            dtype="int24",
+            dtype=self.interface.dtype,
+            latency=self.interface.latency,
             callback=callback,
             finished_callback=self.done.set,
         )
 
+    def process(self, indata, outdata, frames: int, status) -> bool:
+        start = self.telemetry.start()
+        self.write_block(outdata, frames)
+        self.telemetry.record(start, frames, status)
+        return True
+
 
 class SendReturnStream(Stream):
+    frame: int
+    length: int
+    read_frame: int
     return_audio: npt.NDArray[np.int32]
-    return_levels: npt.NDArray[np.int32]
+    meter: LevelMeter
 
+    # with ring_frames the returns go to a ring buffer of that size that has to be drained while the take runs,
+    # otherwise return_audio holds the whole take
     def __init__(
         self,
         interface: AudioInterface,
-        send_audio: Wave,
+        send_audio: Wave | list[Wave],
+        engine: DuplexEngine | None = None,
+        ring_frames: int | None = None,
     ):
-        super().__init__(interface, send_audio)
-
-        self.return_audio = np.zeros(
-            (len(self.send_audio) + 10 * self.interface.blocksize, self.interface.num_returns), dtype=np.int32
-        )
-        self.return_levels = np.zeros(self.interface.num_returns, dtype=np.int32)
-
-        def callback(indata, outdata, frames, time, status):
-            if status:
-                print(status, file=sys.stderr)
-            if not self.send_audio.loop:
-                chunksize = min(len(self.send_audio) - self.send_audio.frame, frames)
-            else:
-                chunksize = frames
-
-            output = np.zeros((frames, self.interface.num_sends), dtype=np.int32)
-            output[chunksize, self.interface.num_sends - 1] = self.send_audio.next(chunksize)
-            outdata[:] = self.pack(output)
+        super().__init__(interface, send_audio, engine)
 
-            input = self.unpack(indata, self.interface.num_returns)
-            self.return_audio[self.send_audio.frame : self.send_audio.frame + frames] = input
+        # recording continues past the end of the send audio to catch the latency tail
+        self.length = len(self.send_audio) + 10 * self.interface.blocksize
+        size = self.length if ring_frames is None else min(ring_frames, self.length)
+        self.return_audio = np.zeros((size, self.interface.num_returns), dtype=np.int32)
+        self.meter = LevelMeter(self.interface.num_returns, self.interface.blocksize)
+        self.frame = 0
+        self.read_frame = 0
 
-            levels = np.max(np.abs(input), axis=0)
-            for i in range(self.interface.num_returns):
-                if levels[i] > self.return_levels[i]:
-                    self.return_levels[i] = levels[i]
+        if engine is not None:
+            self.stream = engine.stream
+            return
 
-            self.send_audio.frame += frames
-            if self.send_audio.frame >= len(self.send_audio):
-                raise sd.CallbackStop()
+        def callback(indata, outdata, frames, time, status):
+            if not self.process(indata, outdata, frames, status):
+                raise self.backend.CallbackStop()
 
-        self.stream = sd.RawStream(
+        self.stream = self.backend.open_duplex(
             samplerate=self.send_audio.samplerate,
             blocksize=self.interface.blocksize,
             device=self.interface.device,
             channels=(self.interface.num_returns, self.interface.num_sends),
-            dtype="int24",
+            dtype=self.interface.dtype,
+            latency=self.interface.latency,
             callback=callback,
             finished_callback=self.done.set,
         )
 
+    def process(self, indata, outdata, frames: int, status) -> bool:
+        start = self.telemetry.start()
+        self.write_block(outdata, frames)
+
+        input = self.read_input(indata, frames)
+        recorded = min(frames, self.length - self.frame)
+        # a block wraps around the end of the ring at most once, the ring is at least a block long
+        position = self.frame % len(self.return_audio)
+        head = min(recorded, len(self.return_audio) - position)
+        self.return_audio[position : position + head] = input[:head]
+        self.return_audio[: recorded - head] = input[head:recorded]
+
+        self.meter.publish(input)
+
+        self.frame += recorded
+        self.telemetry.record(start, frames, status)
+        return self.frame < self.length
+
+    # copies out the frames recorded since the last drain
+    def drain(self) -> npt.NDArray[np.int32]:
+        frame = self.frame
+        if frame - self.read_frame > len(self.return_audio):
+            raise RuntimeError(
+                f"return buffer overrun, {frame - self.read_frame - len(self.return_audio)} frames were lost"
+            )
+        position = self.read_frame % len(self.return_audio)
+        count = frame - self.read_frame
+        head = min(count, len(self.return_audio) - position)
+        audio = np.concatenate(
+            [self.return_audio[position : position + head], self.return_audio[: count - head]]
+        )
+        self.read_frame = frame
+        return audio
+
     def get_return_levels(self) -> list[float]:
-        return int24_to_dbfs(self.return_levels).tolist()
+        return int24_to_dbfs(self.meter.max_peak).tolist()
 
 
 class SineWaveStream(SendStream):
@@ -162,9 +391,13 @@ class SineWaveStream(SendStream):
         frequency: int,
         samplerate: int,
         level_dbfs: float,
+        sends: list[int] | None = None,
+        engine: DuplexEngine | None = None,
     ):
         audio = SineWave(frequency, samplerate, level_dbfs)
-        super().__init__(interface, audio)
+        super().__init__(interface, audio, engine)
+        if sends is not None:
+            self.route(0, sends)
 
 
 class SineSweepStream(SendReturnStream):
@@ -176,18 +409,31 @@ class SineSweepStream(SendReturnStream):
         duration: float,
         samplerate: int,
         level_dbfs: float,
+        engine: DuplexEngine | None = None,
     ):
         audio = SweepWave(freq_start, freq_end, duration, samplerate, level_dbfs)
-        super().__init__(interface, audio)
+        super().__init__(interface, audio, engine)
 
 
 class CaptureStream(SendReturnStream):
     def __init__(
         self,
         interface: AudioInterface,
-        input_data: npt.NDArray[np.int32],
+        input_data: npt.NDArray[np.int32] | Wave,
         samplerate: int,
         level_dbfs: float,
+        sends: list[int] | None = None,
+        send_gains_db: list[float] | None = None,
+        engine: DuplexEngine | None = None,
+        ring_frames: int | None = None,
     ):
-        audio = AudioWave(input_data, samplerate, level_dbfs)
-        super().__init__(interface, audio)
+        # a packed wave from the send cache plays as is, arrays are scaled here
+        if isinstance(input_data, Wave):
+            audio = input_data
+            audio.set_level(level_dbfs)
+        else:
+            audio = AudioWave(input_data, samplerate, level_dbfs)
+        super().__init__(interface, audio, engine, ring_frames)
+        # the same input can drive several outputs, e.g. two devices or both sides of a stereo rig
+        if sends is not None:
+            self.route(0, sends, send_gains_db)
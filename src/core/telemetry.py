@@ -0,0 +1,124 @@
+from time import perf_counter
+
+import numpy as np
+from numpy import typing as npt
+
+
+class StreamTelemetry:
+    HISTOGRAM_BINS = 64
+    HISTOGRAM_RANGE = 2.0  # multiples of the block duration
+    MAX_XRUNS = 1024
+
+    INPUT_XRUN = 1
+    OUTPUT_XRUN = 2
+
+    block_duration: float
+    bin_width: float
+    histogram: npt.NDArray[np.int64]
+
+    callbacks: int
+    frames: int
+    total_duration: float
+    max_duration: float
+
+    input_xruns: int
+    output_xruns: int
+    # callbacks with an xrun, one can count as both an input and an output xrun
+    num_xrun_events: int
+    xrun_frames: npt.NDArray[np.int64]
+    xrun_types: npt.NDArray[np.uint8]
+
+    cpu_load_samples: int
+    cpu_load_total: float
+    cpu_load_max: float
+
+    def __init__(self, samplerate: int, blocksize: int):
+        # everything the callback touches is allocated up front so recording never allocates
+        self.block_duration = blocksize / samplerate
+        self.bin_width = self.HISTOGRAM_RANGE * self.block_duration / self.HISTOGRAM_BINS
+        # the last bin collects every callback that overran the histogram range
+        self.histogram = np.zeros(self.HISTOGRAM_BINS + 1, dtype=np.int64)
+        self.xrun_frames = np.zeros(self.MAX_XRUNS, dtype=np.int64)
+        self.xrun_types = np.zeros(self.MAX_XRUNS, dtype=np.uint8)
+        self.reset()
+
+    def reset(self) -> None:
+        self.histogram[:] = 0
+        self.callbacks = 0
+        self.frames = 0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+
+        self.input_xruns = 0
+        self.output_xruns = 0
+        self.num_xrun_events = 0
+
+        self.cpu_load_samples = 0
+        self.cpu_load_total = 0.0
+        self.cpu_load_max = 0.0
+
+    @staticmethod
+    def start() -> float:
+        return perf_counter()
+
+    # called at the end of every audio callback with the value returned by start
+    def record(self, start: float, frames: int, status) -> None:
+        duration = perf_counter() - start
+        self.histogram[min(int(duration / self.bin_width), self.HISTOGRAM_BINS)] += 1
+        self.total_duration += duration
+        if duration > self.max_duration:
+            self.max_duration = duration
+
+        if status:
+            xrun_type = 0
+            if status.input_underflow or status.input_overflow:
+                self.input_xruns += 1
+                xrun_type |= self.INPUT_XRUN
+            if status.output_underflow or status.output_overflow:
+                self.output_xruns += 1
+                xrun_type |= self.OUTPUT_XRUN
+            if xrun_type:
+                if self.num_xrun_events < self.MAX_XRUNS:
+                    self.xrun_frames[self.num_xrun_events] = self.frames
+                    self.xrun_types[self.num_xrun_events] = xrun_type
+                self.num_xrun_events += 1
+
+        self.callbacks += 1
+        self.frames += frames
+
+    # cpu load is read from the stream outside of the audio thread
+    def sample_cpu_load(self, cpu_load: float) -> None:
+        self.cpu_load_samples += 1
+        self.cpu_load_total += cpu_load
+        if cpu_load > self.cpu_load_max:
+            self.cpu_load_max = cpu_load
+
+    @property
+    def xruns(self) -> int:
+        return self.input_xruns + self.output_xruns
+
+    def get_xruns(self) -> list[tuple[int, int]]:
+        num_xruns = min(self.num_xrun_events, self.MAX_XRUNS)
+        return list(zip(self.xrun_frames[:num_xruns].tolist(), self.xrun_types[:num_xruns].tolist()))
+
+    def get_duration_percentile(self, percentile: float) -> float:
+        if self.callbacks == 0:
+            return 0.0
+        cumulative = np.cumsum(self.histogram)
+        index = int(np.searchsorted(cumulative, self.callbacks * percentile / 100))
+        return min((index + 1) * self.bin_width, self.max_duration)
+
+    def summary(self) -> dict:
+        return {
+            "callbacks": self.callbacks,
+            "frames": self.frames,
+            "block_duration_ms": self.block_duration * 1000,
+            "mean_callback_ms": self.total_duration / self.callbacks * 1000 if self.callbacks else 0.0,
+            "p99_callback_ms": self.get_duration_percentile(99) * 1000,
+            "max_callback_ms": self.max_duration * 1000,
+            "input_xruns": self.input_xruns,
+            "output_xruns": self.output_xruns,
+            "xrun_frames": [frame for frame, _ in self.get_xruns()],
+            "mean_cpu_load": self.cpu_load_total / self.cpu_load_samples if self.cpu_load_samples else None,
+            "max_cpu_load": self.cpu_load_max if self.cpu_load_samples else None,
+        }
@@ -1,7 +1,20 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 import hashlib
 import json
+import os
 from pathlib import Path
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+FORGE_DIR = ".forge"
+HASH_CACHE_NAME = "hashes"
 
 
 def read_config(
@@ -21,12 +34,187 @@ def write_config(
         json.dump(config, fp, indent=4)
 
 
+# a temp file next to path that's unique per process and thread, so writers of the same file don't swap in
+# each other's temp file
+def unique_tmp_path(path: Path) -> Path:
+    return Path(path).with_name(f"{Path(path).name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+# write to a temp file, sync it and swap it in, so after a crash or power loss the file is either
+# the old or the new version and never a partial write
+def write_config_atomic(
+    directory: Path,
+    config: dict,
+    name: str = "config",
+) -> None:
+    path = Path(directory, name + ".json")
+    tmp_path = unique_tmp_path(path)
+    try:
+        with open(tmp_path, "w") as fp:
+            json.dump(config, fp, indent=4)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    # the rename is only durable once the directory entry is synced
+    if os.name == "posix":
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+# an exclusive advisory lock on a lock file, for read-modify-write cycles across processes
+# without flock, e.g. on windows, it doesn't lock
+@contextmanager
+def file_lock(path: Path):
+    with open(path, "w") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
 def timestamp() -> str:
     t = datetime.now()
     return f"{t.year:04d}-{t.month:02d}-{t.day:02d}-{t.hour:02d}-{t.minute:02d}-{t.second:02d}"
 
 
-def hash(path: Path) -> str:
+def _hash_file(path: Path) -> str:
     with open(path, "rb") as f:
         digest = hashlib.file_digest(f, "sha256")
     return digest.hexdigest()
+
+
+# files are identified by their resolved path, and an entry is only valid while size, mtime and inode all match
+def _hash_key(path: Path) -> tuple[str, dict]:
+    stat = os.stat(path)
+    key = str(Path(path).resolve())
+    entry = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "inode": stat.st_ino,
+    }
+    return key, entry
+
+
+# the .forge dir of the project path is in, None outside of a project
+def find_forge_dir(path: Path) -> Path | None:
+    path = Path(path).resolve()
+    for parent in [path, *path.parents]:
+        if Path(parent, FORGE_DIR).is_dir():
+            return Path(parent, FORGE_DIR)
+    return None
+
+
+# the cache belongs to the forge project the file is in, found from the file itself so it doesn't depend on
+# the working directory. Files outside of a project, e.g. inputs, use the project of the working directory
+def _hash_cache_dir(path: Path) -> Path | None:
+    forge_dir = find_forge_dir(path)
+    return forge_dir if forge_dir is not None else find_forge_dir(Path.cwd())
+
+
+# parsed caches by directory, with the stat of the file they were read from. Every write swaps in a new file,
+# so a cache is only parsed again once another process has written it
+_hash_caches: dict[Path, tuple[tuple, dict]] = {}
+
+
+def _hash_cache_stat(cache_path: Path) -> tuple | None:
+    try:
+        stat = os.stat(cache_path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _read_hash_cache(cache_dir: Path) -> dict:
+    cache_path = Path(cache_dir, HASH_CACHE_NAME + ".json")
+    stat = _hash_cache_stat(cache_path)
+    if stat is None:
+        return {}
+    cached = _hash_caches.get(cache_dir)
+    if cached is not None and cached[0] == stat:
+        return cached[1]
+    try:
+        cache = read_config(cache_path)
+    except (json.JSONDecodeError, FileNotFoundError):
+        return {}
+    _hash_caches[cache_dir] = (stat, cache)
+    return cache
+
+
+# entries are merged into what's on disk under a lock, so processes hashing in parallel keep each other's
+# entries. prune drops the entries of files that no longer exist, which stats every file in the cache, so
+# only bulk indexing does it
+def _write_hash_cache(cache_dir: Path, entries: dict, prune: bool = False) -> None:
+    # without flock a concurrent write can drop entries, which only costs a rehash
+    with file_lock(Path(cache_dir, HASH_CACHE_NAME + ".lock")):
+        on_disk = _read_hash_cache(cache_dir)
+        cache = on_disk | entries
+        if prune:
+            cache = {key: entry for key, entry in cache.items() if os.path.exists(key)}
+        if len(entries) == 0 and len(cache) == len(on_disk):
+            return
+        write_config_atomic(cache_dir, cache, HASH_CACHE_NAME)
+        stat = _hash_cache_stat(Path(cache_dir, HASH_CACHE_NAME + ".json"))
+        _hash_caches[cache_dir] = (stat, cache)
+
+
+def _lookup_hash(cache: dict, key: str, entry: dict) -> str | None:
+    cached = cache.get(key)
+    if cached is None:
+        return None
+    if any(cached.get(field) != value for field, value in entry.items()):
+        return None
+    return cached["sha256"]
+
+
+def hash(path: Path, use_cache: bool = True) -> str:
+    # the cache lives in the forge dir, so hash directly outside of an initialized workspace
+    cache_dir = _hash_cache_dir(path) if use_cache else None
+    if cache_dir is None:
+        return _hash_file(path)
+
+    key, entry = _hash_key(path)
+    digest = _lookup_hash(_read_hash_cache(cache_dir), key, entry)
+    if digest is None:
+        digest = _hash_file(path)
+        _write_hash_cache(cache_dir, {key: entry | {"sha256": digest}})
+    return digest
+
+
+def hash_all(
+    paths: list[Path],
+    max_workers: int | None = None,
+) -> dict[Path, str]:
+    caches: dict[Path, dict] = {}
+    digests = {}
+    misses = []
+    for path in paths:
+        cache_dir = _hash_cache_dir(path)
+        if cache_dir is not None and cache_dir not in caches:
+            caches[cache_dir] = _read_hash_cache(cache_dir)
+        key, entry = _hash_key(path)
+        digest = _lookup_hash(caches[cache_dir], key, entry) if cache_dir is not None else None
+        if digest is None:
+            misses.append((path, cache_dir, key, entry))
+        else:
+            digests[path] = digest
+
+    # only files that changed since they were last indexed are read from disk
+    updates: dict[Path, dict] = {cache_dir: {} for cache_dir in caches}
+    if len(misses) > 0:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(_hash_file, [path for path, _, _, _ in misses])
+            for (path, cache_dir, key, entry), digest in zip(misses, results):
+                digests[path] = digest
+                if cache_dir is not None:
+                    updates[cache_dir][key] = entry | {"sha256": digest}
+
+    # indexing also drops the entries of deleted files
+    for cache_dir, entries in updates.items():
+        _write_hash_cache(cache_dir, entries, prune=True)
+
+    return digests
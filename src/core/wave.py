@@ -1,6 +1,8 @@
 import numpy as np
 from numpy import typing as npt
 
+from core.wavfile import decode_pcm
+
 
 class Wave:
     MAX_VAL_INT24: int = 2 ** (24 - 1) - 1
@@ -77,7 +79,7 @@ class Wave:
         return self._format_time(seconds)
 
     def get_duration(self) -> str:
-        seconds = len(self.audio) / self.samplerate
+        seconds = len(self) / self.samplerate
         return self._format_time(seconds)
 
 
@@ -120,4 +122,66 @@ class AudioWave(Wave):
         samplerate: int,
         level_dbfs: float,
     ):
+        # wav data is read as (frames, channels), only the first channel is sent
+        if audio_data.ndim == 2:
+            audio_data = audio_data[:, 0]
         super().__init__(audio_data, samplerate, level_dbfs)
+
+
+class PackedWave(Wave):
+    # raw int24 samples already scaled to level_dbfs, e.g. a memmapped send cache buffer
+    # samples are decoded as they are played, level changes are applied as a gain on top
+    packed: npt.NDArray[np.uint8]
+    packed_level_dbfs: float
+    gain: float
+
+    def __init__(
+        self,
+        packed: npt.NDArray[np.uint8],
+        samplerate: int,
+        level_dbfs: float,
+    ):
+        self.frame = 0
+        self.samplerate = samplerate
+        self.loop = False
+        self.packed = packed
+        self.packed_level_dbfs = level_dbfs
+        self.set_level(level_dbfs)
+
+    @property
+    def prescaled(self) -> bool:
+        return self.gain == 1.0
+
+    @property
+    def audio(self) -> npt.NDArray[np.int32]:
+        # decodes the whole buffer, playback only decodes a block at a time
+        return self._decode(self.packed)
+
+    def _decode(self, packed: npt.NDArray[np.uint8]) -> npt.NDArray[np.int32]:
+        audio = decode_pcm(packed.reshape((-1, 1, 3)), 3)[:, 0]
+        if self.prescaled:
+            return audio
+        return (audio * self.gain).astype(np.int32)
+
+    def __len__(self):
+        return len(self.packed)
+
+    def __next__(self):
+        if self.frame >= len(self.packed):
+            raise StopIteration
+        result = self._decode(self.packed[self.frame : self.frame + 1])[0]
+        self.frame += 1
+        return result
+
+    # the next block of packed samples, shorter than samples at the end of the wave
+    def next_packed(self, samples: int) -> npt.NDArray[np.uint8]:
+        block = self.packed[self.frame : self.frame + samples]
+        self.frame += len(block)
+        return block
+
+    def next(self, samples: int) -> npt.NDArray[np.int32]:
+        return self._decode(self.next_packed(samples))
+
+    def set_level(self, dbfs: float):
+        self.level_dbfs = dbfs
+        self.gain = self.db_to_scalar(dbfs - self.packed_level_dbfs)
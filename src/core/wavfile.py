@@ -0,0 +1,306 @@
+import operator
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+from numpy import typing as npt
+
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+# Convert raw little endian pcm bytes of shape (frames, channels, sampwidth) to int32 samples
+# out is an optional contiguous int32 buffer of shape (frames, channels) the samples are decoded into
+def decode_pcm(
+    raw: npt.NDArray[np.uint8],
+    sampwidth: int,
+    out: npt.NDArray[np.int32] | None = None,
+) -> npt.NDArray[np.int32]:
+    frames, channels = raw.shape[0], raw.shape[1]
+    if sampwidth == 3:
+        if out is None:
+            out = np.empty((frames, channels), dtype=np.int32)
+        samples = out.reshape(-1)
+        if raw.flags.c_contiguous and len(samples) > 0:
+            # read every sample as an int32 at a 3 byte stride, the top byte belongs to the next
+            # sample and is shifted out while sign extending, the last sample has no byte after it
+            overlapping = np.ndarray((len(samples) - 1,), dtype="<i4", buffer=raw, strides=(3,))
+            np.left_shift(overlapping, 8, out=samples[:-1])
+            samples[-1] = int.from_bytes(raw.reshape(-1)[-3:].tobytes(), "little", signed=True) << 8
+        else:
+            # place the 3 bytes in the top of an int32, only the low byte is cleared so the
+            # buffer is written once
+            padded = out.view(np.uint8).reshape((frames, channels, 4))
+            padded[:, :, 0] = 0
+            padded[:, :, 1:] = raw
+        out >>= 8
+        return out
+    if out is not None:
+        out[:] = decode_pcm(raw, sampwidth)
+        return out
+    if sampwidth == 1:
+        return raw.reshape((frames, channels)).astype(np.int32) - 128
+    elif sampwidth == 2:
+        return np.ascontiguousarray(raw).view("<i2").reshape((frames, channels)).astype(np.int32)
+    elif sampwidth == 4:
+        return np.ascontiguousarray(raw).view("<i4").reshape((frames, channels)).astype(np.int32)
+    raise ValueError(f"unsupported sample width: {sampwidth}")
+
+
+# Convert int32 samples of shape (frames, channels) to raw little endian pcm bytes
+def encode_pcm(data: npt.NDArray[np.int32], sampwidth: int) -> bytes:
+    if sampwidth == 1:
+        return (np.asarray(data) + 128).astype(np.uint8).tobytes()
+    elif sampwidth == 2:
+        return np.asarray(data).astype("<i2").tobytes()
+    elif sampwidth == 3:
+        samples = np.ascontiguousarray(data, dtype="<i4").reshape(-1)
+        return samples.view(np.uint8).reshape((-1, 4))[:, :3].tobytes()
+    elif sampwidth == 4:
+        return np.asarray(data).astype("<i4").tobytes()
+    raise ValueError(f"unsupported sample width: {sampwidth}")
+
+
+# riff sizes are 32 bit, larger files are written as rf64 with the sizes in a ds64 chunk
+RIFF_IDS = (b"RIFF", b"RF64", b"BW64")
+MAX_RIFF_SIZE = 0xFFFFFFFF
+
+
+class WavReader:
+    path: Path
+    samplerate: int
+    channels: int
+    sampwidth: int
+    frames: int
+    data_offset: int
+
+    raw: npt.NDArray[np.uint8] | None
+
+    def __init__(self, path: Path, mmap: bool = True):
+        self.path = Path(path)
+
+        fmt = None
+        data_size64 = None
+        with open(self.path, "rb") as fp:
+            header = fp.read(12)
+            # e.g. a take that was interrupted before its header was written
+            if len(header) < 12:
+                raise ValueError(f"{self.path} is not a wav file")
+            riff, _, wave = struct.unpack("<4sI4s", header)
+            if riff not in RIFF_IDS or wave != b"WAVE":
+                raise ValueError(f"{self.path} is not a wav file")
+
+            while True:
+                header = fp.read(8)
+                if len(header) < 8:
+                    raise ValueError(f"{self.path} has no data chunk")
+                chunk_id, chunk_size = struct.unpack("<4sI", header)
+                if chunk_id == b"fmt ":
+                    fmt = fp.read(chunk_size)
+                    fp.seek(chunk_size % 2, 1)
+                elif chunk_id == b"ds64":
+                    ds64 = fp.read(chunk_size)
+                    _, data_size64 = struct.unpack("<QQ", ds64[:16])
+                    fp.seek(chunk_size % 2, 1)
+                elif chunk_id == b"data":
+                    self.data_offset = fp.tell()
+                    data_size = chunk_size
+                    if chunk_size == MAX_RIFF_SIZE and data_size64 is not None:
+                        data_size = data_size64
+                    break
+                else:
+                    fp.seek(chunk_size + chunk_size % 2, 1)
+
+        if fmt is None:
+            raise ValueError(f"{self.path} has no fmt chunk")
+        format_tag, self.channels, self.samplerate, _, _, bits = struct.unpack("<HHIIHH", fmt[:16])
+        if format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_EXTENSIBLE):
+            raise ValueError(f"{self.path} is not pcm encoded")
+        self.sampwidth = (bits + 7) // 8
+
+        # a take that was cut short may have a header that claims more data than was written
+        file_size = self.path.stat().st_size
+        self.frames = min(data_size, file_size - self.data_offset) // (self.channels * self.sampwidth)
+
+        # memmapped samples are only read from disk as they are sliced, without mmap slices are
+        # read with one seek and read each, e.g. for network filesystems
+        self.raw = None
+        if mmap and self.frames > 0:
+            self.raw = np.memmap(
+                self.path,
+                dtype=np.uint8,
+                mode="r",
+                offset=self.data_offset,
+                shape=(self.frames, self.channels, self.sampwidth),
+            )
+
+    def __len__(self) -> int:
+        return self.frames
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return (self.frames, self.channels)
+
+    def _read_raw(self, start: int, stop: int) -> npt.NDArray[np.uint8]:
+        frame_size = self.channels * self.sampwidth
+        with open(self.path, "rb") as fp:
+            fp.seek(self.data_offset + start * frame_size)
+            raw = np.fromfile(fp, dtype=np.uint8, count=(stop - start) * frame_size)
+        return raw.reshape((-1, self.channels, self.sampwidth))
+
+    def __getitem__(self, key) -> npt.NDArray[np.int32]:
+        if isinstance(key, tuple):
+            rows, columns = key
+        else:
+            rows, columns = key, slice(None)
+        # numpy integers index like ints
+        single = not isinstance(rows, slice)
+        if single:
+            rows = operator.index(rows)
+            row = rows + self.frames if rows < 0 else rows
+            if not 0 <= row < self.frames:
+                raise IndexError(f"frame {rows} out of range for {self.frames} frames")
+            rows = slice(row, row + 1)
+
+        indices = range(*rows.indices(self.frames))
+        if len(indices) == 0:
+            raw = np.zeros((0, self.channels, self.sampwidth), dtype=np.uint8)
+        elif self.raw is not None:
+            raw = self.raw[rows]
+        else:
+            # read the frames the slice spans in one go and stride over them in memory
+            first = min(indices[0], indices[-1])
+            raw = self._read_raw(first, max(indices[0], indices[-1]) + 1)[indices[0] - first :: indices.step]
+
+        if isinstance(columns, (int, np.integer)):
+            columns = operator.index(columns)
+            samples = decode_pcm(raw[:, columns : columns + 1], self.sampwidth)[:, 0]
+        else:
+            samples = decode_pcm(raw[:, columns], self.sampwidth)
+        return samples[0] if single else samples
+
+    def read(self, start: int = 0, stop: int | None = None) -> npt.NDArray[np.int32]:
+        return self[start:stop]
+
+    def __enter__(self) -> "WavReader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    # the memmap is unmapped once slices taken from it are gone too
+    def close(self) -> None:
+        self.raw = None
+
+
+class WavWriter:
+    path: Path
+    samplerate: int
+    channels: int
+    sampwidth: int
+    frames: int
+
+    # riff, a junk chunk the size of a ds64 chunk, fmt and the data chunk header
+    DS64_SIZE = 28
+    HEADER_SIZE = 12 + 8 + DS64_SIZE + 8 + 16 + 8
+    CHUNK_FRAMES = 2**16
+
+    def __init__(
+        self,
+        path: Path,
+        samplerate: int,
+        channels: int,
+        sampwidth: int = 3,
+    ):
+        self.path = Path(path)
+        self.samplerate = samplerate
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self.frames = 0
+
+        self.fp = open(self.path, "wb")
+        self._write_header()
+
+    def __enter__(self) -> "WavWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @property
+    def data_offset(self) -> int:
+        return self.HEADER_SIZE
+
+    def _write_header(self) -> None:
+        block_align = self.channels * self.sampwidth
+        data_size = self.frames * block_align
+        riff_size = self.HEADER_SIZE - 8 + data_size + data_size % 2
+        # the length isn't known while streaming, so space for a ds64 chunk is reserved up front
+        # and only filled in once the file outgrows the 32 bit sizes
+        if riff_size > MAX_RIFF_SIZE:
+            riff = struct.pack("<4sI4s", b"RF64", MAX_RIFF_SIZE, b"WAVE")
+            reserved = struct.pack("<4sIQQQI", b"ds64", self.DS64_SIZE, riff_size, data_size, self.frames, 0)
+            data_header = struct.pack("<4sI", b"data", MAX_RIFF_SIZE)
+        else:
+            riff = struct.pack("<4sI4s", b"RIFF", riff_size, b"WAVE")
+            reserved = struct.pack("<4sI", b"JUNK", self.DS64_SIZE) + bytes(self.DS64_SIZE)
+            data_header = struct.pack("<4sI", b"data", data_size)
+        fmt = struct.pack(
+            "<4sIHHIIHH",
+            b"fmt ",
+            16,
+            WAVE_FORMAT_PCM,
+            self.channels,
+            self.samplerate,
+            self.samplerate * block_align,
+            block_align,
+            self.sampwidth * 8,
+        )
+        self.fp.write(riff + reserved + fmt + data_header)
+
+    def write(self, data: npt.NDArray[np.int32]) -> None:
+        data = np.asarray(data)
+        if data.ndim == 1:
+            data = data.reshape((-1, 1))
+        if data.shape[1] != self.channels:
+            raise ValueError(f"expected {self.channels} channels, got {data.shape[1]}")
+        # encode in chunks so large buffers don't need a full size temporary
+        for start in range(0, data.shape[0], self.CHUNK_FRAMES):
+            self.fp.write(encode_pcm(data[start : start + self.CHUNK_FRAMES], self.sampwidth))
+        self.frames += data.shape[0]
+
+    # patch the sizes written so far into the header, the file is readable up to here if writing stops
+    # sync also forces the data to disk so it survives a power loss
+    def flush(self, sync: bool = False) -> None:
+        position = self.fp.tell()
+        self.fp.seek(0)
+        self._write_header()
+        self.fp.seek(position)
+        self.fp.flush()
+        if sync:
+            os.fsync(self.fp.fileno())
+
+    def close(self) -> None:
+        if self.fp.closed:
+            return
+        # pad the data chunk to an even length and patch the sizes into the header
+        if (self.frames * self.channels * self.sampwidth) % 2:
+            self.fp.write(b"\x00")
+        self.fp.seek(0)
+        self._write_header()
+        self.fp.close()
+
+
+# read a whole file into an int32 array of shape (frames, channels), returns the samples and samplerate
+def read_wav(path: Path, mmap: bool = False) -> tuple[npt.NDArray[np.int32], int]:
+    # without mmap the data chunk is read with a single read and decoded in one pass
+    reader = WavReader(path, mmap=mmap)
+    return reader[:], reader.samplerate
+
+
+def write_wav(path: Path, data: npt.NDArray[np.int32], samplerate: int, sampwidth: int = 3) -> None:
+    data = np.asarray(data)
+    with WavWriter(path, samplerate, 1 if data.ndim == 1 else data.shape[1], sampwidth) as writer:
+        writer.write(data)
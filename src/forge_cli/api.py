@@ -1,5 +1,65 @@
 import json
-import requests
+import os
+from pathlib import Path
+import threading
+from time import monotonic, sleep
+
+
+UPLOAD_CHUNK_SIZE = 2**16
+
+
+# requests is slow to import, so it's only loaded once a request is made
+def _request(method: str, url: str, **kwargs):
+    import requests
+
+    return requests.request(method, url, **kwargs)
+
+
+# paces reads across every upload sharing it to rate bytes per second, None doesn't limit
+class RateLimiter:
+    def __init__(self, rate: float | None = None):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = monotonic()
+
+    def acquire(self, size: int) -> None:
+        if not self.rate:
+            return
+        with self._lock:
+            now = monotonic()
+            start = max(self._next, now)
+            self._next = start + size / self.rate
+        if start > now:
+            sleep(start - now)
+
+
+# file body requests streams with a known length, so uploads aren't read into memory first
+class UploadBody:
+    def __init__(self, path: str | Path, limiter: RateLimiter | None = None):
+        self.fp = open(path, "rb")
+        self.size = os.fstat(self.fp.fileno()).st_size
+        self.limiter = limiter
+        self.offset = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __enter__(self) -> "UploadBody":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.fp.close()
+
+    def read(self, size: int = -1) -> bytes:
+        size = UPLOAD_CHUNK_SIZE if size is None or size < 0 else min(size, UPLOAD_CHUNK_SIZE)
+        if self.limiter is not None:
+            self.limiter.acquire(size)
+        data = self.fp.read(size)
+        # sent data won't be read again, keep it from pushing the send buffers out of the page cache
+        if hasattr(os, "posix_fadvise") and len(data) > 0:
+            os.posix_fadvise(self.fp.fileno(), self.offset, len(data), os.POSIX_FADV_DONTNEED)
+        self.offset += len(data)
+        return data
 
 
 class ForgeApi:
@@ -38,7 +98,7 @@ class ForgeApi:
         resource = self.Resource(resource_type)
         method = "GET"
         url = f"{self.api_str}/{resource.type}/"
-        response = requests.request(method, url)
+        response = _request(method, url)
         if response.status_code != 200:
             raise self.StatusException(method, url, response.status_code, response.text)
         result: list = response.json()
@@ -48,7 +108,7 @@ class ForgeApi:
         resource = self.Resource(resource_type)
         method = "POST"
         url = f"{self.api_str}/{resource.type}/"
-        response = requests.request(method, url, headers=self.DEFAUT_HEADERS, data=json.dumps(config))
+        response = _request(method, url, headers=self.DEFAUT_HEADERS, data=json.dumps(config))
         if response.status_code != 201:
             raise self.StatusException(method, url, response.status_code, response.text)
         result: dict = response.json()
@@ -58,7 +118,7 @@ class ForgeApi:
         resource = self.Resource(resource_type)
         method = "GET"
         url = f"{self.api_str}/{resource.type}/{resource_id}/"
-        response = requests.request(method, url)
+        response = _request(method, url)
         if response.status_code != 200:
             raise self.StatusException(method, url, response.status_code, response.text)
         result: dict = response.json()
@@ -68,7 +128,7 @@ class ForgeApi:
         resource = self.Resource(resource_type)
         method = "PATCH"
         url = f"{self.api_str}/{resource.type}/{resource_id}/"
-        response = requests.request(method, url, headers=self.DEFAUT_HEADERS, data=json.dumps(config))
+        response = _request(method, url, headers=self.DEFAUT_HEADERS, data=json.dumps(config))
         if response.status_code != 200:
             raise self.StatusException(method, url, response.status_code, response.text)
         result: dict = response.json()
@@ -78,23 +138,29 @@ class ForgeApi:
         resource = self.Resource(resource_type)
         method = "DELETE"
         url = f"{self.api_str}/{resource.type}/{resource_id}/"
-        response = requests.request(method, url)
+        response = _request(method, url)
         if response.status_code != 200:
             raise self.StatusException(method, url, response.status_code, response.text)
         result: dict = response.json()
         return result
 
-    def upload(self, resource_type: str, resource_id: str, file_path: str) -> dict:
-        with open(file_path, "rb") as fp:
-            data = fp.read()
+    def upload(
+        self, resource_type: str, resource_id: str, file_path: str, limiter: RateLimiter | None = None
+    ) -> dict:
+        from core.storage import CONTENT_TYPES
+
         resource = self.Resource(resource_type)
         method = "PATCH"
         url = f"{self.api_str}/{resource.type}/{resource_id}/"
+        extension = Path(file_path).suffix.lower()
+        if extension not in CONTENT_TYPES:
+            raise ValueError(f"unsupported upload file type: {extension}. Must be one of {list(CONTENT_TYPES.keys())}")
         headers = {
-            "Content-Type": "audio/wav",
-            "Content-Disposition": "attachment; filename=upload.wav",
+            "Content-Type": CONTENT_TYPES[extension],
+            "Content-Disposition": f"attachment; filename=upload{extension}",
         }
-        response = requests.request(method, url, headers=headers, data=data)
+        with UploadBody(file_path, limiter) as body:
+            response = _request(method, url, headers=headers, data=body)
         if response.status_code != 200:
             raise self.StatusException(method, url, response.status_code, response.text)
         result: dict = response.json()
@@ -104,7 +170,7 @@ class ForgeApi:
         resource = self.Resource(resource_type)
         method = "GET"
         url = f"{self.api_str}/{resource.type}/{resource_id}/"
-        response = requests.request(method, url)
+        response = _request(method, url)
         if response.status_code != 200:
             raise self.StatusException(method, url, response.status_code, "")
         result = response.content
@@ -1,10 +1,9 @@
 from argparse import ArgumentParser
-import hashlib
 from pathlib import Path
 import json
 
 from core.db import ForgeDB
-from core.util import read_config, write_config
+from core.util import hash, hash_all, read_config, write_config
 from forge_cli.api import ForgeApi
 
 
@@ -26,6 +25,7 @@ def _create_manifest(capture: dict, session: dict) -> None:
 
     manifest["channels"] = session["channels"]
     manifest["level_dbu"] = capture["level_dbu"]
+    manifest["sends"] = session.get("sends", None)
 
     write_config(capture_dir, manifest, "manifest")
 
@@ -126,6 +126,14 @@ def _setup_parser() -> ArgumentParser:
         help="resource id (or name)",
     )
 
+    index_parser = subparsers.add_parser("index", help="hash input and capture files into the hash cache")
+    index_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of hashing processes (defaults to the number of cpus)",
+    )
+
     return parser
 
 
@@ -137,6 +145,17 @@ def main():
     if args.api is not None:
         db.set_api(args.api)
 
+    if args.command == "index":
+        paths = [
+            path
+            for pattern in ["*/**/*.wav", "*/**/*.flac"]
+            for path in Path(ForgeDB.FORGE_DIR).glob(pattern)
+            if path.is_file()
+        ]
+        digests = hash_all(paths, max_workers=args.workers)
+        print(f"indexed {len(digests)} files")
+        return
+
     api = ForgeApi(db.get_api())
     resource_type = args.resource_type
     if args.command in ["get", "delete", "upload", "download"]:
@@ -154,8 +173,7 @@ def main():
             print(f"deleted {resource_type}: {json.dumps(resource, indent=4)}")
 
         elif args.command == "upload":
-            with open(args.file_path, "rb") as fp:
-                file_hash = hashlib.file_digest(fp, "sha256").hexdigest()
+            file_hash = hash(Path(args.file_path))
             config = {
                 "hash": file_hash,
             }
@@ -1,11 +1,12 @@
 from argparse import ArgumentParser
 
-import sounddevice as sd
-
 from core.db import ForgeDB
+from core.interface import AudioInterface
+from core.probe import get_capabilities
+from interface.tune import BLOCKSIZES, LATENCIES, MIN_HEADROOM, select, tune
 
 
-SAMPLERATES = [32000, 44100, 48000, 88200, 96000, 128000, 192000]  # Hz
+DEFAULT_SAMPLERATE = 48000  # Hz
 
 
 def _setup_parser() -> ArgumentParser:
@@ -22,6 +23,57 @@ def _setup_parser() -> ArgumentParser:
         default=None,
         help="interface id",
     )
+    inspect_parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Probe the interface again instead of using cached capabilities",
+    )
+
+    tune_parser = subparsers.add_parser("tune", help="Find the smallest stable block size and latency")
+    tune_parser.add_argument(
+        "--samplerate",
+        type=int,
+        default=DEFAULT_SAMPLERATE,
+        help="samplerate in Hz",
+    )
+    tune_parser.add_argument(
+        "--blocksizes",
+        type=int,
+        nargs="+",
+        default=BLOCKSIZES,
+        help="block sizes to try",
+    )
+    tune_parser.add_argument(
+        "--latencies",
+        type=str,
+        nargs="+",
+        default=LATENCIES,
+        help="portaudio latency settings to try (low, high or seconds)",
+    )
+    tune_parser.add_argument(
+        "--duration",
+        type=float,
+        default=2.0,
+        help="duration of each loopback sweep in seconds",
+    )
+    tune_parser.add_argument(
+        "--repeats",
+        type=int,
+        default=3,
+        help="loopback sweeps per configuration",
+    )
+    tune_parser.add_argument(
+        "--channel",
+        type=int,
+        default=1,
+        help="return channel the send is looped back to",
+    )
+    tune_parser.add_argument(
+        "--min_headroom",
+        type=float,
+        default=MIN_HEADROOM,
+        help="fraction of each block that must be left after the p99 callback",
+    )
 
     return parser
 
@@ -31,6 +83,37 @@ def main():
     args = parser.parse_args()
     command: str = args.command
 
+    if command == "tune":
+        db = ForgeDB()
+        interface_config = db.get_interface()
+
+        latencies = [latency if latency in LATENCIES else float(latency) for latency in args.latencies]
+        print(f"connect interface send to return channel {args.channel}.")
+        input("press enter to start tuning...")
+        results = tune(
+            interface_config,
+            args.samplerate,
+            blocksizes=args.blocksizes,
+            latencies=latencies,
+            duration=args.duration,
+            repeats=args.repeats,
+            channel=args.channel - 1,
+            min_headroom=args.min_headroom,
+        )
+
+        best = select(results)
+        if best is None:
+            print("no stable configuration found, interface config unchanged")
+            return
+        interface_config["blocksize"] = best["blocksize"]
+        interface_config["latency"] = best["latency"]
+        interface_config["round_trip_latency"] = best["round_trip_frames"]
+        db.set_interface(interface_config)
+        print(f"set blocksize {best['blocksize']} latency {best['latency']} ({best['round_trip_ms']:.2f} ms round trip)")
+        return
+
+    import sounddevice as sd
+
     if command == "list":
         print(sd.query_devices())
 
@@ -38,17 +121,16 @@ def main():
         db = ForgeDB()
         interface_config = db.get_interface()
 
-        device = args.interface if args.interface else interface_config["device"]
+        device = args.interface if args.interface is not None else AudioInterface(interface_config).device
 
         interface = sd.query_devices(device)
         for key, value in dict(interface).items():
             print(f"{key}: {value}")
-        supported_samplerates = []
-        for fs in SAMPLERATES:
-            try:
-                sd.check_output_settings(device=device, samplerate=fs)
-            except Exception as e:
-                pass
-            else:
-                supported_samplerates.append(fs)
-        print("supported samplerates: " + str(supported_samplerates))
+
+        capabilities = get_capabilities(db, device, refresh=args.refresh)
+        print("supported input samplerates: " + str(capabilities["input_samplerates"]))
+        print("supported output samplerates: " + str(capabilities["output_samplerates"]))
+        print("supported input dtypes: " + str(capabilities["input_dtypes"]))
+        print("supported output dtypes: " + str(capabilities["output_dtypes"]))
+        for blocksize, latency in capabilities["blocksizes"].items():
+            print(f"blocksize {blocksize}: input latency {latency['input_latency']} s, output latency {latency['output_latency']} s")
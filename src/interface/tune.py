@@ -0,0 +1,95 @@
+from core.audio import calculate_latency
+from core.interface import AudioInterface
+from core.stream import SineSweepStream
+
+
+BLOCKSIZES = [32, 64, 128, 256, 512, 1024, 2048]  # frames
+LATENCIES = ["low", "high"]
+MIN_HEADROOM = 0.5  # fraction of the block duration left after the p99 callback
+
+SWEEP_START = 20  # Hz
+SWEEP_END = 20000  # Hz
+SWEEP_LEVEL_DBFS = -12.0  # dBFS
+
+
+# run one loopback sweep and measure the round trip latency, xruns and callback headroom
+def measure_config(
+    interface_config: dict,
+    blocksize: int,
+    latency: str | float,
+    samplerate: int,
+    duration: float,
+    channel: int,
+) -> dict:
+    interface = AudioInterface(interface_config | {"blocksize": blocksize, "latency": latency})
+    stream = SineSweepStream(interface, SWEEP_START, SWEEP_END, duration, samplerate, SWEEP_LEVEL_DBFS)
+    with stream:
+        while not stream.done.wait(timeout=0.1):
+            stream.poll()
+
+    telemetry = stream.get_telemetry()
+    send_audio = stream.send_audio.audio.reshape((-1, 1))
+    channel_delays, _ = calculate_latency(
+        send_audio,
+        stream.return_audio[:, channel : channel + 1],
+        samplerate,
+        cross_correlation_seconds=max(int(duration), 1),
+    )
+    return {
+        "blocksize": blocksize,
+        "latency": latency,
+        "round_trip_frames": channel_delays[0],
+        "round_trip_ms": channel_delays[0] / samplerate * 1000,
+        "xruns": telemetry["input_xruns"] + telemetry["output_xruns"],
+        "headroom": 1 - telemetry["p99_callback_ms"] / telemetry["block_duration_ms"],
+        "max_cpu_load": telemetry["max_cpu_load"],
+    }
+
+
+def tune(
+    interface_config: dict,
+    samplerate: int,
+    blocksizes: list[int] = BLOCKSIZES,
+    latencies: list[str | float] = LATENCIES,
+    duration: float = 2.0,
+    repeats: int = 3,
+    channel: int = 0,
+    min_headroom: float = MIN_HEADROOM,
+) -> list[dict]:
+    results = []
+    for latency in latencies:
+        for blocksize in sorted(blocksizes):
+            try:
+                takes = [
+                    measure_config(interface_config, blocksize, latency, samplerate, duration, channel)
+                    for _ in range(repeats)
+                ]
+            except Exception as e:
+                print(f"blocksize {blocksize} latency {latency}: failed to open stream - {e}")
+                continue
+
+            # a config is only stable if every take was clean and the latency didn't move between takes
+            result = {
+                "blocksize": blocksize,
+                "latency": latency,
+                "round_trip_frames": max(take["round_trip_frames"] for take in takes),
+                "round_trip_ms": max(take["round_trip_ms"] for take in takes),
+                "xruns": sum(take["xruns"] for take in takes),
+                "headroom": min(take["headroom"] for take in takes),
+                "consistent": len(set(take["round_trip_frames"] for take in takes)) == 1,
+            }
+            result["stable"] = result["xruns"] == 0 and result["consistent"] and result["headroom"] >= min_headroom
+            print(
+                f"blocksize {blocksize:5d} latency {str(latency):5s}: round trip {result['round_trip_ms']:7.2f} ms, "
+                f"{result['xruns']} xruns, headroom {result['headroom']:.2f}, "
+                f"{'stable' if result['stable'] else 'unstable'}"
+            )
+            results.append(result)
+    return results
+
+
+def select(results: list[dict]) -> dict | None:
+    stable = [result for result in results if result["stable"]]
+    if len(stable) == 0:
+        return None
+    return min(stable, key=lambda result: (result["round_trip_frames"], result["blocksize"]))
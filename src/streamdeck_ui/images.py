@@ -0,0 +1,208 @@
+from collections import OrderedDict
+import hashlib
+
+import numpy as np
+from numpy import typing as npt
+
+GLYPH_WIDTH = 5
+GLYPH_HEIGHT = 7
+# glyphs are drawn in a cell with one pixel of spacing to the right and below
+CELL_WIDTH = GLYPH_WIDTH + 1
+CELL_HEIGHT = GLYPH_HEIGHT + 1
+
+# 5x7 font, one int per row from the top, the most significant of the 5 bits is the
+# leftmost pixel
+FONT = {
+    " ": (0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00),
+    "0": (0x0E, 0x11, 0x13, 0x15, 0x19, 0x11, 0x0E),
+    "1": (0x04, 0x0C, 0x04, 0x04, 0x04, 0x04, 0x0E),
+    "2": (0x0E, 0x11, 0x01, 0x02, 0x04, 0x08, 0x1F),
+    "3": (0x1F, 0x02, 0x04, 0x02, 0x01, 0x11, 0x0E),
+    "4": (0x02, 0x06, 0x0A, 0x12, 0x1F, 0x02, 0x02),
+    "5": (0x1F, 0x10, 0x1E, 0x01, 0x01, 0x11, 0x0E),
+    "6": (0x06, 0x08, 0x10, 0x1E, 0x11, 0x11, 0x0E),
+    "7": (0x1F, 0x01, 0x02, 0x04, 0x08, 0x08, 0x08),
+    "8": (0x0E, 0x11, 0x11, 0x0E, 0x11, 0x11, 0x0E),
+    "9": (0x0E, 0x11, 0x11, 0x0F, 0x01, 0x02, 0x0C),
+    "A": (0x0E, 0x11, 0x11, 0x11, 0x1F, 0x11, 0x11),
+    "B": (0x1E, 0x11, 0x11, 0x1E, 0x11, 0x11, 0x1E),
+    "C": (0x0E, 0x11, 0x10, 0x10, 0x10, 0x11, 0x0E),
+    "D": (0x1C, 0x12, 0x11, 0x11, 0x11, 0x12, 0x1C),
+    "E": (0x1F, 0x10, 0x10, 0x1E, 0x10, 0x10, 0x1F),
+    "F": (0x1F, 0x10, 0x10, 0x1E, 0x10, 0x10, 0x10),
+    "G": (0x0E, 0x11, 0x10, 0x17, 0x11, 0x11, 0x0F),
+    "H": (0x11, 0x11, 0x11, 0x1F, 0x11, 0x11, 0x11),
+    "I": (0x0E, 0x04, 0x04, 0x04, 0x04, 0x04, 0x0E),
+    "J": (0x07, 0x02, 0x02, 0x02, 0x02, 0x12, 0x0C),
+    "K": (0x11, 0x12, 0x14, 0x18, 0x14, 0x12, 0x11),
+    "L": (0x10, 0x10, 0x10, 0x10, 0x10, 0x10, 0x1F),
+    "M": (0x11, 0x1B, 0x15, 0x15, 0x11, 0x11, 0x11),
+    "N": (0x11, 0x11, 0x19, 0x15, 0x13, 0x11, 0x11),
+    "O": (0x0E, 0x11, 0x11, 0x11, 0x11, 0x11, 0x0E),
+    "P": (0x1E, 0x11, 0x11, 0x1E, 0x10, 0x10, 0x10),
+    "Q": (0x0E, 0x11, 0x11, 0x11, 0x15, 0x12, 0x0D),
+    "R": (0x1E, 0x11, 0x11, 0x1E, 0x14, 0x12, 0x11),
+    "S": (0x0F, 0x10, 0x10, 0x0E, 0x01, 0x01, 0x1E),
+    "T": (0x1F, 0x04, 0x04, 0x04, 0x04, 0x04, 0x04),
+    "U": (0x11, 0x11, 0x11, 0x11, 0x11, 0x11, 0x0E),
+    "V": (0x11, 0x11, 0x11, 0x11, 0x11, 0x0A, 0x04),
+    "W": (0x11, 0x11, 0x11, 0x15, 0x15, 0x15, 0x0A),
+    "X": (0x11, 0x11, 0x0A, 0x04, 0x0A, 0x11, 0x11),
+    "Y": (0x11, 0x11, 0x11, 0x0A, 0x04, 0x04, 0x04),
+    "Z": (0x1F, 0x01, 0x02, 0x04, 0x08, 0x10, 0x1F),
+    ".": (0x00, 0x00, 0x00, 0x00, 0x00, 0x0C, 0x0C),
+    "-": (0x00, 0x00, 0x00, 0x1F, 0x00, 0x00, 0x00),
+    "+": (0x00, 0x04, 0x04, 0x1F, 0x04, 0x04, 0x00),
+    ":": (0x00, 0x0C, 0x0C, 0x00, 0x0C, 0x0C, 0x00),
+    "/": (0x00, 0x01, 0x02, 0x04, 0x08, 0x10, 0x00),
+    "%": (0x18, 0x19, 0x02, 0x04, 0x08, 0x13, 0x03),
+    "<": (0x02, 0x04, 0x08, 0x10, 0x08, 0x04, 0x02),
+    ">": (0x08, 0x04, 0x02, 0x01, 0x02, 0x04, 0x08),
+    "?": (0x0E, 0x11, 0x01, 0x02, 0x04, 0x00, 0x04),
+}
+
+# every glyph unpacked once into a (glyphs, height, width) bool array
+GLYPH_INDEX = {char: i for i, char in enumerate(FONT)}
+GLYPHS = (
+    np.array(list(FONT.values()), dtype=np.uint8)[:, :, None]
+    >> np.arange(GLYPH_WIDTH - 1, -1, -1, dtype=np.uint8)
+) & 1 == 1
+
+# unit info colour schemes, the order of red, green and blue in a pixel
+COLOR_SCHEMES = {0: (0, 1, 2), 1: (2, 1, 0)}
+
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+GREEN = (0, 200, 0)
+YELLOW = (230, 200, 0)
+RED = (230, 0, 0)
+
+
+def text_mask(text: str, scale: int = 1) -> npt.NDArray[np.bool_]:
+    """Rasterize text into a bool mask, lines are split on newlines."""
+    lines = text.upper().split("\n")
+    columns = max(len(line) for line in lines)
+    mask = np.zeros((len(lines), columns, CELL_HEIGHT, CELL_WIDTH), dtype=bool)
+    for row, line in enumerate(lines):
+        indices = [GLYPH_INDEX.get(char, GLYPH_INDEX["?"]) for char in line]
+        mask[row, : len(line), :GLYPH_HEIGHT, :GLYPH_WIDTH] = GLYPHS[indices]
+    # (lines, columns, cell height, cell width) -> (lines * cell height, columns * cell width)
+    mask = mask.transpose(0, 2, 1, 3).reshape(len(lines) * CELL_HEIGHT, -1)
+    # drop the spacing after the last row and column
+    mask = mask[:-1, :-1]
+    return mask.repeat(scale, axis=0).repeat(scale, axis=1)
+
+
+def _draw_mask(image: npt.NDArray[np.uint8], mask, top: int, color) -> None:
+    height = min(mask.shape[0], image.shape[0] - top)
+    width = min(mask.shape[1], image.shape[1])
+    left = (image.shape[1] - width) // 2
+    region = image[top : top + height, left : left + width]
+    region[mask[:height, :width]] = color
+
+
+def render_text(
+    text: str,
+    width: int,
+    height: int,
+    color: tuple[int, int, int] = WHITE,
+    background: tuple[int, int, int] = BLACK,
+) -> npt.NDArray[np.uint8]:
+    """Render text centered on a key at the largest scale that fits."""
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = background
+    if len(text) == 0:
+        return image
+
+    unscaled = text_mask(text)
+    scale = max(1, min(width // unscaled.shape[1], height // unscaled.shape[0]))
+    mask = text_mask(text, scale)
+    _draw_mask(image, mask, max((height - mask.shape[0]) // 2, 0), color)
+    return image
+
+
+def render_meter(
+    level_dbfs: float,
+    width: int,
+    height: int,
+    floor_dbfs: float = -60.0,
+    clip: bool = False,
+    label: str | None = None,
+    background: tuple[int, int, int] = BLACK,
+) -> npt.NDArray[np.uint8]:
+    """Render a vertical level meter, red across the top when the channel clipped."""
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = background
+
+    # the level each row of pixels represents, top row is 0 dBFS
+    row_dbfs = floor_dbfs * (np.arange(height) + 0.5) / height
+    colors = np.where(
+        (row_dbfs > -6.0)[:, None],
+        RED,
+        np.where((row_dbfs > -18.0)[:, None], YELLOW, GREEN),
+    ).astype(np.uint8)
+    lit = row_dbfs <= level_dbfs
+
+    margin = width // 4
+    image[lit, margin : width - margin] = colors[lit, None]
+    if clip:
+        image[: max(height // 12, 1)] = RED
+    if label is not None:
+        _draw_mask(image, text_mask(label), max(height // 12, 1) + 1, WHITE)
+    return image
+
+
+def encode_image(
+    pixels: npt.NDArray[np.uint8],
+    bpp: int,
+    color_scheme: int,
+) -> bytes:
+    """Encode (height, width, 3) RGB pixels in the device bitmap format."""
+    if color_scheme not in COLOR_SCHEMES:
+        raise ValueError(f"unsupported colour scheme: {color_scheme}")
+    ordered = pixels[..., COLOR_SCHEMES[color_scheme]]
+    if bpp == 24:
+        return np.ascontiguousarray(ordered).tobytes()
+    elif bpp == 16:
+        # 5-6-5 bits per channel
+        channels = ordered.astype(np.uint16)
+        packed = (
+            (channels[..., 0] >> 3) << 11
+            | (channels[..., 1] >> 2) << 5
+            | channels[..., 2] >> 3
+        )
+        return packed.astype("<u2").tobytes()
+    raise ValueError(f"unsupported bits per pixel: {bpp}")
+
+
+class ImageCache:
+    """Encoded images keyed by a hash of their pixels and format, least recently
+    used entries are dropped once the cache is full."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[bytes, bytes] = OrderedDict()
+
+    @staticmethod
+    def digest(pixels: npt.NDArray[np.uint8], bpp: int, color_scheme: int) -> bytes:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.ascontiguousarray(pixels))
+        digest.update(repr((pixels.shape, bpp, color_scheme)).encode())
+        return digest.digest()
+
+    def encode(
+        self,
+        pixels: npt.NDArray[np.uint8],
+        bpp: int,
+        color_scheme: int,
+    ) -> tuple[bytes, bytes]:
+        key = self.digest(pixels, bpp, color_scheme)
+        encoded = self._entries.get(key)
+        if encoded is None:
+            encoded = encode_image(pixels, bpp, color_scheme)
+            self._entries[key] = encoded
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        return key, encoded
@@ -1,4 +1,13 @@
+from collections import namedtuple
+import struct
+import sys
+import threading
+from time import monotonic
+
 import hid
+from numpy import typing as npt
+
+from streamdeck_ui.images import ImageCache
 
 VID = 0x0FD9
 PID = 0x00B9
@@ -6,119 +15,272 @@ ROWS = 3
 COLS = 5
 
 
-def _pop_bytes(data: bytearray, length: int = 1) -> bytes:
-    """Pop bytes from the start of the data."""
-    result = bytes(data[:length])
-    del data[:length]
-    return result
-
-
-def _pop_int(data: bytearray, length: int = 1) -> int:
-    """Pop a single byte and convert it to a signed integer."""
-    return int.from_bytes(
-        _pop_bytes(data, length=length), byteorder="little", signed=True
-    )
-
-
-def _pop_uint(data: bytearray, length: int = 1) -> int:
-    """Pop a single byte and convert it to an unsigned integer."""
-    return int.from_bytes(
-        _pop_bytes(data, length=length), byteorder="little", signed=False
-    )
-
-
-def _pop_chars(data: bytearray, length: int = 1) -> str:
-    """Pop a single byte and convert it to an ASCII character."""
-    return _pop_bytes(data, length=length).decode("ascii")
+InputReport = namedtuple("InputReport", ["report_id", "command", "data_length", "data"])
+FirmwareVersion = namedtuple(
+    "FirmwareVersion", ["report_id", "data_length", "checksum", "version"]
+)
+SerialNumber = namedtuple("SerialNumber", ["report_id", "data_length", "serial_number"])
+SleepIdle = namedtuple("SleepIdle", ["report_id", "data_length", "sleep_idle"])
+UnitInfo = namedtuple(
+    "UnitInfo",
+    [
+        "report_id",
+        "matrix_rows",
+        "matrix_cols",
+        "key_width",
+        "key_height",
+        "lcd_width",
+        "lcd_height",
+        "image_bpp",
+        "image_color_scheme",
+        "num_key_images",
+        "num_lcd_images",
+        "num_frames",
+        "reserved",
+    ],
+)
+KeyEvent = namedtuple("KeyEvent", ["key", "row", "col", "pressed", "time"])
+
+# report layouts, all multi-byte fields are little endian
+# report ids, commands and reserved bytes are decoded as single bytes ("c"), lengths and sizes as ints
+INPUT_HEADER = struct.Struct("<ccH")
+FIRMWARE_VERSION = struct.Struct("<cB4s8s")
+SERIAL_NUMBER = struct.Struct("<cB14s")
+SLEEP_IDLE = struct.Struct("<cBB")
+UNIT_INFO = struct.Struct("<cBBHHHHBBBBBc")
+
+INPUT_REPORT_LENGTH = INPUT_HEADER.size + ROWS * COLS
+KEY_INPUT_COMMAND = b"\x00"
+
+# image uploads are split into fixed size output reports, each with this header:
+# report id, command, key index, last packet flag, payload length, packet index
+OUTPUT_HEADER = struct.Struct("<BBBBHH")
+OUTPUT_REPORT_LENGTH = 1024
+OUTPUT_PAYLOAD_LENGTH = OUTPUT_REPORT_LENGTH - OUTPUT_HEADER.size
+OUTPUT_REPORT_ID = 0x02
+KEY_IMAGE_COMMAND = 0x07
+LCD_IMAGE_COMMAND = 0x08
+
+
+def _decode_chars(data: bytes) -> str:
+    """Decode a fixed length ASCII field, padding included."""
+    return data.decode("ascii")
+
+
+def decode_input(response: bytes) -> InputReport:
+    """Decode an input report, the key data is one byte per key."""
+    report_id, command, data_length = INPUT_HEADER.unpack_from(response)
+    data = bytes(response[INPUT_HEADER.size : INPUT_HEADER.size + data_length])
+    return InputReport(report_id, command, data_length, data)
+
+
+def decode_firmware_version(response: bytes) -> FirmwareVersion:
+    report_id, data_length, checksum, version = FIRMWARE_VERSION.unpack_from(response)
+    return FirmwareVersion(report_id, data_length, checksum, _decode_chars(version))
+
+
+def decode_serial_number(response: bytes) -> SerialNumber:
+    report_id, data_length, serial_number = SERIAL_NUMBER.unpack_from(response)
+    return SerialNumber(report_id, data_length, _decode_chars(serial_number))
+
+
+def decode_sleep_idle(response: bytes) -> SleepIdle:
+    return SleepIdle._make(SLEEP_IDLE.unpack_from(response))
+
+
+def decode_unit_info(response: bytes) -> UnitInfo:
+    return UnitInfo._make(UNIT_INFO.unpack_from(response))
+
+
+def diff_key_state(previous: int, current: int, time: float) -> list[KeyEvent]:
+    """Events for the keys that changed between two key bitmaps.
+
+    The bitmaps hold one byte per key, so a single xor finds every changed key and
+    only those are visited.
+    """
+    events = []
+    changed = previous ^ current
+    while changed:
+        lowest = changed & -changed
+        key = (lowest.bit_length() - 1) // 8
+        pressed = (current >> (8 * key)) & 0xFF != 0
+        events.append(KeyEvent(key, key // COLS, key % COLS, pressed, time))
+        changed &= ~(0xFF << (8 * key))
+    return events
+
+
+def build_output_reports(
+    report_id: int, command: int, payload: bytes, index: int = 0
+) -> bytearray:
+    """Split a payload into consecutive zero padded output reports."""
+    num_reports = max(-(-len(payload) // OUTPUT_PAYLOAD_LENGTH), 1)
+    reports = bytearray(num_reports * OUTPUT_REPORT_LENGTH)
+    view = memoryview(payload)
+    for page in range(num_reports):
+        chunk = view[page * OUTPUT_PAYLOAD_LENGTH : (page + 1) * OUTPUT_PAYLOAD_LENGTH]
+        offset = page * OUTPUT_REPORT_LENGTH
+        is_last = page == num_reports - 1
+        OUTPUT_HEADER.pack_into(
+            reports, offset, report_id, command, index, is_last, len(chunk), page
+        )
+        start = offset + OUTPUT_HEADER.size
+        reports[start : start + len(chunk)] = chunk
+    return reports
 
 
 class StreamDeck(hid.Device):
-    key_state: list[list[bool]] = [[False] * COLS for _ in range(ROWS)]
-    previous_key_state: list[list[bool]] = [[False] * COLS for _ in range(ROWS)]
+    # reads block in hidapi, the timeout only bounds how long stopping the reader takes
+    READ_TIMEOUT_MS = 500
+
+    key_state: int
+    previous_key_state: int
 
     def __init__(self):
         super().__init__(VID, PID)
+        # one byte per key packed little endian into an int, key 0 is the lowest byte
+        self.key_state = 0
+        self.previous_key_state = 0
+
+        self._handlers = []
+        self._reader = None
+        self._halt = threading.Event()
+
+        self._unit_info = None
+        self._image_cache = ImageCache()
+        # hash of the image currently shown on each key, so unchanged keys are skipped
+        self._key_images: dict[int, bytes] = {}
+        self._write_lock = threading.Lock()
+
+    def close(self) -> None:
+        self.stop_reader()
+        super().close()
+
+    def read_input(self, timeout: int | None = None) -> InputReport | None:
+        response = self.read(INPUT_REPORT_LENGTH, timeout)
+        if len(response) == 0:
+            return None
+        return decode_input(response)
+
+    def is_pressed(self, key: int) -> bool:
+        return (self.key_state >> (8 * key)) & 0xFF != 0
+
+    def add_handler(self, handler, key: int | None = None) -> None:
+        """Call handler(event) for key events, on every key when key is None.
+
+        Handlers run on the reader thread and should return quickly.
+        """
+        self._handlers.append((handler, key))
+
+    def remove_handler(self, handler) -> None:
+        self._handlers = [(h, key) for h, key in self._handlers if h != handler]
+
+    def update_key_state(self, report: InputReport) -> list[KeyEvent]:
+        if report.command != KEY_INPUT_COMMAND:
+            return []
+        self.previous_key_state = self.key_state
+        self.key_state = int.from_bytes(report.data, byteorder="little")
+        return diff_key_state(self.previous_key_state, self.key_state, monotonic())
+
+    def dispatch(self, event: KeyEvent) -> None:
+        for handler, key in self._handlers:
+            if key is not None and key != event.key:
+                continue
+            try:
+                handler(event)
+            except Exception as e:
+                print(f"streamdeck handler failed on key {event.key}: {e}", file=sys.stderr)
+
+    def start_reader(self) -> None:
+        if self._reader is not None:
+            return
+        self._halt.clear()
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def stop_reader(self) -> None:
+        self._halt.set()
+        if self._reader is not None and self._reader is not threading.current_thread():
+            self._reader.join()
+        self._reader = None
+
+    def _read_loop(self) -> None:
+        while not self._halt.is_set():
+            report = self.read_input(self.READ_TIMEOUT_MS)
+            if report is None:
+                continue
+            for event in self.update_key_state(report):
+                self.dispatch(event)
+
+    def _write_reports(self, reports: bytes) -> None:
+        view = memoryview(reports)
+        with self._write_lock:
+            for offset in range(0, len(view), OUTPUT_REPORT_LENGTH):
+                self.write(bytes(view[offset : offset + OUTPUT_REPORT_LENGTH]))
+
+    def write_output(self, report_id: int, command: int, payload: bytes, index: int = 0):
+        self._write_reports(build_output_reports(report_id, command, payload, index))
+
+    @property
+    def unit_info(self) -> UnitInfo:
+        if self._unit_info is None:
+            self._unit_info = self.get_unit_info()
+        return self._unit_info
+
+    def set_key_images(self, images: dict[int, npt.NDArray]) -> int:
+        """Send (height, width, 3) RGB images to keys, returns how many were sent.
+
+        Keys already showing the same image are skipped, and the reports for all the
+        changed keys are written in one batch.
+        """
+        info = self.unit_info
+        reports = bytearray()
+        sent = 0
+        for key, pixels in images.items():
+            if pixels.shape[:2] != (info.key_height, info.key_width):
+                raise ValueError(
+                    f"key images must be {info.key_width}x{info.key_height}, "
+                    f"got {pixels.shape[1]}x{pixels.shape[0]}"
+                )
+            digest, encoded = self._image_cache.encode(
+                pixels, info.image_bpp, info.image_color_scheme
+            )
+            if self._key_images.get(key) == digest:
+                continue
+            reports += build_output_reports(
+                OUTPUT_REPORT_ID, KEY_IMAGE_COMMAND, encoded, key
+            )
+            self._key_images[key] = digest
+            sent += 1
+        if len(reports) > 0:
+            self._write_reports(reports)
+        return sent
+
+    def set_key_image(self, key: int, pixels: npt.NDArray) -> bool:
+        return self.set_key_images({key: pixels}) > 0
+
+    def set_lcd_image(self, pixels: npt.NDArray) -> None:
+        info = self.unit_info
+        _, encoded = self._image_cache.encode(
+            pixels, info.image_bpp, info.image_color_scheme
+        )
+        self.write_output(OUTPUT_REPORT_ID, LCD_IMAGE_COMMAND, encoded)
 
-    def read_input(self) -> tuple[bytes, bytes, int, bytes]:
-        response = bytearray(self.read(19))
-
-        report_id = _pop_bytes(response)
-        command = _pop_bytes(response)
-        data_length = _pop_uint(response, length=2)
-        data = _pop_bytes(response, length=data_length)
-
-        return report_id, command, data_length, data
-
-    def write_output(self, report_id: bytes, command: bytes, payload: bytes):
-        pass
-
-    def get_firmware_version(self, name: str) -> tuple[bytes, int, bytes, str]:
+    def get_firmware_version(self, name: str) -> FirmwareVersion:
         firmware = {"LD": 0x04, "AP1": 0x05, "AP2": 0x07}
         assert (
             name in firmware.keys()
         ), f"Invalid firmware name - {name} not in {firmware.keys()}"
 
-        response = bytearray(self.get_feature_report(firmware[name], 14))
-
-        report_id = _pop_bytes(response)
-        data_length = _pop_uint(response)
-        checksum = _pop_bytes(response, length=4)
-        version = _pop_chars(response, length=8)
-
-        return report_id, data_length, checksum, version
-
-    def get_serial_number(self) -> tuple[bytes, int, str]:
-        response = bytearray(self.get_feature_report(0x06, 16))
-
-        report_id = _pop_bytes(response)
-        data_length = _pop_uint(response)
-        serial_number = _pop_chars(response, length=14)
-
-        return report_id, data_length, serial_number
-
-    def get_sleep_idle(self) -> tuple[bytes, int, int]:
-        response = bytearray(self.get_feature_report(0x0A, 6))
-
-        report_id = _pop_bytes(response)
-        data_length = _pop_uint(response)
-        sleep_idle = _pop_uint(response)
-
-        return report_id, data_length, sleep_idle
-
-    def get_unit_info(
-        self,
-    ) -> tuple[bytes, int, int, int, int, int, int, int, int, int, int, int, bytes]:
-        response = bytearray(self.get_feature_report(0x08, 32))
-
-        report_id = _pop_bytes(response)
-        matrix_rows = _pop_uint(response)
-        matrix_cols = _pop_uint(response)
-        key_width = _pop_uint(response, length=2)
-        key_height = _pop_uint(response, length=2)
-        lcd_width = _pop_uint(response, length=2)
-        lcd_height = _pop_uint(response, length=2)
-        image_bpp = _pop_uint(response)
-        image_color_scheme = _pop_uint(response)
-        num_key_images = _pop_uint(response)
-        num_lcd_images = _pop_uint(response)
-        num_frames = _pop_uint(response)
-        reserved = _pop_bytes(response)
-
-        return (
-            report_id,
-            matrix_rows,
-            matrix_cols,
-            key_width,
-            key_height,
-            lcd_width,
-            lcd_height,
-            image_bpp,
-            image_color_scheme,
-            num_key_images,
-            num_lcd_images,
-            num_frames,
-            reserved,
-        )
+        return decode_firmware_version(self.get_feature_report(firmware[name], 14))
+
+    def get_serial_number(self) -> SerialNumber:
+        return decode_serial_number(self.get_feature_report(0x06, 16))
+
+    def get_sleep_idle(self) -> SleepIdle:
+        return decode_sleep_idle(self.get_feature_report(0x0A, 6))
+
+    def get_unit_info(self) -> UnitInfo:
+        return decode_unit_info(self.get_feature_report(0x08, 32))
 
     def show_logo(self) -> None:
         payload = bytes([0x03, 0x02])
@@ -131,6 +293,7 @@ class StreamDeck(hid.Device):
     def fill_key_with_color(self, index: int, r: int, g: int, b: int) -> None:
         payload = bytes([0x03, 0x06, index, r, g, b])
         self.send_feature_report(payload)
+        self._key_images.pop(index, None)
 
     def set_brightness(self, brightness: int) -> None:
         payload = bytes([0x03, 0x08, brightness])
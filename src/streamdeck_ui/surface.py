@@ -0,0 +1,95 @@
+import queue
+import sys
+import threading
+from time import monotonic
+
+from streamdeck_ui.streamdeck import KeyEvent, StreamDeck
+
+
+class KeyUpdateQueue(threading.Thread):
+    """Coalescing, rate limited key updates.
+
+    Callers only store a render function per key and return immediately. The thread
+    renders the latest function for each changed key and sends them in one batch, at
+    most fps times a second, so deck I/O never blocks the caller.
+    """
+
+    def __init__(self, deck: StreamDeck, fps: float = 10.0):
+        super().__init__(daemon=True)
+        self.deck = deck
+        self.interval = 1 / fps
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._halt = threading.Event()
+
+    def update(self, key: int, render) -> None:
+        with self._lock:
+            self._pending[key] = render
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._halt.set()
+        self._wake.set()
+        if self.is_alive():
+            self.join()
+
+    def _flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._wake.clear()
+        if len(pending) == 0:
+            return
+        try:
+            self.deck.set_key_images({key: render() for key, render in pending.items()})
+        except Exception as e:
+            print(f"streamdeck update failed: {e}", file=sys.stderr)
+
+    def run(self) -> None:
+        while not self._halt.is_set():
+            self._wake.wait()
+            start = monotonic()
+            self._flush()
+            # updates that arrive while waiting are merged into the next batch
+            self._halt.wait(max(self.interval - (monotonic() - start), 0))
+        self._flush()
+
+
+class ControlSurface:
+    """Maps key presses to named commands and key images to a rate limited queue."""
+
+    def __init__(self, deck: StreamDeck, keymap: dict[int, str], fps: float = 10.0):
+        self.deck = deck
+        self.keymap = keymap
+        self.updates = KeyUpdateQueue(deck, fps)
+        self.commands: queue.Queue[str] = queue.Queue()
+        self.info = deck.unit_info
+        deck.add_handler(self._on_key)
+
+    def __enter__(self) -> "ControlSurface":
+        self.updates.start()
+        self.deck.start_reader()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.deck.stop_reader()
+        self.updates.stop()
+
+    def _on_key(self, event: KeyEvent) -> None:
+        if event.pressed and event.key in self.keymap:
+            self.commands.put(self.keymap[event.key])
+
+    def next_command(self, timeout: float | None = None) -> str | None:
+        try:
+            return self.commands.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def clear_commands(self) -> None:
+        while self.next_command(0) is not None:
+            pass
+
+    def show(self, key: int, render) -> None:
+        """Queue render(width, height) -> RGB image for a key."""
+        width, height = self.info.key_width, self.info.key_height
+        self.updates.update(key, lambda: render(width, height))
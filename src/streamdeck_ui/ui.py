@@ -1,7 +1,27 @@
-from streamdeck_ui.streamdeck import StreamDeck
+import threading
+
+from streamdeck_ui.images import render_text
+from streamdeck_ui.streamdeck import COLS, ROWS, KeyEvent, StreamDeck
+
+
+def _print_event(event: KeyEvent) -> None:
+    action = "pressed" if event.pressed else "released"
+    print(f"key {event.key} ({event.row}, {event.col}) {action}")
 
 
 def main():
     with StreamDeck() as streamdeck:
-        result = streamdeck.read_input()
-        print(result)
+        info = streamdeck.unit_info
+        streamdeck.set_key_images(
+            {
+                key: render_text(str(key), info.key_width, info.key_height)
+                for key in range(ROWS * COLS)
+            }
+        )
+        streamdeck.add_handler(_print_event)
+        streamdeck.start_reader()
+        print("press ctrl+c to stop")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,7 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def send_audio() -> np.ndarray:
+    return np.random.default_rng(0).integers(-(2**22), 2**22, (5000, 1)).astype(np.int32)
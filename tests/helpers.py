@@ -0,0 +1,27 @@
+from core.interface import AudioInterface
+
+
+# a virtual loopback interface, see the virtual interface section of the readme for the device settings
+def virtual_interface(
+    blocksize: int = 128,
+    num_sends: int = 1,
+    num_returns: int = 2,
+    dtype: str = "int24",
+    round_trip_latency: int | None = None,
+    **virtual,
+) -> AudioInterface:
+    # as fast as the callbacks allow unless a test asks for real time
+    return AudioInterface(
+        {
+            "backend": "virtual",
+            "virtual": {"speed": 0} | virtual,
+            "device": None,
+            "blocksize": blocksize,
+            "dtype": dtype,
+            "round_trip_latency": round_trip_latency,
+            "send_channel": num_sends,
+            "return_channels": num_returns,
+            "send_level_dbu": None,
+            "return_levels_dbu": None,
+        }
+    )
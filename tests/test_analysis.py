@@ -0,0 +1,132 @@
+import json
+
+import numpy as np
+import pytest
+
+from core import analysis
+from core.analysis import analyze, clipping, delay_drift, noise_floor, null_esr, silent_head
+
+
+SAMPLERATE = 8000
+
+
+def _noise(frames: int, level: float = 2**22, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).uniform(-level, level, (frames, 1)).astype(np.int32)
+
+
+# a take with a silent head, returned after delay frames on every channel
+def _take(delay: int = 20, head: int = 1000, frames: int = 3 * SAMPLERATE) -> tuple[np.ndarray, np.ndarray]:
+    send_audio = _noise(frames)
+    send_audio[:head] = 0
+    return_audio = np.zeros((frames + delay, 3), dtype=np.int32)
+    return_audio[delay:, 0] = send_audio[:, 0] // 2
+    return_audio[delay:, 1] = -send_audio[:, 0]
+    return send_audio, return_audio
+
+
+def test_silent_head():
+    send_audio = np.zeros((analysis.BLOCKSIZE + 500, 1), dtype=np.int32)
+    assert silent_head(send_audio) == len(send_audio)
+    # samples below the threshold are still silence
+    send_audio[100] = 2**23 // 2000
+    assert silent_head(send_audio) == len(send_audio)
+    send_audio[analysis.BLOCKSIZE + 10] = -(2**20)
+    assert silent_head(send_audio) == analysis.BLOCKSIZE + 10
+    assert silent_head(send_audio, threshold_dbfs=-70.0) == 100
+
+
+def test_clipping():
+    return_audio = np.zeros((analysis.BLOCKSIZE * 2, 3), dtype=np.int32)
+    return_audio[5, 0] = 2**23 - 1
+    return_audio[analysis.BLOCKSIZE + 5 : analysis.BLOCKSIZE + 8, 0] = -(2**23)
+    return_audio[7, 1] = (2**23 - 1) // 2
+    peak_dbfs, clipped_samples = clipping(return_audio)
+    assert peak_dbfs[0] == pytest.approx(0.0, abs=1e-5)
+    assert peak_dbfs[1] == pytest.approx(-6.02, abs=0.01)
+    assert peak_dbfs[2] is None
+    assert clipped_samples == [4, 0, 0]
+
+
+def test_noise_floor():
+    return_audio = np.zeros((2000, 3), dtype=np.int32)
+    return_audio[:, 0] = round((2**23 - 1) * 10 ** (-60 / 20))
+    return_audio[::2, 1] = 2**23 - 1
+    return_audio[1::2, 1] = -(2**23 - 1)
+    floor = noise_floor(return_audio, 1000)
+    assert floor[0] == pytest.approx(-60.0, abs=0.01)
+    assert floor[1] == pytest.approx(0.0, abs=1e-5)
+    assert floor[2] is None
+    assert noise_floor(return_audio, 0) == [None, None, None]
+
+
+def test_no_drift_on_a_fixed_delay():
+    send_audio, return_audio = _take(delay=20)
+    drift_samples, drift_ppm = delay_drift(send_audio, return_audio, SAMPLERATE, 1000)
+    assert drift_samples == [0, 0, 0]
+    assert drift_ppm == [0.0, 0.0, 0.0]
+
+
+def test_drift_between_the_start_and_end():
+    frames = 4 * SAMPLERATE
+    send_audio = _noise(frames)
+    return_audio = np.zeros((frames + 23, 1), dtype=np.int32)
+    # the delay grows from 20 to 23 frames halfway through
+    half = frames // 2
+    return_audio[20 : half + 20, 0] = send_audio[:half, 0]
+    return_audio[half + 23 :, 0] = send_audio[half:, 0]
+    drift_samples, drift_ppm = delay_drift(send_audio, return_audio, SAMPLERATE, 0)
+    end = frames - SAMPLERATE
+    assert drift_samples == [3]
+    assert drift_ppm == [pytest.approx(3 / end * 1e6)]
+
+
+def test_drift_of_a_short_take_is_zero():
+    send_audio, return_audio = _take(frames=SAMPLERATE + 500)
+    assert delay_drift(send_audio, return_audio, SAMPLERATE, 1000) == ([0, 0, 0], [0.0, 0.0, 0.0])
+
+
+def test_null_esr():
+    send_audio, return_audio = _take(delay=20)
+    noise = _noise(len(return_audio) - 20, level=2**18, seed=1)[:, 0]
+    return_audio[20:, 2] = send_audio[:, 0] // 4 + noise
+    esr, null_db = null_esr(send_audio, return_audio, [20, 20, 20], [False, True, False])
+
+    # gain and inversion are matched, so the aligned copies null apart from the rounding of the halved channel
+    assert esr[0] < 1e-12
+    assert esr[1] == 0.0 and null_db[1] is None
+    signal = np.var(send_audio[:, 0] / 4.0)
+    expected = np.var(noise.astype(np.float64)) / (signal + np.var(noise.astype(np.float64)))
+    assert esr[2] == pytest.approx(expected, rel=0.05)
+    assert null_db[2] == pytest.approx(10 * np.log10(expected), abs=0.25)
+
+
+def test_misaligned_channels_dont_null():
+    send_audio, return_audio = _take(delay=20)
+    esr, null_db = null_esr(send_audio, return_audio, [0, 0, 0], [False, False, False])
+    assert esr[0] > 0.9
+    assert esr[2] is None and null_db[2] is None
+
+
+# the sums are accumulated block by block, so the block size doesn't change the result
+def test_metrics_dont_depend_on_the_blocksize(monkeypatch):
+    send_audio, return_audio = _take(delay=20)
+    return_audio[20:, 2] = send_audio[:, 0] // 4 + _noise(len(send_audio), level=2**18, seed=1)[:, 0]
+    args = (send_audio, return_audio, SAMPLERATE, [20, 20, 20], [False, True, False])
+    whole = analyze(*args)
+    monkeypatch.setattr(analysis, "BLOCKSIZE", 999)
+    blocked = analyze(*args)
+    assert blocked.keys() == whole.keys()
+    for key in ["peak_dbfs", "clipped_samples", "noise_floor_dbfs", "drift_samples", "drift_ppm"]:
+        assert blocked[key] == whole[key]
+    # the channels that null are only zero up to the rounding of the sums
+    assert blocked["esr"] == pytest.approx(whole["esr"], rel=1e-9, abs=1e-12)
+    assert blocked["null_db"][2] == pytest.approx(whole["null_db"][2])
+
+
+def test_analysis_is_json_serializable():
+    send_audio, return_audio = _take(delay=20)
+    metrics = analyze(send_audio, return_audio, SAMPLERATE, [20, 20, 20], [False, True, False])
+    json.dumps(metrics, allow_nan=False)
+    assert metrics["noise_floor_dbfs"] == [None, None, None]
+    assert metrics["clipped_samples"] == [0, 0, 0]
+    assert metrics["drift_samples"] == [0, 0, 0]
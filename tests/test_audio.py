@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from core.audio import LatencyAdjustment, calculate_latency, cross_correlate, process_block, process_recordings
+from core.wavfile import WavReader, write_wav
+
+
+# one sample at a time, the way the delays and signs are defined
+def _reference_block(return_audio, start, stop, delays, signs):
+    block = np.zeros((stop - start, len(delays)), dtype=np.int32)
+    for channel, (delay, sign) in enumerate(zip(delays, signs)):
+        for frame in range(start, stop):
+            source = frame + delay
+            if 0 <= source < len(return_audio):
+                block[frame - start, channel] = return_audio[source, channel] * sign
+    return block
+
+
+@pytest.fixture
+def return_audio():
+    return np.random.default_rng(0).integers(-(2**23), 2**23, (500, 3)).astype(np.int32)
+
+
+@pytest.mark.parametrize(
+    "delays, signs",
+    [
+        ([0, 0, 0], [1, 1, 1]),
+        ([5, 17, 0], [1, -1, 1]),
+        ([-3, 0, 12], [-1, -1, 1]),
+        ([-20, -5, -1], [1, 1, -1]),
+        # delays past either end leave the channel silent
+        ([600, -600, 3], [1, -1, 1]),
+    ],
+)
+@pytest.mark.parametrize("start, stop", [(0, 500), (0, 64), (100, 164), (480, 500), (450, 600)])
+def test_process_block_matches_reference(return_audio, delays, signs, start, stop):
+    delays = np.array(delays, dtype=np.int64)
+    signs = np.array(signs, dtype=np.int32)
+    block = process_block(return_audio, start, stop, delays, signs)
+    assert block.dtype == np.int32
+    np.testing.assert_array_equal(block, _reference_block(return_audio, start, stop, delays, signs))
+
+
+def test_process_block_doesnt_modify_the_recording(return_audio):
+    original = return_audio.copy()
+    process_block(return_audio, 0, 500, np.array([2, 0, -2]), np.array([-1, -1, -1], dtype=np.int32))
+    np.testing.assert_array_equal(return_audio, original)
+
+
+def test_blocks_concatenate_to_the_whole_recording(return_audio):
+    delays = np.array([7, -4, 0], dtype=np.int64)
+    signs = np.array([1, -1, -1], dtype=np.int32)
+    blocks = [process_block(return_audio, start, min(start + 64, 500), delays, signs) for start in range(0, 500, 64)]
+    np.testing.assert_array_equal(np.concatenate(blocks), process_block(return_audio, 0, 500, delays, signs))
+
+
+def test_process_block_reads_a_memmapped_recording(return_audio, tmp_path):
+    write_wav(tmp_path / "recording.wav", return_audio, 48000)
+    reader = WavReader(tmp_path / "recording.wav")
+    delays = np.array([3, 0, -8], dtype=np.int64)
+    signs = np.array([-1, 1, 1], dtype=np.int32)
+    np.testing.assert_array_equal(
+        process_block(reader, 10, 300, delays, signs), process_block(return_audio, 10, 300, delays, signs)
+    )
+
+
+def test_process_recordings_trims_to_the_send(return_audio):
+    send_audio = np.zeros((400, 1), dtype=np.int32)
+    processed = process_recordings(send_audio, return_audio, [4, 4, 4], [False, True, False])
+    assert processed.shape == (400, 3)
+    np.testing.assert_array_equal(processed[:, 0], return_audio[4:404, 0])
+    np.testing.assert_array_equal(processed[:, 1], -return_audio[4:404, 1])
+
+
+def test_process_recordings_adjustments(return_audio):
+    send_audio = np.zeros((400, 1), dtype=np.int32)
+    # INDIVIDUAL applies the first channel's delay to every channel, NONE doesn't shift at all
+    individual = process_recordings(send_audio, return_audio, [4, 9, 2], [False] * 3, LatencyAdjustment.INDIVIDUAL)
+    np.testing.assert_array_equal(individual, return_audio[4:404])
+    none = process_recordings(send_audio, return_audio, [4, 9, 2], [True] * 3, LatencyAdjustment.NONE, False)
+    np.testing.assert_array_equal(none, return_audio[:400])
+
+
+@pytest.mark.parametrize("len_a, len_b", [(1, 1), (64, 64), (100, 37), (37, 100), (1000, 999), (513, 1024)])
+def test_cross_correlate_matches_direct(len_a, len_b):
+    rng = np.random.default_rng(len_a * len_b)
+    a = rng.uniform(-1.0, 1.0, len_a)
+    b = rng.uniform(-1.0, 1.0, len_b)
+    direct = np.correlate(a, b, mode="full")
+    result = cross_correlate(a, b)
+    assert result.shape == direct.shape
+    np.testing.assert_allclose(result, direct, atol=1e-9)
+    assert np.argmax(result) == np.argmax(direct)
+
+
+@pytest.mark.parametrize("delay", [0, 1, 256, 4099])
+def test_calculate_latency_finds_delay_and_inversion(delay):
+    samplerate = 8000
+    send_audio = np.random.default_rng(delay).integers(-(2**22), 2**22, (samplerate * 2, 1)).astype(np.int32)
+    return_audio = np.zeros((len(send_audio) + delay, 2), dtype=np.int32)
+    return_audio[delay:, 0] = send_audio[:, 0] // 2
+    return_audio[delay:, 1] = -send_audio[:, 0]
+    delays, inversions = calculate_latency(send_audio, return_audio, samplerate, cross_correlation_seconds=1)
+    assert delays == [delay, delay]
+    assert inversions == [False, True]
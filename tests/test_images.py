@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from streamdeck_ui.images import ImageCache, encode_image, render_meter, render_text
+
+
+def _pixels(height: int = 72, width: int = 72, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("bpp, bytes_per_pixel", [(24, 3), (16, 2)])
+@pytest.mark.parametrize("height, width", [(72, 72), (100, 800)])
+def test_encoded_size(bpp, bytes_per_pixel, height, width):
+    for color_scheme in [0, 1]:
+        encoded = encode_image(_pixels(height, width), bpp, color_scheme)
+        assert len(encoded) == height * width * bytes_per_pixel
+
+
+def test_24_bit_channel_order():
+    pixels = _pixels()
+    rgb = np.frombuffer(encode_image(pixels, 24, 0), dtype=np.uint8).reshape(pixels.shape)
+    bgr = np.frombuffer(encode_image(pixels, 24, 1), dtype=np.uint8).reshape(pixels.shape)
+    np.testing.assert_array_equal(rgb, pixels)
+    np.testing.assert_array_equal(bgr, pixels[..., ::-1])
+
+
+def test_16_bit_is_little_endian_565():
+    pixels = np.array([[[255, 255, 255], [255, 0, 0], [0, 255, 0], [0, 0, 255], [8, 4, 8]]], dtype=np.uint8)
+    packed = np.frombuffer(encode_image(pixels, 16, 0), dtype="<u2")
+    assert packed.tolist() == [0xFFFF, 0xF800, 0x07E0, 0x001F, 0x0821]
+    # the blue first scheme swaps the 5 bit fields
+    swapped = np.frombuffer(encode_image(pixels, 16, 1), dtype="<u2")
+    assert swapped.tolist() == [0xFFFF, 0x001F, 0x07E0, 0xF800, 0x0821]
+
+
+def test_encode_image_accepts_views():
+    pixels = _pixels(144, 144)[::2, ::2]
+    assert encode_image(pixels, 24, 0) == encode_image(pixels.copy(), 24, 0)
+
+
+@pytest.mark.parametrize("bpp, color_scheme", [(8, 0), (32, 0), (24, 2)])
+def test_unsupported_formats(bpp, color_scheme):
+    with pytest.raises(ValueError):
+        encode_image(_pixels(), bpp, color_scheme)
+
+
+def test_cache_returns_the_same_encoding(monkeypatch):
+    cache = ImageCache()
+    pixels = _pixels()
+    digest, encoded = cache.encode(pixels, 24, 1)
+    assert encoded == encode_image(pixels, 24, 1)
+
+    # a hit doesn't encode again
+    monkeypatch.setattr("streamdeck_ui.images.encode_image", lambda *args: pytest.fail("encoded a cached image"))
+    assert cache.encode(pixels.copy(), 24, 1) == (digest, encoded)
+
+
+def test_cache_keys_include_the_format():
+    cache = ImageCache()
+    pixels = _pixels()
+    digests = {cache.encode(pixels, bpp, color_scheme)[0] for bpp in [16, 24] for color_scheme in [0, 1]}
+    assert len(digests) == 4
+    # the same bytes in a different shape are a different image
+    assert cache.encode(pixels.reshape(36, 144, 3), 24, 1)[0] != cache.encode(pixels, 24, 1)[0]
+
+
+def test_cache_evicts_least_recently_used():
+    cache = ImageCache(max_entries=2)
+    images = [_pixels(seed=seed) for seed in range(3)]
+    digests = [cache.encode(image, 24, 0)[0] for image in images[:2]]
+    cache.encode(images[0], 24, 0)
+    digests.append(cache.encode(images[2], 24, 0)[0])
+    assert list(cache._entries) == [digests[0], digests[2]]
+
+
+def test_rendered_keys_encode_at_the_key_size():
+    for image in [render_text("REC", 72, 72), render_meter(-12.0, 72, 72, clip=True, label="L")]:
+        assert image.shape == (72, 72, 3)
+        assert len(encode_image(image, 16, 0)) == 72 * 72 * 2
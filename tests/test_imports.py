@@ -0,0 +1,16 @@
+from pathlib import Path
+
+from benchmarks.imports import ENTRY_POINTS, check_imports
+
+
+SRC = Path(__file__).parents[1] / "src"
+
+
+# the entry points are imported in fresh interpreters, which only find the packages through PYTHONPATH
+def test_entry_points_dont_import_heavy_modules(monkeypatch):
+    monkeypatch.setenv("PYTHONPATH", str(SRC))
+    results = check_imports()
+    assert sorted(results) == sorted(ENTRY_POINTS)
+    for module, result in results.items():
+        assert "error" not in result, f"{module}: {result.get('error')}"
+        assert result["heavy_modules"] == [], f"{module} imports {result['heavy_modules']}"
@@ -0,0 +1,99 @@
+import io
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from core.audio import MAX_VAL_INT24
+from core.meter import LevelMeter, MeterDisplay
+
+
+CHANNELS = 4
+BLOCKSIZE = 256
+
+
+def _block(frames: int = BLOCKSIZE, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).integers(-(2**22), 2**22, (frames, CHANNELS)).astype(np.int32)
+
+
+def _buffers(meter: LevelMeter) -> list[int]:
+    return [id(buffer) for buffer in (meter.peak, meter.window_peak, meter.mean_square, meter.max_peak, meter.clips)]
+
+
+def test_publish_levels():
+    meter = LevelMeter(CHANNELS, BLOCKSIZE)
+    block = _block()
+    block[10, 1] = MAX_VAL_INT24
+    block[20:23, 3] = -MAX_VAL_INT24 - 1
+    meter.publish(block)
+
+    np.testing.assert_array_equal(meter.peak, np.abs(block).max(axis=0))
+    np.testing.assert_allclose(meter.mean_square, np.mean(block.astype(np.float64) ** 2, axis=0))
+    assert meter.clips.tolist() == [0, 1, 0, 3]
+    assert meter.sequence == 1
+
+    quiet = block // 16
+    meter.publish(quiet)
+    # the max and window peaks hold the loudest block, clips accumulate
+    np.testing.assert_array_equal(meter.peak, np.abs(quiet).max(axis=0))
+    np.testing.assert_array_equal(meter.max_peak, np.abs(block).max(axis=0))
+    np.testing.assert_array_equal(meter.window_peak, np.abs(block).max(axis=0))
+    assert meter.clips.tolist() == [0, 1, 0, 3]
+
+
+def test_read_levels_resets_the_window_peak():
+    meter = LevelMeter(CHANNELS, BLOCKSIZE)
+    block = np.full((BLOCKSIZE, CHANNELS), MAX_VAL_INT24 // 2, dtype=np.int32)
+    block[:, 0] = 0
+    meter.publish(block)
+    peak_dbfs, rms_dbfs = meter.read_levels()
+    assert peak_dbfs[0] == rms_dbfs[0] == -np.inf
+    np.testing.assert_allclose(peak_dbfs[1:], -6.02, atol=0.01)
+    np.testing.assert_allclose(rms_dbfs[1:], -6.02, atol=0.01)
+    assert not meter.window_peak.any()
+    assert meter.max_peak[1] == MAX_VAL_INT24 // 2
+
+
+# the audio callback publishes every block, so it mustn't allocate anything the size of a block
+@pytest.mark.parametrize("frames", [BLOCKSIZE, 16 * BLOCKSIZE])
+def test_publish_doesnt_allocate_per_block(frames):
+    meter = LevelMeter(CHANNELS, frames)
+    block = _block(frames)
+    buffers = _buffers(meter)
+    meter.publish(block)
+
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        for _ in range(100):
+            meter.publish(block)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # numpy's reductions allocate a small fixed amount per call, independent of the block size
+    assert peak - start < 4 * 1024
+    assert current - start < 1024
+    assert _buffers(meter) == buffers
+
+
+def test_publish_grows_for_larger_and_accepts_smaller_blocks():
+    meter = LevelMeter(CHANNELS, BLOCKSIZE)
+    for frames in [2 * BLOCKSIZE, 7, 0]:
+        block = _block(frames, seed=frames)
+        meter.publish(block)
+        if frames > 0:
+            np.testing.assert_array_equal(meter.peak, np.abs(block).max(axis=0))
+    assert meter.sequence == 2
+
+
+def test_display_renders_every_channel():
+    meter = LevelMeter(2, BLOCKSIZE)
+    block = np.zeros((BLOCKSIZE, 2), dtype=np.int32)
+    block[0, 1] = MAX_VAL_INT24
+    meter.publish(block)
+    display = MeterDisplay(meter, ["L", "R"], status=lambda: "take 1", output=io.StringIO())
+    display._update()
+    line = display.render()
+    assert line.startswith("take 1 L [")
+    assert line.count("[") == 2
+    assert line.rstrip().endswith("CLIP")
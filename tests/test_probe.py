@@ -0,0 +1,76 @@
+import pytest
+
+from core.probe import device_key, validate_config, validate_interface
+from tests.helpers import virtual_interface
+
+
+def _capabilities(**overrides) -> dict:
+    return {
+        "key": "Core Audio:Interface:8:8",
+        "name": "Interface",
+        "hostapi": "Core Audio",
+        "max_input_channels": 8,
+        "max_output_channels": 8,
+        "default_samplerate": 48000.0,
+        "input_samplerates": [44100, 48000, 96000],
+        "output_samplerates": [44100, 48000, 96000],
+        "input_dtypes": ["int16", "int24", "int32", "float32"],
+        "output_dtypes": ["int16", "int24", "int32", "float32"],
+        "blocksizes": {str(blocksize): {"input_latency": 0.01, "output_latency": 0.01} for blocksize in [64, 128, 256]},
+    } | overrides
+
+
+def test_supported_config():
+    validate_config(_capabilities(), 48000, 128, 2, 8)
+
+
+@pytest.mark.parametrize(
+    "overrides, args, message",
+    [
+        ({}, (48000, 128, 9, 2), "9 sends requested, device has 8 outputs"),
+        ({}, (48000, 128, 1, 9), "9 returns requested, device has 8 inputs"),
+        ({"output_samplerates": [44100]}, (48000, 128, 1, 2), "samplerate 48000 not supported on outputs"),
+        ({"input_samplerates": [44100]}, (48000, 128, 1, 2), "samplerate 48000 not supported on inputs"),
+        ({"output_dtypes": ["float32"]}, (48000, 128, 1, 2), "dtype int24 not supported on outputs"),
+        ({"input_dtypes": ["int16"]}, (48000, 128, 1, 2), "dtype int24 not supported on inputs"),
+        ({}, (48000, 512, 1, 2), "blocksize 512 not supported"),
+    ],
+)
+def test_unsupported_config(overrides, args, message):
+    with pytest.raises(ValueError, match=f"not supported by Interface: {message}$"):
+        validate_config(_capabilities(**overrides), *args)
+
+
+def test_every_problem_is_reported():
+    with pytest.raises(ValueError) as error:
+        validate_config(_capabilities(input_dtypes=[]), 192000, 4096, 10, 2, "int24")
+    for message in [
+        "10 sends requested",
+        "samplerate 192000 not supported on outputs",
+        "samplerate 192000 not supported on inputs",
+        "dtype int24 not supported on inputs",
+        "blocksize 4096 not supported",
+    ]:
+        assert message in str(error.value)
+
+
+# a device without inputs or outputs only has its other direction checked
+def test_output_only_device():
+    capabilities = _capabilities(max_input_channels=0, input_samplerates=[], input_dtypes=[])
+    validate_config(capabilities, 48000, 128, 2, 0)
+    with pytest.raises(ValueError, match="returns requested"):
+        validate_config(capabilities, 48000, 128, 2, 1)
+
+
+# portaudio is only asked about the standard block sizes, other sizes are left to the stream to accept
+def test_non_standard_blocksizes_arent_checked():
+    validate_config(_capabilities(), 48000, 100, 2, 2)
+
+
+def test_virtual_interfaces_arent_probed():
+    validate_interface(None, virtual_interface(num_sends=64, num_returns=64), 22050)
+
+
+def test_device_key():
+    info = {"name": "Interface", "max_input_channels": 8, "max_output_channels": 4}
+    assert device_key(info, "ALSA") == "ALSA:Interface:8:4"
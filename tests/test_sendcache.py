@@ -0,0 +1,102 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from core.sendcache import INDEX_NAME, SendCache, send_cache_dir
+from core.stream import CaptureStream
+from core.util import read_config
+from core.wave import AudioWave
+from core.wavfile import write_wav
+from tests.helpers import virtual_interface
+
+
+SAMPLERATE = 48000
+LEVEL_DBFS = -6.0
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch) -> Path:
+    Path(tmp_path, "project", ".forge", "inputs").mkdir(parents=True)
+    Path(tmp_path, "elsewhere").mkdir()
+    monkeypatch.chdir(Path(tmp_path, "elsewhere"))
+    return Path(tmp_path, "project")
+
+
+@pytest.fixture
+def input_path(project, send_audio) -> Path:
+    path = Path(project, ".forge", "inputs", "input.wav")
+    write_wav(path, send_audio, SAMPLERATE)
+    return path
+
+
+def test_cache_dir_is_in_the_project(project, input_path):
+    assert send_cache_dir(input_path) == Path(project, ".forge", "cache").resolve()
+    SendCache(send_cache_dir(input_path)).get(input_path, LEVEL_DBFS, SAMPLERATE)
+    assert Path(project, ".forge", "cache", INDEX_NAME + ".json").exists()
+    assert not Path(".forge").exists()
+
+
+@pytest.mark.parametrize("level_dbfs", [LEVEL_DBFS, 0.0, 12.0])
+def test_cached_send_is_bit_exact(project, input_path, send_audio, level_dbfs):
+    wave = SendCache(send_cache_dir(input_path)).wave(input_path, level_dbfs, SAMPLERATE)
+    assert wave.prescaled
+    # sends over full scale are clipped the way Stream.render clips them
+    expected = np.clip(AudioWave(send_audio, SAMPLERATE, level_dbfs).audio, -(2**23), 2**23 - 1)
+    np.testing.assert_array_equal(wave.audio, expected)
+
+
+def test_cached_take_matches_uncached_take(project, input_path, send_audio):
+    cached = SendCache(send_cache_dir(input_path)).wave(input_path, LEVEL_DBFS, SAMPLERATE)
+    returns = []
+    for send in [cached, send_audio]:
+        stream = CaptureStream(virtual_interface(latency=128), send, SAMPLERATE, LEVEL_DBFS)
+        with stream:
+            assert stream.done.wait(timeout=30)
+        returns.append(stream.return_audio)
+    np.testing.assert_array_equal(returns[0], returns[1])
+
+
+def test_hits_dont_rebuild(project, input_path):
+    cache = SendCache(send_cache_dir(input_path))
+    path, frames = cache.get(input_path, LEVEL_DBFS, SAMPLERATE)
+    mtime_ns = path.stat().st_mtime_ns
+    assert cache.get(input_path, LEVEL_DBFS, SAMPLERATE) == (path, frames)
+    assert path.stat().st_mtime_ns == mtime_ns
+
+
+def test_least_recently_used_is_evicted(project, input_path, send_audio):
+    # room for two buffers
+    cache = SendCache(send_cache_dir(input_path), max_bytes=2 * len(send_audio) * 3)
+    paths = [cache.get(input_path, level_dbfs, SAMPLERATE)[0] for level_dbfs in [-6.0, -12.0]]
+    cache.get(input_path, -6.0, SAMPLERATE)
+    paths.append(cache.get(input_path, -18.0, SAMPLERATE)[0])
+    assert [path.exists() for path in paths] == [True, False, True]
+    assert set(read_config(cache.index_path)) == {path.stem for path in [paths[0], paths[2]]}
+    assert list(Path(cache.cache_dir).glob("*.tmp")) == []
+
+
+def test_buffer_over_budget_is_kept(project, input_path):
+    cache = SendCache(send_cache_dir(input_path), max_bytes=0)
+    path, _ = cache.get(input_path, LEVEL_DBFS, SAMPLERATE)
+    assert path.exists()
+
+
+def _get(input_path: Path, level_dbfs: float) -> str:
+    return SendCache(send_cache_dir(input_path)).get(input_path, level_dbfs, SAMPLERATE)[0].stem
+
+
+def test_concurrent_gets_keep_all_entries(project, input_path):
+    levels = [-float(level) for level in range(12)]
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        keys = list(executor.map(_get, [input_path] * len(levels), levels))
+    assert set(read_config(Path(send_cache_dir(input_path), INDEX_NAME + ".json"))) == set(keys)
+
+
+def test_clear(project, input_path):
+    cache = SendCache(send_cache_dir(input_path))
+    path, _ = cache.get(input_path, LEVEL_DBFS, SAMPLERATE)
+    cache.clear()
+    assert not path.exists()
+    assert not cache.index_path.exists()
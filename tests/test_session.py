@@ -0,0 +1,97 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from capture.align import RECORDING_FILE
+from capture.session import (
+    MIN_PARTIAL_SECONDS,
+    PARTIAL_RECORDING_FILE,
+    CaptureState,
+    get_state,
+    read_state,
+    recover_partial,
+    set_state,
+)
+from core.wavfile import WavWriter, read_wav
+
+
+SAMPLERATE = 1000
+
+
+def _write_partial(output_dir: Path, frames: int) -> np.ndarray:
+    data = np.arange(frames * 2, dtype=np.int32).reshape((frames, 2))
+    with WavWriter(Path(output_dir, PARTIAL_RECORDING_FILE), SAMPLERATE, 2) as writer:
+        writer.write(data)
+    return data
+
+
+def test_missing_state_is_pending(tmp_path):
+    assert read_state(tmp_path) == {"state": "pending"}
+    (tmp_path / "state.json").write_text("{")
+    assert get_state(tmp_path) == CaptureState.PENDING
+
+
+def test_set_state_keeps_fields(tmp_path):
+    set_state(tmp_path, CaptureState.RECORDED, partial_frames=10)
+    state = read_state(tmp_path)
+    assert state["state"] == "recorded"
+    assert state["partial_frames"] == 10
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+# a take that only misses the latency tail is complete
+def test_recover_whole_take(tmp_path):
+    data = _write_partial(tmp_path, 8000)
+    assert recover_partial(tmp_path, 8000, SAMPLERATE) == CaptureState.RECORDED
+    assert not (tmp_path / PARTIAL_RECORDING_FILE).exists()
+    np.testing.assert_array_equal(read_wav(tmp_path / RECORDING_FILE)[0], data)
+    state = read_state(tmp_path)
+    assert state["state"] == "recorded"
+    assert (state["partial_frames"], state["send_frames"]) == (8000, 8000)
+
+
+def test_recover_usable_partial(tmp_path):
+    frames = SAMPLERATE * MIN_PARTIAL_SECONDS + 1
+    _write_partial(tmp_path, frames)
+    assert recover_partial(tmp_path, SAMPLERATE * 60, SAMPLERATE) == CaptureState.RECORDED
+    assert (tmp_path / RECORDING_FILE).exists()
+    state = read_state(tmp_path)
+    assert (state["partial_frames"], state["send_frames"]) == (frames, SAMPLERATE * 60)
+
+
+# the process died after a checkpoint, what was written since isn't in the header and is dropped
+def test_recover_up_to_the_last_checkpoint(tmp_path):
+    checkpoint = SAMPLERATE * MIN_PARTIAL_SECONDS
+    data = np.arange(checkpoint * 4, dtype=np.int32).reshape((checkpoint * 2, 2))
+    writer = WavWriter(Path(tmp_path, PARTIAL_RECORDING_FILE), SAMPLERATE, 2)
+    writer.write(data[:checkpoint])
+    writer.flush(sync=True)
+    writer.write(data[checkpoint:])
+    writer.fp.close()
+
+    assert recover_partial(tmp_path, SAMPLERATE * 60, SAMPLERATE) == CaptureState.RECORDED
+    np.testing.assert_array_equal(read_wav(tmp_path / RECORDING_FILE)[0], data[:checkpoint])
+    assert read_state(tmp_path)["partial_frames"] == checkpoint
+
+
+def test_short_partial_is_rerecorded(tmp_path):
+    _write_partial(tmp_path, SAMPLERATE * MIN_PARTIAL_SECONDS - 1)
+    assert recover_partial(tmp_path, SAMPLERATE * 60, SAMPLERATE) == CaptureState.PENDING
+    assert not (tmp_path / PARTIAL_RECORDING_FILE).exists()
+    assert not (tmp_path / RECORDING_FILE).exists()
+    assert get_state(tmp_path) == CaptureState.PENDING
+
+
+# sends shorter than the minimum only need to be complete
+@pytest.mark.parametrize("frames, state", [(2000, CaptureState.RECORDED), (1999, CaptureState.PENDING)])
+def test_short_send(tmp_path, frames, state):
+    _write_partial(tmp_path, frames)
+    assert recover_partial(tmp_path, 2000, SAMPLERATE) == state
+
+
+def test_missing_or_unreadable_partial(tmp_path):
+    assert recover_partial(tmp_path, 2000, SAMPLERATE) == CaptureState.PENDING
+    (tmp_path / PARTIAL_RECORDING_FILE).write_bytes(b"RIFF")
+    assert recover_partial(tmp_path, 2000, SAMPLERATE) == CaptureState.PENDING
+    assert not (tmp_path / PARTIAL_RECORDING_FILE).exists()
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from core.storage import FlacStorage, Storage, encode_file, encode_files, find_audio, open_reader, open_writer
+from core.wavfile import read_wav, write_wav
+
+
+pytest.importorskip("soundfile")
+
+
+# full scale samples for the width, including both extremes
+def _samples(sampwidth: int, frames: int = 70000, channels: int = 3) -> np.ndarray:
+    low, high = -(2 ** (8 * sampwidth - 1)), 2 ** (8 * sampwidth - 1) - 1
+    data = np.random.default_rng(sampwidth).integers(low, high + 1, (frames, channels)).astype(np.int32)
+    data[0] = low
+    data[1] = high
+    return data
+
+
+@pytest.mark.parametrize("sampwidth", [1, 2, 3])
+def test_flac_round_trip_is_bit_exact(tmp_path, sampwidth):
+    data = _samples(sampwidth)
+    path = tmp_path / "capture.flac"
+    with open_writer(path, 48000, data.shape[1], sampwidth) as writer:
+        # written in pieces that don't line up with the writer's chunks
+        for start in range(0, len(data), 30000):
+            writer.write(data[start : start + 30000])
+
+    with open_reader(path) as reader:
+        assert (reader.samplerate, reader.sampwidth, reader.shape) == (48000, sampwidth, data.shape)
+        np.testing.assert_array_equal(reader[:], data)
+        np.testing.assert_array_equal(reader[1000:1010, 2], data[1000:1010, 2])
+        np.testing.assert_array_equal(reader[-1], data[-1])
+        np.testing.assert_array_equal(reader.read(65530, 65540), data[65530:65540])
+        # numpy integers index like ints
+        np.testing.assert_array_equal(reader[np.int64(5)], data[5])
+        assert reader[np.int64(-1), np.int64(2)] == data[-1, 2]
+
+
+def test_encode_file_wav_to_flac_and_back(tmp_path):
+    data = _samples(3)
+    wav_path = tmp_path / "recording.wav"
+    write_wav(wav_path, data, 44100)
+
+    flac_path = encode_file(wav_path, "flac", remove_source=True, blocksize=10000)
+    assert flac_path == tmp_path / "recording.flac"
+    assert not wav_path.exists()
+    assert find_audio(tmp_path, "recording") == flac_path
+
+    wav_path = encode_file(flac_path, "wav")
+    samples, samplerate = read_wav(wav_path)
+    assert samplerate == 44100
+    np.testing.assert_array_equal(samples, data)
+
+
+def test_encode_files_returns_failures(tmp_path):
+    good = tmp_path / "good.wav"
+    write_wav(good, _samples(3, frames=100), 48000)
+    bad = tmp_path / "bad.wav"
+    bad.write_bytes(b"not a wav file")
+
+    results, failures = encode_files([good, bad], "flac", max_workers=1)
+    assert results == {good: tmp_path / "good.flac"}
+    assert list(failures) == [bad]
+    assert isinstance(failures[bad], ValueError)
+
+
+def test_storage_is_abstract():
+    with pytest.raises(TypeError):
+        Storage()
+    assert FlacStorage().path(".", "capture").name == "capture.flac"
@@ -0,0 +1,209 @@
+import numpy as np
+import pytest
+
+from core.backend import Backend, get_backend
+from core.stream import CaptureStream, DuplexEngine, SendStream, Stream
+from core.wave import AudioWave
+from tests.helpers import virtual_interface
+
+
+SAMPLERATE = 48000
+LEVEL_DBFS = -6.0
+
+
+def _record(stream: CaptureStream) -> CaptureStream:
+    with stream:
+        assert stream.done.wait(timeout=30)
+    return stream
+
+
+# the virtual device loops the send back into every return after its latency
+@pytest.mark.parametrize("dtype", ["int24", "int32", "float32"])
+@pytest.mark.parametrize("latency", [128, 300])
+def test_loopback_is_bit_exact(send_audio, dtype, latency):
+    interface = virtual_interface(dtype=dtype, latency=latency)
+    stream = _record(CaptureStream(interface, send_audio, SAMPLERATE, LEVEL_DBFS))
+    sent = AudioWave(send_audio, SAMPLERATE, LEVEL_DBFS).audio
+
+    assert len(stream.return_audio) == len(send_audio) + 10 * interface.blocksize
+    assert not stream.return_audio[:latency].any()
+    for channel in range(interface.num_returns):
+        np.testing.assert_array_equal(stream.return_audio[latency : latency + len(send_audio), channel], sent)
+
+
+def test_inverted_device(send_audio):
+    interface = virtual_interface(latency=128, invert=True)
+    stream = _record(CaptureStream(interface, send_audio, SAMPLERATE, LEVEL_DBFS))
+    sent = AudioWave(send_audio, SAMPLERATE, LEVEL_DBFS).audio
+    np.testing.assert_array_equal(stream.return_audio[128 : 128 + len(send_audio), 0], -sent)
+
+
+def test_injected_xruns_show_up_in_telemetry(send_audio):
+    interface = virtual_interface(latency=128, xrun_frames=[1000, 3000])
+    telemetry = _record(CaptureStream(interface, send_audio, SAMPLERATE, LEVEL_DBFS)).get_telemetry()
+    # the virtual device flags an input overflow and output underflow together, once per block
+    assert telemetry["input_xruns"] == telemetry["output_xruns"] == 2
+    assert telemetry["xrun_frames"] == [1000 // 128 * 128, 3000 // 128 * 128]
+    assert telemetry["frames"] >= len(send_audio)
+
+
+# a ring smaller than the take drained while it records gives back the same audio as the whole take
+@pytest.mark.parametrize("ring_frames", [2048, 4096])
+def test_ring_buffer_drain(send_audio, ring_frames):
+    interface = virtual_interface(latency=128)
+    whole = _record(CaptureStream(interface, send_audio, SAMPLERATE, LEVEL_DBFS))
+
+    # real time, so the drains keep up with the ring
+    interface = virtual_interface(latency=128, speed=1.0)
+    stream = CaptureStream(interface, send_audio, SAMPLERATE, LEVEL_DBFS, ring_frames=ring_frames)
+    assert len(stream.return_audio) == ring_frames
+    drained = []
+    with stream:
+        while not stream.done.wait(timeout=0.002):
+            drained.append(stream.drain())
+    drained.append(stream.drain())
+
+    assert len(drained) > 2
+    np.testing.assert_array_equal(np.concatenate(drained), whole.return_audio)
+    assert len(stream.drain()) == 0
+
+
+def test_ring_buffer_overrun(send_audio):
+    interface = virtual_interface(latency=128)
+    stream = _record(CaptureStream(interface, send_audio, SAMPLERATE, LEVEL_DBFS, ring_frames=1000))
+    with pytest.raises(RuntimeError, match="overrun"):
+        stream.drain()
+
+
+def test_stream_is_abstract():
+    with pytest.raises(TypeError):
+        Stream(virtual_interface(), AudioWave(np.zeros((10, 1), dtype=np.int32), SAMPLERATE, LEVEL_DBFS))
+
+
+# consecutive takes in one engine record like takes that open their own stream
+def test_engine_takes_match_standalone_takes(send_audio):
+    interface = virtual_interface(latency=300)
+    standalone = _record(CaptureStream(interface, send_audio, SAMPLERATE, LEVEL_DBFS))
+    with DuplexEngine(interface, SAMPLERATE) as engine:
+        for _ in range(3):
+            take = _record(CaptureStream(interface, send_audio, SAMPLERATE, LEVEL_DBFS, engine=engine))
+            np.testing.assert_array_equal(take.return_audio, standalone.return_audio)
+
+
+# without a measured round trip the input and output latency the stream reports are used
+@pytest.mark.parametrize("round_trip_latency, settle_blocks", [(None, 6), (1000, 9)])
+def test_engine_settles_on_the_round_trip(round_trip_latency, settle_blocks):
+    interface = virtual_interface(latency=300, round_trip_latency=round_trip_latency)
+    with DuplexEngine(interface, SAMPLERATE) as engine:
+        assert engine._settle_blocks == settle_blocks
+
+
+# a take stopped and started again waits for the outputs to settle again
+def test_engine_resettles_a_reattached_take(send_audio):
+    interface = virtual_interface(latency=128, speed=1.0, round_trip_latency=2048)
+    with DuplexEngine(interface, SAMPLERATE) as engine:
+        take = CaptureStream(interface, send_audio, SAMPLERATE, LEVEL_DBFS, engine=engine)
+        with take:
+            while take.frame == 0:
+                take.done.wait(timeout=0.001)
+        assert engine._started is None
+        with take:
+            # settling takes 17 blocks, about 45 ms
+            assert engine._started is None
+            assert take.done.wait(timeout=5)
+
+
+def test_engine_rejects_a_second_take(send_audio):
+    interface = virtual_interface(latency=128, speed=1.0)
+    with DuplexEngine(interface, SAMPLERATE) as engine:
+        first = CaptureStream(interface, send_audio, SAMPLERATE, LEVEL_DBFS, engine=engine)
+        second = CaptureStream(interface, send_audio, SAMPLERATE, LEVEL_DBFS, engine=engine)
+        with first:
+            with pytest.raises(RuntimeError):
+                engine.attach(second)
+        with pytest.raises(ValueError):
+            engine.attach(CaptureStream(interface, send_audio, SAMPLERATE // 2, LEVEL_DBFS))
+
+
+def test_backend_is_abstract():
+    with pytest.raises(TypeError):
+        Backend()
+    assert isinstance(get_backend("virtual"), Backend)
+
+
+def _waves(*levels_dbfs: float, frames: int = 1000) -> list[AudioWave]:
+    rng = np.random.default_rng(len(levels_dbfs))
+    return [
+        AudioWave(rng.integers(-(2**22), 2**22, (frames, 1)).astype(np.int32), SAMPLERATE, level_dbfs)
+        for level_dbfs in levels_dbfs
+    ]
+
+
+def test_default_routing_sends_to_the_last_output():
+    wave = _waves(LEVEL_DBFS)[0]
+    stream = SendStream(virtual_interface(num_sends=3), wave)
+    expected = wave.audio[:256]
+    block = stream.render(256)
+    np.testing.assert_array_equal(block[:, 2], expected)
+    assert not block[:, :2].any()
+    assert stream._packed_send == 2
+
+
+def test_routing_matrix_mixes_waves_to_outputs():
+    waves = _waves(0.0, -6.0, -12.0)
+    audio = [wave.audio.astype(np.float64) for wave in waves]
+    stream = SendStream(virtual_interface(num_sends=2), waves)
+    routing = [[1.0, 0.0], [0.5, 0.25], [0.0, 2.0]]
+    stream.set_routing(routing)
+    assert stream._packed_send is None
+
+    # render reuses its output buffer, so each block is copied before the next one is rendered
+    mixed = np.concatenate([stream.render(300).copy() for _ in range(4)])
+    expected = np.clip(np.rint(np.stack(audio, axis=1) @ np.array(routing)), -(2**23), 2**23 - 1)
+    np.testing.assert_array_equal(mixed[:1000], expected)
+    # waves that ran out are silent
+    assert not mixed[1000:].any()
+
+
+def test_route_sets_gains_per_output():
+    waves = _waves(LEVEL_DBFS, LEVEL_DBFS)
+    stream = SendStream(virtual_interface(num_sends=4), waves)
+    stream.route(0, [1, 3], [0.0, -6.0])
+    stream.route(1, [4])
+    np.testing.assert_allclose(stream.routing, [[1.0, 0.0, 10 ** (-6.0 / 20), 0.0], [0.0, 0.0, 0.0, 1.0]])
+    # routing a wave again replaces its outputs
+    stream.route(0, [2])
+    np.testing.assert_array_equal(stream.routing[0], [0.0, 1.0, 0.0, 0.0])
+
+
+def test_mixed_outputs_are_clipped():
+    waves = _waves(0.0, 0.0)
+    waves[0].audio[:] = 2**23 - 1000
+    waves[1].audio[:] = 2**23 - 1000
+    stream = SendStream(virtual_interface(num_sends=1), waves)
+    stream.set_routing([[1.0], [1.0]])
+    assert (stream.render(128) == 2**23 - 1).all()
+
+
+@pytest.mark.parametrize(
+    "wave, outputs, gains_db",
+    [(0, [0], None), (0, [3], None), (0, [1, 2], [0.0])],
+)
+def test_route_rejects_bad_outputs(wave, outputs, gains_db):
+    stream = SendStream(virtual_interface(num_sends=2), _waves(LEVEL_DBFS))
+    with pytest.raises(ValueError):
+        stream.route(wave, outputs, gains_db)
+
+
+def test_set_routing_checks_the_shape():
+    stream = SendStream(virtual_interface(num_sends=2), _waves(LEVEL_DBFS, LEVEL_DBFS))
+    with pytest.raises(ValueError, match="shape"):
+        stream.set_routing([[1.0, 0.0]])
+
+
+# both outputs loop back into every return, so the returns hold the sum of the sends
+def test_capture_to_several_sends(send_audio):
+    interface = virtual_interface(latency=128, num_sends=2)
+    stream = _record(CaptureStream(interface, send_audio, SAMPLERATE, LEVEL_DBFS, sends=[1, 2]))
+    sent = AudioWave(send_audio, SAMPLERATE, LEVEL_DBFS).audio
+    np.testing.assert_array_equal(stream.return_audio[128 : 128 + len(send_audio), 0], 2 * sent)
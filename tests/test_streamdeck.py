@@ -0,0 +1,114 @@
+import pytest
+
+# the device class needs hidapi, the decoders themselves don't talk to a device
+pytest.importorskip("hid")
+
+from streamdeck_ui.streamdeck import (  # noqa: E402
+    COLS,
+    INPUT_HEADER,
+    KEY_INPUT_COMMAND,
+    OUTPUT_HEADER,
+    OUTPUT_PAYLOAD_LENGTH,
+    OUTPUT_REPORT_LENGTH,
+    ROWS,
+    KeyEvent,
+    build_output_reports,
+    decode_firmware_version,
+    decode_input,
+    decode_serial_number,
+    decode_sleep_idle,
+    decode_unit_info,
+    diff_key_state,
+)
+
+
+def _key_state(pressed: list[int]) -> int:
+    return int.from_bytes(bytes(1 if key in pressed else 0 for key in range(ROWS * COLS)), byteorder="little")
+
+
+def test_decode_captured_key_report():
+    # key 0 and key 7 held down, followed by the padding hidapi reads past the report
+    keys = bytes([1, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0])
+    response = b"\x01\x00" + len(keys).to_bytes(2, "little") + keys + bytes(8)
+    report = decode_input(response)
+    assert report.report_id == b"\x01"
+    assert report.command == KEY_INPUT_COMMAND
+    assert report.data_length == ROWS * COLS
+    assert report.data == keys
+    assert int.from_bytes(report.data, byteorder="little") == _key_state([0, 7])
+
+
+def test_decode_input_with_a_short_payload():
+    response = b"\x01\x00" + (2).to_bytes(2, "little") + b"\x01\x00" + bytes(ROWS * COLS)
+    report = decode_input(response)
+    assert report.data == b"\x01\x00"
+    assert len(response) > INPUT_HEADER.size + report.data_length
+
+
+def test_decode_feature_reports():
+    firmware = decode_firmware_version(b"\x05\x0c" + b"\xaa\xbb\xcc\xdd" + b"1.01.000")
+    assert firmware == (b"\x05", 12, b"\xaa\xbb\xcc\xdd", "1.01.000")
+
+    serial = decode_serial_number(b"\x06\x0c" + b"A00WA5122ABCDE")
+    assert serial.serial_number == "A00WA5122ABCDE"
+    assert serial.data_length == 12
+
+    assert decode_sleep_idle(b"\x0a\x04\x3c").sleep_idle == 60
+
+    info = decode_unit_info(
+        b"\x08\x03\x05"
+        + (72).to_bytes(2, "little")
+        + (72).to_bytes(2, "little")
+        + (800).to_bytes(2, "little")
+        + (100).to_bytes(2, "little")
+        + bytes([24, 1, 15, 1, 0])
+        + b"\x00"
+        + bytes(14)
+    )
+    assert (info.matrix_rows, info.matrix_cols) == (3, 5)
+    assert (info.key_width, info.key_height, info.lcd_width, info.lcd_height) == (72, 72, 800, 100)
+    assert (info.image_bpp, info.image_color_scheme, info.num_key_images) == (24, 1, 15)
+
+
+def test_diff_key_state_reports_only_changed_keys():
+    previous = _key_state([0, 3, 14])
+    current = _key_state([3, 6, 14])
+    assert diff_key_state(previous, current, 1.5) == [
+        KeyEvent(0, 0, 0, False, 1.5),
+        KeyEvent(6, 1, 1, True, 1.5),
+    ]
+    assert diff_key_state(current, current, 2.0) == []
+
+
+def test_diff_key_state_ignores_pressure_changes_within_a_key():
+    # any non zero byte is a pressed key, the value changing isn't an event
+    previous = 0x01 << (8 * 4)
+    assert diff_key_state(previous, 0x02 << (8 * 4), 0.0) == [KeyEvent(4, 0, 4, True, 0.0)]
+
+
+def test_diff_key_state_every_key():
+    all_pressed = _key_state(list(range(ROWS * COLS)))
+    events = diff_key_state(0, all_pressed, 0.0)
+    assert [event.key for event in events] == list(range(ROWS * COLS))
+    assert [(event.row, event.col) for event in events] == [(row, col) for row in range(ROWS) for col in range(COLS)]
+    assert all(event.pressed for event in events)
+    assert not any(event.pressed for event in diff_key_state(all_pressed, 0, 0.0))
+
+
+@pytest.mark.parametrize("length", [0, 1, OUTPUT_PAYLOAD_LENGTH, OUTPUT_PAYLOAD_LENGTH + 1, 3 * OUTPUT_PAYLOAD_LENGTH])
+def test_build_output_reports(length):
+    payload = bytes(range(256)) * (length // 256) + bytes(range(length % 256))
+    reports = build_output_reports(0x02, 0x07, payload, 4)
+    num_reports = max(-(-length // OUTPUT_PAYLOAD_LENGTH), 1)
+    assert len(reports) == num_reports * OUTPUT_REPORT_LENGTH
+
+    chunks = []
+    for page in range(num_reports):
+        report = reports[page * OUTPUT_REPORT_LENGTH : (page + 1) * OUTPUT_REPORT_LENGTH]
+        report_id, command, index, is_last, chunk_length, packet = OUTPUT_HEADER.unpack_from(report)
+        assert (report_id, command, index, packet) == (0x02, 0x07, 4, page)
+        assert is_last == (page == num_reports - 1)
+        chunks.append(report[OUTPUT_HEADER.size : OUTPUT_HEADER.size + chunk_length])
+        # reports are zero padded
+        assert not any(report[OUTPUT_HEADER.size + chunk_length :])
+    assert b"".join(chunks) == payload
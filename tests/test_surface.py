@@ -0,0 +1,131 @@
+from collections import namedtuple
+import threading
+from time import monotonic, sleep
+
+import pytest
+
+pytest.importorskip("hid")
+
+from streamdeck_ui.streamdeck import KeyEvent  # noqa: E402
+from streamdeck_ui.surface import ControlSurface, KeyUpdateQueue  # noqa: E402
+
+
+Info = namedtuple("Info", ["key_width", "key_height"])
+
+
+# records the batches a queue sends instead of writing them to a device
+class FakeDeck:
+    def __init__(self, fail: bool = False):
+        self.unit_info = Info(72, 72)
+        self.batches = []
+        self.times = []
+        self.handlers = []
+        self.fail = fail
+        self.sent = threading.Event()
+
+    def set_key_images(self, images: dict) -> int:
+        self.times.append(monotonic())
+        self.batches.append(images)
+        self.sent.set()
+        if self.fail:
+            raise OSError("device unplugged")
+        return len(images)
+
+    def add_handler(self, handler, key=None) -> None:
+        self.handlers.append(handler)
+
+    def start_reader(self) -> None:
+        pass
+
+    def stop_reader(self) -> None:
+        pass
+
+
+def test_updates_are_coalesced_per_key():
+    deck = FakeDeck()
+    updates = KeyUpdateQueue(deck, fps=10)
+    rendered = []
+
+    def render(key, value):
+        def run():
+            rendered.append((key, value))
+            return value
+
+        return run
+
+    for value in range(5):
+        updates.update(0, render(0, value))
+    updates.update(1, render(1, 0))
+    updates.start()
+    assert deck.sent.wait(timeout=5)
+    updates.stop()
+
+    # only the latest render function for each key runs, all changed keys go out in one batch
+    assert deck.batches == [{0: 4, 1: 0}]
+    assert sorted(rendered) == [(0, 4), (1, 0)]
+
+
+def test_batches_are_rate_limited():
+    fps = 20
+    deck = FakeDeck()
+    updates = KeyUpdateQueue(deck, fps=fps)
+    updates.start()
+    start = monotonic()
+    frame = 0
+    while monotonic() - start < 0.5:
+        updates.update(frame % 3, lambda frame=frame: frame)
+        frame += 1
+        sleep(0.001)
+    updates.stop()
+
+    assert len(deck.batches) >= 2
+    assert len(deck.batches) <= 0.5 * fps + 2
+    # the last batch is the final flush on stop, which doesn't wait out the interval
+    gaps = [b - a for a, b in zip(deck.times[:-2], deck.times[1:-1])]
+    assert all(gap >= 0.9 / fps for gap in gaps)
+    # the latest update still goes out
+    assert deck.batches[-1][(frame - 1) % 3] == frame - 1
+
+
+def test_stop_flushes_pending_updates():
+    deck = FakeDeck()
+    updates = KeyUpdateQueue(deck, fps=1)
+    updates.start()
+    updates.update(2, lambda: "first")
+    assert deck.sent.wait(timeout=5)
+    # still inside the interval, so this one is only sent by the final flush
+    updates.update(2, lambda: "second")
+    updates.stop()
+    assert deck.batches == [{2: "first"}, {2: "second"}]
+
+
+def test_failed_updates_dont_stop_the_queue(capsys):
+    deck = FakeDeck(fail=True)
+    updates = KeyUpdateQueue(deck, fps=100)
+    updates.start()
+    updates.update(0, lambda: 0)
+    assert deck.sent.wait(timeout=5)
+    deck.sent.clear()
+    updates.update(0, lambda: 1)
+    assert deck.sent.wait(timeout=5)
+    assert updates.is_alive()
+    updates.stop()
+    assert "device unplugged" in capsys.readouterr().err
+
+
+def test_surface_maps_presses_to_commands():
+    deck = FakeDeck()
+    with ControlSurface(deck, {0: "retake", 4: "skip"}, fps=100) as surface:
+        handler = deck.handlers[0]
+        handler(KeyEvent(0, 0, 0, True, 0.0))
+        handler(KeyEvent(0, 0, 0, False, 0.1))
+        handler(KeyEvent(3, 0, 3, True, 0.2))
+        handler(KeyEvent(4, 0, 4, True, 0.3))
+        assert surface.next_command(0) == "retake"
+        assert surface.next_command(0) == "skip"
+        assert surface.next_command(0) is None
+
+        # key images are rendered at the deck's key size
+        surface.show(1, lambda width, height: (width, height))
+        assert deck.sent.wait(timeout=5)
+    assert deck.batches[-1] == {1: (72, 72)}
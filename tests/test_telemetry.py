@@ -0,0 +1,110 @@
+from types import SimpleNamespace
+
+import pytest
+
+from core.telemetry import StreamTelemetry
+
+
+BLOCKSIZE = 256
+
+
+def _status(input_overflow=False, input_underflow=False, output_overflow=False, output_underflow=False):
+    flags = SimpleNamespace(
+        input_overflow=input_overflow,
+        input_underflow=input_underflow,
+        output_overflow=output_overflow,
+        output_underflow=output_underflow,
+    )
+    # sounddevice's CallbackFlags are falsy without any flag set
+    return flags if any(vars(flags).values()) else None
+
+
+def _record(telemetry: StreamTelemetry, status=None) -> None:
+    telemetry.record(telemetry.start(), BLOCKSIZE, status)
+
+
+def test_counts_callbacks_and_frames():
+    telemetry = StreamTelemetry(48000, BLOCKSIZE)
+    for _ in range(10):
+        _record(telemetry)
+    summary = telemetry.summary()
+    assert summary["callbacks"] == 10
+    assert summary["frames"] == 10 * BLOCKSIZE
+    assert telemetry.histogram.sum() == 10
+    assert summary["input_xruns"] == summary["output_xruns"] == 0
+    assert summary["xrun_frames"] == []
+    assert summary["mean_cpu_load"] is None
+
+
+def test_xruns_are_recorded_at_the_frame_they_happened():
+    telemetry = StreamTelemetry(48000, BLOCKSIZE)
+    _record(telemetry)
+    _record(telemetry, _status(input_overflow=True))
+    _record(telemetry)
+    _record(telemetry, _status(output_underflow=True))
+    assert telemetry.input_xruns == 1
+    assert telemetry.output_xruns == 1
+    assert telemetry.get_xruns() == [
+        (BLOCKSIZE, StreamTelemetry.INPUT_XRUN),
+        (3 * BLOCKSIZE, StreamTelemetry.OUTPUT_XRUN),
+    ]
+
+
+# an input and output xrun in the same callback is one event that counts towards both types
+def test_dual_xrun_is_one_event():
+    telemetry = StreamTelemetry(48000, BLOCKSIZE)
+    both = StreamTelemetry.INPUT_XRUN | StreamTelemetry.OUTPUT_XRUN
+    _record(telemetry, _status(input_overflow=True, output_underflow=True))
+    _record(telemetry, _status(input_underflow=True, output_overflow=True))
+    _record(telemetry, _status(input_overflow=True))
+    assert telemetry.input_xruns == 3
+    assert telemetry.output_xruns == 2
+    assert telemetry.xruns == 5
+    assert telemetry.num_xrun_events == 3
+    assert telemetry.get_xruns() == [(0, both), (BLOCKSIZE, both), (2 * BLOCKSIZE, StreamTelemetry.INPUT_XRUN)]
+    assert telemetry.summary()["xrun_frames"] == [0, BLOCKSIZE, 2 * BLOCKSIZE]
+
+
+def test_status_without_xrun_flags_isnt_an_xrun():
+    telemetry = StreamTelemetry(48000, BLOCKSIZE)
+    priming = SimpleNamespace(
+        input_overflow=False, input_underflow=False, output_overflow=False, output_underflow=False, priming_output=True
+    )
+    _record(telemetry, priming)
+    assert telemetry.xruns == 0
+    assert telemetry.get_xruns() == []
+
+
+def test_xrun_list_is_capped():
+    telemetry = StreamTelemetry(48000, BLOCKSIZE)
+    for _ in range(StreamTelemetry.MAX_XRUNS + 10):
+        _record(telemetry, _status(input_overflow=True, output_underflow=True))
+    assert telemetry.input_xruns == telemetry.output_xruns == StreamTelemetry.MAX_XRUNS + 10
+    xruns = telemetry.get_xruns()
+    assert len(xruns) == StreamTelemetry.MAX_XRUNS
+    both = StreamTelemetry.INPUT_XRUN | StreamTelemetry.OUTPUT_XRUN
+    assert xruns[-1] == ((StreamTelemetry.MAX_XRUNS - 1) * BLOCKSIZE, both)
+
+
+def test_reset():
+    telemetry = StreamTelemetry(48000, BLOCKSIZE)
+    _record(telemetry, _status(output_underflow=True))
+    telemetry.sample_cpu_load(0.5)
+    telemetry.reset()
+    assert telemetry.callbacks == telemetry.frames == telemetry.xruns == 0
+    assert telemetry.get_xruns() == []
+    assert telemetry.histogram.sum() == 0
+    assert telemetry.summary()["max_cpu_load"] is None
+
+
+def test_cpu_load_and_percentiles():
+    telemetry = StreamTelemetry(48000, BLOCKSIZE)
+    telemetry.sample_cpu_load(0.2)
+    telemetry.sample_cpu_load(0.4)
+    # callbacks that overran the histogram range land in the last bin
+    telemetry.record(telemetry.start() - 10 * telemetry.block_duration, BLOCKSIZE, None)
+    summary = telemetry.summary()
+    assert summary["mean_cpu_load"] == pytest.approx(0.3)
+    assert summary["max_cpu_load"] == 0.4
+    assert telemetry.histogram[-1] == 1
+    assert telemetry.get_duration_percentile(99) > StreamTelemetry.HISTOGRAM_RANGE * telemetry.block_duration
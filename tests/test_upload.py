@@ -0,0 +1,140 @@
+from pathlib import Path
+
+import pytest
+
+from capture import upload
+from capture.upload import MAX_ATTEMPTS, UploadQueue, UploadStatus, _retryable, _upload_file
+from forge_cli.api import ForgeApi, RateLimiter
+
+
+NOW = 1000.0
+
+
+def _status_error(status_code: int) -> ForgeApi.StatusException:
+    return ForgeApi.StatusException("PUT", "http://forge/files/1", status_code, "")
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch) -> UploadQueue:
+    monkeypatch.setattr(upload.time, "time", lambda: NOW)
+    queue = UploadQueue(tmp_path)
+    for name in ["a", "b"]:
+        queue.entries[name] = {
+            "capture_dir": str(tmp_path),
+            "capture_id": 1,
+            "path": str(Path(tmp_path, name + ".wav")),
+            "hash": name,
+            "file_id": None,
+            "status": UploadStatus.PENDING.value,
+            "attempts": 0,
+            "next_attempt": 0.0,
+        }
+    return queue
+
+
+@pytest.mark.parametrize(
+    "error, retryable",
+    [
+        (_status_error(500), True),
+        (_status_error(503), True),
+        (_status_error(429), True),
+        (_status_error(400), False),
+        (_status_error(404), False),
+        (ConnectionResetError(), True),
+        (TimeoutError(), True),
+        (FileNotFoundError(), False),
+        (PermissionError(), False),
+        (ValueError(), False),
+    ],
+)
+def test_retryable(error, retryable):
+    assert _retryable(error) == retryable
+
+
+def test_requests_errors_are_retryable():
+    requests = pytest.importorskip("requests")
+    assert _retryable(requests.ConnectionError())
+    assert _retryable(requests.Timeout())
+
+
+def test_backoff_doubles_up_to_the_limit(queue, monkeypatch):
+    monkeypatch.setattr(upload.random, "uniform", lambda low, high: high)
+    monkeypatch.setattr(upload, "MAX_BACKOFF_SECONDS", 20.0)
+    delays = []
+    for _ in range(MAX_ATTEMPTS - 1):
+        queue.fail("a", "7", _status_error(503))
+        delays.append(queue.entries["a"]["next_attempt"] - NOW)
+    assert delays == [2.0, 4.0, 8.0, 16.0, 20.0, 20.0, 20.0]
+    assert queue.entries["a"]["status"] == UploadStatus.PENDING.value
+    # the file resource is kept for the next attempt
+    assert queue.entries["a"]["file_id"] == "7"
+
+    queue.fail("a", "7", _status_error(503))
+    assert queue.entries["a"]["status"] == UploadStatus.FAILED.value
+    assert queue.entries["a"]["attempts"] == MAX_ATTEMPTS
+
+
+def test_backoff_is_jittered(queue, monkeypatch):
+    monkeypatch.setattr(upload.random, "uniform", lambda low, high: low)
+    queue.fail("a", None, ConnectionResetError())
+    queue.fail("a", None, ConnectionResetError())
+    assert queue.entries["a"]["next_attempt"] == NOW + 0.5 * 4.0
+
+
+def test_fatal_errors_fail_at_once(queue):
+    queue.fail("a", None, _status_error(400))
+    assert queue.entries["a"]["status"] == UploadStatus.FAILED.value
+    assert queue.entries["a"]["attempts"] == 1
+    assert "400" in queue.entries["a"]["error"]
+    assert queue.pending() == 1
+
+
+def test_due_skips_waiting_and_running_entries(queue):
+    queue.fail("a", None, TimeoutError())
+    assert queue.due(NOW, set(), 2) == ["b"]
+    assert queue.due(NOW, {"b"}, 2) == []
+    assert queue.due(NOW + upload.BACKOFF_SECONDS, set(), 2) == ["b", "a"]
+    assert queue.due(NOW + upload.BACKOFF_SECONDS, set(), 1) == ["b"]
+
+
+def test_queue_is_persisted(queue, tmp_path):
+    queue.fail("a", "3", _status_error(404))
+    queue.complete("b", "4")
+    reloaded = UploadQueue(tmp_path)
+    assert reloaded.entries == queue.entries
+
+    reloaded.retry_failed()
+    entry = UploadQueue(tmp_path).entries["a"]
+    assert (entry["status"], entry["attempts"], entry["next_attempt"], entry["file_id"]) == ("pending", 0, 0.0, "3")
+    assert UploadQueue(tmp_path).entries["b"]["status"] == UploadStatus.DONE.value
+
+
+# records the calls an upload makes instead of sending them
+class FakeApi:
+    def __init__(self, error: Exception | None = None):
+        self.calls = []
+        self.error = error
+
+    def create(self, resource_type, config):
+        self.calls.append(("create", config["name"]))
+        return {"id": 9}
+
+    def update(self, resource_type, resource_id, config):
+        self.calls.append(("update", resource_id))
+
+    def upload(self, resource_type, resource_id, path, limiter=None):
+        self.calls.append(("upload", resource_id))
+        if self.error is not None:
+            raise self.error
+
+
+def test_retries_reuse_the_file_resource(queue):
+    api = FakeApi(_status_error(502))
+    entry = queue.entries["a"]
+    file_id, error = _upload_file(api, entry, RateLimiter(None))
+    assert (file_id, error.status_code) == ("9", 502)
+    queue.fail("a", file_id, error)
+
+    api.error = None
+    assert _upload_file(api, queue.entries["a"], RateLimiter(None)) == ("9", None)
+    assert api.calls == [("create", "a.wav"), ("upload", "9"), ("update", "9"), ("upload", "9")]
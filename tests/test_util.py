@@ -0,0 +1,83 @@
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from core import util
+from core.util import hash, hash_all, read_config, write_config_atomic
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    Path(tmp_path, "project", ".forge", "captures").mkdir(parents=True)
+    # the cache is found from the hashed files, not the working directory
+    Path(tmp_path, "elsewhere").mkdir()
+    monkeypatch.chdir(tmp_path / "elsewhere")
+    return tmp_path / "project"
+
+
+def _files(project: Path, count: int) -> list[Path]:
+    paths = []
+    for i in range(count):
+        path = Path(project, ".forge", "captures", f"{i}.wav")
+        path.write_bytes(bytes([i]) * 1000)
+        paths.append(path)
+    return paths
+
+
+def _cache(project: Path) -> dict:
+    return read_config(Path(project, ".forge", "hashes.json"))
+
+
+def test_hash_matches_sha256(project):
+    path = _files(project, 1)[0]
+    assert hash(path) == hashlib.sha256(path.read_bytes()).hexdigest()
+    assert hash(path, use_cache=False) == hash(path)
+    assert list(_cache(project)) == [str(path.resolve())]
+    assert not Path("hashes.json").exists() and not Path(".forge").exists()
+
+
+def test_changed_file_is_rehashed(project):
+    path = _files(project, 1)[0]
+    first = hash(path)
+    path.write_bytes(b"changed")
+    assert hash(path) != first
+
+
+def test_hits_dont_parse_the_cache_again(project, monkeypatch):
+    paths = _files(project, 3)
+    for path in paths:
+        hash(path)
+    reads = []
+    monkeypatch.setattr(util, "read_config", lambda path: reads.append(path) or read_config(path))
+    for path in paths:
+        hash(path)
+    assert reads == []
+
+
+# a single miss only adds its own entry, deleted files are dropped by bulk indexing
+def test_prune_only_when_indexing(project):
+    paths = _files(project, 3)
+    hash_all(paths, max_workers=1)
+    paths[0].unlink()
+    new = Path(project, ".forge", "captures", "new.wav")
+    new.write_bytes(b"new")
+    hash(new)
+    assert str(paths[0].resolve()) in _cache(project)
+    hash_all(paths[1:], max_workers=1)
+    assert sorted(_cache(project)) == sorted(str(path.resolve()) for path in paths[1:] + [new])
+
+
+def test_concurrent_writers_keep_each_others_entries(project):
+    paths = _files(project, 24)
+    with ProcessPoolExecutor(max_workers=6) as executor:
+        list(executor.map(hash, paths))
+    assert len(_cache(project)) == 24
+
+
+def test_write_config_atomic_leaves_no_temp_files(tmp_path):
+    write_config_atomic(tmp_path, {"a": 1}, "state")
+    write_config_atomic(tmp_path, {"a": 2}, "state")
+    assert read_config(tmp_path / "state.json") == {"a": 2}
+    assert [path.name for path in tmp_path.iterdir()] == ["state.json"]
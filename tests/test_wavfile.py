@@ -0,0 +1,144 @@
+import struct
+
+import numpy as np
+import pytest
+
+from core import wavfile
+from core.wavfile import WavReader, WavWriter, decode_pcm, encode_pcm, read_wav, write_wav
+
+
+# little endian bytes to signed ints one sample at a time
+def _reference_decode(raw: np.ndarray) -> np.ndarray:
+    frames, channels, sampwidth = raw.shape
+    samples = np.zeros((frames, channels), dtype=np.int32)
+    for frame in range(frames):
+        for channel in range(channels):
+            samples[frame, channel] = int.from_bytes(raw[frame, channel].tobytes(), "little", signed=True)
+    return samples
+
+
+def _raw24(frames: int, channels: int) -> np.ndarray:
+    raw = np.random.default_rng(frames).integers(0, 256, (frames, channels, 3)).astype(np.uint8)
+    if frames > 0:
+        # the extremes, and the sign bit in the last sample that the overlapping read can't reach
+        raw[0, 0] = [0x00, 0x00, 0x80]
+        raw[-1, -1] = [0xFF, 0xFF, 0x7F] if frames > 1 else [0xFF, 0xFF, 0xFF]
+    return raw
+
+
+@pytest.mark.parametrize("frames, channels", [(1, 1), (1, 2), (2, 1), (1000, 2), (333, 7)])
+def test_decode_24_bit_overlapping_stride(frames, channels):
+    raw = _raw24(frames, channels)
+    assert raw.flags.c_contiguous
+    np.testing.assert_array_equal(decode_pcm(raw, 3), _reference_decode(raw))
+
+
+def test_decode_24_bit_non_contiguous():
+    raw = _raw24(500, 4)
+    view = raw[::2, 1:3]
+    assert not view.flags.c_contiguous
+    np.testing.assert_array_equal(decode_pcm(view, 3), _reference_decode(np.ascontiguousarray(view)))
+
+
+def test_decode_24_bit_into_buffer():
+    raw = _raw24(256, 2)
+    out = np.full((256, 2), 12345, dtype=np.int32)
+    assert decode_pcm(raw, 3, out=out) is out
+    np.testing.assert_array_equal(out, _reference_decode(raw))
+
+
+def test_decode_empty():
+    assert decode_pcm(np.zeros((0, 2, 3), dtype=np.uint8), 3).shape == (0, 2)
+
+
+@pytest.mark.parametrize("sampwidth", [1, 2, 3, 4])
+def test_encode_decode_round_trip(sampwidth):
+    low, high = -(2 ** (8 * sampwidth - 1)), 2 ** (8 * sampwidth - 1) - 1
+    data = np.random.default_rng(sampwidth).integers(low, high, (100, 3), endpoint=True).astype(np.int32)
+    data[0] = [low, high, 0]
+    raw = np.frombuffer(encode_pcm(data, sampwidth), dtype=np.uint8).reshape((100, 3, sampwidth))
+    np.testing.assert_array_equal(decode_pcm(raw, sampwidth), data)
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+@pytest.mark.parametrize("sampwidth", [1, 2, 3, 4])
+def test_wav_round_trip(tmp_path, sampwidth, mmap):
+    low, high = -(2 ** (8 * sampwidth - 1)), 2 ** (8 * sampwidth - 1) - 1
+    data = np.random.default_rng(sampwidth).integers(low, high, (1001, 3), endpoint=True).astype(np.int32)
+    write_wav(tmp_path / "a.wav", data, 96000, sampwidth)
+    samples, samplerate = read_wav(tmp_path / "a.wav", mmap=mmap)
+    assert samplerate == 96000
+    np.testing.assert_array_equal(samples, data)
+    reader = WavReader(tmp_path / "a.wav", mmap=mmap)
+    np.testing.assert_array_equal(reader[::-3, 1], data[::-3, 1])
+    # data chunks are padded to an even length
+    assert (tmp_path / "a.wav").stat().st_size % 2 == 0
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_numpy_integers_index_like_ints(tmp_path, mmap):
+    data = np.random.default_rng(0).integers(-(2**23), 2**23, (100, 3)).astype(np.int32)
+    write_wav(tmp_path / "a.wav", data, 48000)
+    reader = WavReader(tmp_path / "a.wav", mmap=mmap)
+    for row, column in [(5, 2), (-1, 0)]:
+        np.testing.assert_array_equal(reader[np.int64(row)], data[row])
+        assert reader[np.int64(row), np.int32(column)] == data[row, column]
+        np.testing.assert_array_equal(reader[10:20, np.int64(column)], data[10:20, column])
+    with pytest.raises(IndexError):
+        reader[np.int64(100)]
+    with pytest.raises(TypeError):
+        reader[1.5]
+
+
+def test_flushed_writer_is_readable(tmp_path):
+    data = np.arange(3000, dtype=np.int32).reshape((1000, 3))
+    with WavWriter(tmp_path / "partial.wav", 48000, 3) as writer:
+        writer.write(data[:600])
+        writer.flush(sync=True)
+        # a take cut short after a checkpoint reads back up to the checkpoint
+        np.testing.assert_array_equal(read_wav(tmp_path / "partial.wav")[0], data[:600])
+        writer.write(data[600:])
+    np.testing.assert_array_equal(read_wav(tmp_path / "partial.wav")[0], data)
+
+
+@pytest.mark.parametrize("content", [b"", b"RIFF", b"RIFF\x00\x00\x00\x00WAVE", b"RIFF\x00\x00\x00\x00WAVEfmt "])
+def test_truncated_header_is_not_a_wav_file(tmp_path, content):
+    (tmp_path / "truncated.wav").write_bytes(content)
+    with pytest.raises(ValueError):
+        WavReader(tmp_path / "truncated.wav")
+
+
+def test_riff_header_reserves_ds64_space(tmp_path):
+    write_wav(tmp_path / "small.wav", np.zeros((10, 2), dtype=np.int32), 48000)
+    header = (tmp_path / "small.wav").read_bytes()[: WavWriter.HEADER_SIZE]
+    riff, riff_size, wave = struct.unpack_from("<4sI4s", header)
+    junk, junk_size = struct.unpack_from("<4sI", header, 12)
+    assert (riff, wave, junk, junk_size) == (b"RIFF", b"WAVE", b"JUNK", WavWriter.DS64_SIZE)
+    assert riff_size == WavWriter.HEADER_SIZE - 8 + 10 * 2 * 3
+    assert struct.unpack_from("<4sI", header, WavWriter.HEADER_SIZE - 8) == (b"data", 60)
+
+
+# the 4 GB limit is lowered so the switch to RF64 can be tested with a small file
+@pytest.mark.parametrize("flush", [True, False])
+def test_rf64_header_patching(tmp_path, monkeypatch, flush):
+    monkeypatch.setattr(wavfile, "MAX_RIFF_SIZE", 1000)
+    data = np.random.default_rng(0).integers(-(2**23), 2**23, (400, 2)).astype(np.int32)
+    path = tmp_path / "large.wav"
+    with WavWriter(path, 48000, 2) as writer:
+        writer.write(data[:100])
+        writer.flush()
+        assert path.read_bytes()[:4] == b"RIFF"
+        writer.write(data[100:])
+        if flush:
+            writer.flush()
+
+    data_size = 400 * 2 * 3
+    header = path.read_bytes()[: WavWriter.HEADER_SIZE]
+    assert struct.unpack_from("<4sI4s", header) == (b"RF64", 1000, b"WAVE")
+    ds64 = struct.unpack_from("<4sIQQQI", header, 12)
+    assert ds64 == (b"ds64", WavWriter.DS64_SIZE, WavWriter.HEADER_SIZE - 8 + data_size, data_size, 400, 0)
+    assert struct.unpack_from("<4sI", header, WavWriter.HEADER_SIZE - 8) == (b"data", 1000)
+
+    reader = WavReader(path)
+    assert len(reader) == 400
+    np.testing.assert_array_equal(reader[:], data)